@@ -0,0 +1,246 @@
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from . import database, models
+from .config import ATTACHMENT_GC_BATCH_SIZE, ATTACHMENT_GC_GRACE_HOURS, ATTACHMENT_GC_INTERVAL
+from .storage import StorageBackend, StoredObject
+
+# Garbage collection of uploads no note links to any more.
+#
+# Deleting or editing a note (or DELETE /api/reset) leaves its images in
+# storage. This job streams every note's content, collects the upload
+# directories it references, then walks the storage listing under uploads/
+# and deletes what is unreferenced and older than the grace period.
+#
+# The unit is an upload directory, uploads/{user_id}/{dir}/: the original
+# plus its WebP variants (dir is the SHA-256, or a uuid for older uploads).
+# A directory is kept if any note links to it, whoever owns the note, via
+# its storage URL or GET /img/{user_id}/{sha256}.
+#
+# The grace period covers notes not synced yet (offline clients) and undo;
+# dedup hits refresh it through blobs.last_used_at. Blob rows are deleted
+# and committed before their objects, so a failed storage delete only leaves
+# objects that the next run finds again.
+
+UPLOAD_PREFIX = "uploads/"
+NOTE_BATCH_SIZE = 500
+
+_REFERENCE = re.compile(r"(?:\buploads|/img)/([^/\s\"'()<>?#]+)/([^/\s\"'()<>?#]+)")
+
+
+def upload_dir(path: str) -> Optional[str]:
+    """uploads/{user_id}/{dir} for an object path; None for anything else."""
+    parts = path.split("/")
+    if len(parts) < 4 or parts[0] != "uploads":
+        return None
+    return "/".join(parts[:3])
+
+
+def referenced_dirs(db: Session, user_id: Optional[str] = None) -> Dict[str, Set[str]]:
+    """{owner user_id: {upload dirs}} linked from any note, streamed in batches."""
+    query = db.query(models.Note.content)
+    if user_id is not None:
+        query = query.filter(
+            or_(
+                models.Note.content.like(f"%uploads/{user_id}/%"),
+                models.Note.content.like(f"%/img/{user_id}/%"),
+            )
+        )
+    else:
+        query = query.filter(
+            or_(models.Note.content.like("%uploads/%"), models.Note.content.like("%/img/%"))
+        )
+    refs: Dict[str, Set[str]] = {}
+    for (content,) in query.yield_per(NOTE_BATCH_SIZE):
+        for owner, name in _REFERENCE.findall(content or ""):
+            refs.setdefault(owner, set()).add(f"uploads/{owner}/{name}")
+    return refs
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands back naive UTC timestamps
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class _Collector:
+    def __init__(self, db: Session, backend: StorageBackend, cutoff: datetime, batch_size: int, dry_run: bool):
+        self.db = db
+        self.backend = backend
+        self.cutoff = cutoff
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.batch: List[StoredObject] = []
+        self.report = {
+            "objects_scanned": 0,
+            "referenced": 0,
+            "skipped_recent": 0,
+            "orphaned": 0,
+            "orphaned_bytes": 0,
+            "deleted": 0,
+            "deleted_bytes": 0,
+            "users": {},
+        }
+
+    def add(self, obj: StoredObject):
+        self.batch.append(obj)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        dirs = {upload_dir(obj.path) for obj in batch}
+        keep = set()
+        blob_ids = []
+        rows = (
+            self.db.query(models.Blob.id, models.Blob.path, models.Blob.last_used_at)
+            .filter(models.Blob.sha256.in_({d.rsplit("/", 1)[1] for d in dirs}))
+            .all()
+        )
+        for row in rows:
+            directory = upload_dir(row.path or "")
+            if directory not in dirs:
+                continue
+            last_used = _aware(row.last_used_at)
+            if last_used is not None and last_used >= self.cutoff:
+                keep.add(directory)
+            else:
+                blob_ids.append(row.id)
+
+        paths, size = [], 0
+        for obj in batch:
+            directory = upload_dir(obj.path)
+            if directory in keep:
+                self.report["skipped_recent"] += 1
+                continue
+            paths.append(obj.path)
+            size += obj.size
+            self.report["orphaned"] += 1
+            self.report["orphaned_bytes"] += obj.size
+            user = self.report["users"].setdefault(directory.split("/")[1], {"orphaned": 0, "orphaned_bytes": 0})
+            user["orphaned"] += 1
+            user["orphaned_bytes"] += obj.size
+        if self.dry_run or not paths:
+            return
+
+        if blob_ids:
+            self.db.query(models.Blob).filter(models.Blob.id.in_(blob_ids)).delete(synchronize_session=False)
+            self.db.commit()
+        self.backend.delete(paths)
+        self.report["deleted"] += len(paths)
+        self.report["deleted_bytes"] += size
+
+
+def collect(
+    db: Session,
+    backend: StorageBackend,
+    user_id: Optional[str] = None,
+    grace_hours: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    dry_run: bool = False,
+    now: Optional[datetime] = None,
+) -> dict:
+    """
+    Deletes unreferenced uploads older than the grace period (all users, or
+    just `user_id`) and returns a report. With dry_run nothing is deleted and
+    the report shows what would be reclaimed.
+    """
+    started = time.perf_counter()
+    grace_hours = ATTACHMENT_GC_GRACE_HOURS if grace_hours is None else grace_hours
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(hours=grace_hours)
+
+    refs = referenced_dirs(db, user_id)
+    collector = _Collector(db, backend, cutoff, batch_size or ATTACHMENT_GC_BATCH_SIZE, dry_run)
+    report = collector.report
+    prefix = f"{UPLOAD_PREFIX}{user_id}/" if user_id is not None else UPLOAD_PREFIX
+    for obj in backend.list(prefix):
+        report["objects_scanned"] += 1
+        directory = upload_dir(obj.path)
+        if directory is None:
+            continue
+        if directory in refs.get(directory.split("/")[1], ()):
+            report["referenced"] += 1
+        elif obj.modified_at >= cutoff:
+            report["skipped_recent"] += 1
+        else:
+            collector.add(obj)
+    collector.flush()
+
+    report["dry_run"] = dry_run
+    report["grace_hours"] = grace_hours
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def run(backend: Optional[StorageBackend] = None, **kwargs) -> dict:
+    """collect() with a fresh session and the configured storage backend."""
+    if backend is None:
+        from .storage import storage_service as backend
+    db = database.SessionLocal()
+    try:
+        return collect(db, backend, **kwargs)
+    finally:
+        db.close()
+
+
+def start_attachment_gc(backend: Optional[StorageBackend] = None, interval: int = None):
+    """
+    Runs run() every `interval` seconds on a daemon thread. Returns a
+    threading.Event that stops the loop when set, or None if disabled.
+    Enable it on one instance only.
+    """
+    interval = ATTACHMENT_GC_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                report = run(backend)
+                report.pop("users")
+                print(f"Attachment GC: {report}")
+            except Exception as e:
+                print(f"Attachment GC failed: {e}")
+
+    threading.Thread(target=loop, name="attachment-gc", daemon=True).start()
+    return stop
+
+
+def main(argv: Iterable[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Delete uploads that no note references any more.")
+    parser.add_argument("--dry-run", action="store_true", help="Report reclaimable objects without deleting")
+    parser.add_argument("--user", help="Only this user's uploads")
+    parser.add_argument("--grace-hours", type=float, help=f"Keep newer objects (default {ATTACHMENT_GC_GRACE_HOURS:g})")
+    parser.add_argument("--batch-size", type=int, help=f"Objects per delete (default {ATTACHMENT_GC_BATCH_SIZE})")
+    parser.add_argument("--backend", help="supabase | s3 | local (default: STORAGE_BACKEND)")
+    args = parser.parse_args(argv)
+
+    from .storage import create_backend
+
+    report = run(
+        create_backend(args.backend),
+        user_id=args.user,
+        grace_hours=args.grace_hours,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,8 +3,12 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status, Header
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 from .. import database, models, schemas
+from ..config import AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES
+from .cache import PrincipalCache
 import os
 import uuid
 import time
@@ -14,8 +18,12 @@ SECRET_KEY = "CHANGE_THIS_TO_A_SECURE_SECRET_KEY"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 7 days for convenience
 
+API_KEY_PREFIX = "shy_"
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+principal_cache = PrincipalCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
 def uuid7() -> str:
     """Generate a UUID v7 (Time-ordered)."""
     # 1. 48-bit timestamp
@@ -44,26 +52,75 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+def _snapshot(user: models.User) -> dict:
+    return {attr.key: getattr(user, attr.key) for attr in inspect(models.User).mapper.column_attrs}
+
+
+def _attach(db: Session, snapshot: dict) -> models.User:
+    # Rebuild a persistent User in this request's session without a SELECT,
+    # so handlers can still mutate current_user and commit.
+    user = models.User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def _cached_user(db: Session, token: str, kinds=("jwt", "api_key")) -> Optional[models.User]:
+    snapshot = principal_cache.get(token, kinds)
+    return _attach(db, snapshot) if snapshot is not None else None
+
+
+def _user_from_jwt(db: Session, token: str) -> Optional[models.User]:
+    """Decodes a JWT and loads its user (caching it). Raises JWTError."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        return None
+    token_data = schemas.TokenData(user_id=user_id)
+    user = db.query(models.User).filter(models.User.id == token_data.user_id).first()
+    if user is not None:
+        principal_cache.put(token, "jwt", _snapshot(user), expires_at=payload.get("exp"))
+    return user
+
+
+def _user_from_api_key(db: Session, token: str) -> Optional[models.User]:
+    user = db.query(models.User).filter(models.User.api_key == token).first()
+    if user is not None:
+        principal_cache.put(token, "api_key", _snapshot(user))
+    return user
+
+
+def _resolve_current_user(db: Session, token: str) -> models.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # JWT only: a cached API key must not satisfy this dependency
+    user = _cached_user(db, token, kinds=("jwt",))
+    if user is not None:
+        return user
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(user_id=user_id)
+        user = _user_from_jwt(db, token)
     except JWTError:
         raise credentials_exception
-        
-    user = db.query(models.User).filter(models.User.id == token_data.user_id).first()
     if user is None:
         raise credentials_exception
     return user
 
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+    return _resolve_current_user(db, token)
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    # Same lookup, run through the AsyncSession so DB IO doesn't block the loop
+    return await db.run_sync(_resolve_current_user, token)
+
+
 def get_api_key_user(
     authorization: Optional[str] = Header(None),
     db: Session = Depends(database.get_db),
@@ -83,7 +140,7 @@ def get_api_key_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = db.query(models.User).filter(models.User.api_key == token).first()
+    user = _cached_user(db, token, kinds=("api_key",)) or _user_from_api_key(db, token)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -93,10 +150,7 @@ def get_api_key_user(
     return user
 
 
-def get_any_user(
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(database.get_db),
-):
+def _resolve_any_user(db: Session, authorization: Optional[str]) -> models.User:
     if not authorization:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -112,19 +166,22 @@ def get_any_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # 1) Try JWT (regular user auth)
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id:
-            user = db.query(models.User).filter(models.User.id == user_id).first()
+    # 0) Cached principal (JWT or API key)
+    user = _cached_user(db, token)
+    if user is not None:
+        return user
+
+    # 1) Try JWT (regular user auth); API keys skip the doomed decode
+    if not token.startswith(API_KEY_PREFIX):
+        try:
+            user = _user_from_jwt(db, token)
             if user is not None:
                 return user
-    except JWTError:
-        pass
+        except JWTError:
+            pass
 
     # 2) Fallback to API key
-    user = db.query(models.User).filter(models.User.api_key == token).first()
+    user = _user_from_api_key(db, token)
     if user is not None:
         return user
 
@@ -133,3 +190,17 @@ def get_any_user(
         detail="Invalid credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def get_any_user(
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(database.get_db),
+):
+    return _resolve_any_user(db, authorization)
+
+
+async def get_any_user_async(
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    return await db.run_sync(_resolve_any_user, authorization)
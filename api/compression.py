@@ -0,0 +1,363 @@
+import io
+import re
+import zlib
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Negotiated HTTP compression (ASGI middleware).
+#
+# Responses: br / zstd / gzip chosen from Accept-Encoding, for compressible
+# content types above a size threshold. Brotli and zstd are used only when the
+# optional `brotli` / `zstandard` packages are installed; gzip is always on.
+#
+# Requests: bodies sent with Content-Encoding gzip/zstd/br are decompressed
+# on the routes listed in DECOMPRESS_ROUTES, with a total size cap unless the
+# route consumes its body as a stream. Every decompressor call is bounded
+# (DECOMPRESS_CHUNK_SIZE, or what is left under the cap), so a small bomb
+# never expands in memory before the size check sees it:
+#   gzip/deflate  zlib max_length + unconsumed_tail, streamed
+#   br            Decompressor.process(output_buffer_limit=...), streamed;
+#                 not accepted when the installed brotli lacks it
+#   zstd          the compressed body is buffered (at most the cap), then read
+#                 through stream_reader() in bounded reads; capped routes only
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# (method, path regex, total size capped) for routes that accept compressed
+# request bodies. Uncapped routes must parse their body incrementally.
+DECOMPRESS_ROUTES = (
+    ("POST", re.compile(r"^/api/restore$"), True),
+    ("POST", re.compile(r"^/api/notes$"), True),
+    ("PUT", re.compile(r"^/api/notes/[^/]+$"), True),
+    ("POST", re.compile(r"^/api/import$"), False),
+)
+
+
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+
+def available_encodings():
+    """Response encodings in server preference order."""
+    encodings = []
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate(accept_encoding: str, offered) -> str:
+    """Picks the best offered encoding for an Accept-Encoding header, or ''."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = "", 0.0
+    for encoding in offered:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int, zstd_level: int):
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=brotli_quality)
+            self._compress, self._finish = self._obj.process, self._obj.finish
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+            self._compress, self._finish = self._obj.compress, self._obj.flush
+        else:
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._compress, self._finish = self._obj.compress, self._obj.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data) if data else b""
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class _TooLarge(Exception):
+    pass
+
+
+class _ZlibDecompressor:
+    def __init__(self, wbits: int):
+        self._obj = zlib.decompressobj(wbits)
+        self._pending = b""
+
+    def feed(self, data: bytes):
+        self._pending += data
+
+    def finish(self):
+        pass
+
+    def read(self, max_length: int) -> bytes:
+        # Input beyond max_length output stays in unconsumed_tail
+        out = self._obj.decompress(self._pending, max_length)
+        self._pending = self._obj.unconsumed_tail
+        return out
+
+
+class _BrotliDecompressor:
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+        self._pending = b""
+
+    def feed(self, data: bytes):
+        self._pending += data
+
+    def finish(self):
+        pass
+
+    def read(self, max_length: int) -> bytes:
+        while True:
+            data = b""
+            # New input only once the previous input has been taken in
+            if self._pending and self._obj.can_accept_more_data():
+                data, self._pending = self._pending, b""
+            out = self._obj.process(data, output_buffer_limit=max_length)
+            if out:
+                return out
+            if not (self._pending and self._obj.can_accept_more_data()):
+                return b""
+
+
+class _ZstdDecompressor:
+    # zstandard has no incremental decompressor with an output bound, so the
+    # (capped) compressed body is collected and then read in bounded pieces
+    def __init__(self, max_input: int):
+        self._max_input = max_input
+        self._input = io.BytesIO()
+        self._reader = None
+
+    def feed(self, data: bytes):
+        if self._input.tell() + len(data) > self._max_input:
+            raise _TooLarge()
+        self._input.write(data)
+
+    def finish(self):
+        self._input.seek(0)
+        self._reader = zstandard.ZstdDecompressor().stream_reader(self._input, read_across_frames=True)
+
+    def read(self, max_length: int) -> bytes:
+        return self._reader.read(max_length) if self._reader is not None else b""
+
+
+def _decompressor(encoding: str, max_size: int = 0):
+    """
+    An incremental decompressor (`feed(data)`, `finish()` at the end of input,
+    `read(max_length)` -> at most about max_length bytes, b"" when it needs
+    more input) or None if the encoding can't be decompressed safely here.
+    max_size is the route's cap (0: uncapped).
+    """
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        return _ZlibDecompressor(16 + zlib.MAX_WBITS if encoding != "deflate" else zlib.MAX_WBITS)
+    if encoding == "br" and brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data"):
+        return _BrotliDecompressor()
+    if encoding == "zstd" and zstandard is not None and max_size:
+        return _ZstdDecompressor(max_size)
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+        max_request_size: int = 256 * 1024 * 1024,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        self.max_request_size = max_request_size
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+
+        request_encoding = headers.get("content-encoding", "").strip().lower()
+        if request_encoding and request_encoding != "identity":
+            route = self._decompress_route(scope)
+            if route is None:
+                response = PlainTextResponse("Compressed request body not supported here", status_code=415)
+                await response(scope, receive, send)
+                return
+            capped = route[2]
+            decompress = _decompressor(request_encoding, self.max_request_size if capped else 0)
+            if decompress is None:
+                response = PlainTextResponse(f"Unsupported Content-Encoding: {request_encoding}", status_code=415)
+                await response(scope, receive, send)
+                return
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")
+            ]
+            receive = self._decompressing_receive(receive, decompress, capped)
+
+        encoding = negotiate(headers.get("accept-encoding", ""), self.encodings)
+        if encoding:
+            responder = _CompressResponder(self, encoding)
+            await self.app(scope, receive, responder.wrap(send))
+        else:
+            await self.app(scope, receive, send)
+
+    def _decompress_route(self, scope: Scope):
+        method, path = scope["method"], scope["path"]
+        for route in DECOMPRESS_ROUTES:
+            if route[0] == method and route[1].match(path):
+                return route
+        return None
+
+    def _decompressing_receive(self, receive: Receive, decompressor, capped: bool = True):
+        total = 0
+        input_done = False
+
+        async def wrapped() -> Message:
+            # One bounded piece of output per call; the endpoint keeps asking
+            # while more_body is set, so nothing is expanded ahead of it
+            nonlocal total, input_done
+            while True:
+                max_length = DECOMPRESS_CHUNK_SIZE
+                if capped:
+                    max_length = min(max_length, self.max_request_size - total + 1)
+                # Raised while the endpoint reads its body, so FastAPI answers them
+                try:
+                    body = decompressor.read(max_length)
+                except Exception:
+                    raise HTTPException(status_code=400, detail="Malformed compressed request body")
+                if body:
+                    total += len(body)
+                    if capped and total > self.max_request_size:
+                        raise HTTPException(status_code=413, detail="Decompressed request body too large")
+                    return {"type": "http.request", "body": body, "more_body": True}
+                if input_done:
+                    return {"type": "http.request", "body": b"", "more_body": False}
+
+                message = await receive()
+                if message["type"] != "http.request":
+                    return message
+                try:
+                    decompressor.feed(message.get("body", b""))
+                except _TooLarge:
+                    raise HTTPException(status_code=413, detail="Decompressed request body too large")
+                if not message.get("more_body", False):
+                    input_done = True
+                    decompressor.finish()
+
+        return wrapped
+
+
+class _CompressResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.initial_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    def wrap(self, send: Send) -> Send:
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Hold headers until the first body chunk decides the encoding
+                self.initial_message = message
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                self.passthrough = (
+                    message["status"] != 200
+                    or "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if self.initial_message is not None:
+                start, self.initial_message = self.initial_message, None
+                if self.passthrough or (not more_body and len(body) < self.middleware.minimum_size):
+                    self.passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                m = self.middleware
+                self.compressor = _Compressor(self.encoding, m.gzip_level, m.brotli_quality, m.zstd_level)
+                data = self._compress(body, more_body)
+
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = self.encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(data))
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # The encoded bytes differ from the identity representation
+                    headers["ETag"] = "W/" + etag
+                await send(start)
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            if self.passthrough:
+                await send(message)
+                return
+
+            data = self._compress(body, more_body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        return send_wrapper
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.finish()
+        return data
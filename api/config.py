@@ -10,3 +10,62 @@ GOOGLE_CLIENT_ID = config.get("GOOGLE_CLIENT_ID")
 SUPABASE_URL = config.get("SUPABASE_URL")
 SUPABASE_KEY = config.get("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_BUCKET = config.get("SUPABASE_BUCKET", "images") # Default to 'images' bucket
+UPLOAD_MAX_BYTES = int(config.get("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))  # per image (api/uploads.py)
+
+# Image variants (api/images.py): WebP widths, worker processes (0 disables)
+IMAGE_VARIANT_WIDTHS = tuple(int(w) for w in config.get("IMAGE_VARIANT_WIDTHS", "320,640,1280,1920").split(",") if w.strip())
+IMAGE_WORKERS = int(config.get("IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_MAX = int(config.get("IMAGE_QUEUE_MAX", "32"))  # pending jobs before new ones are dropped
+
+# Image storage (api/storage): supabase | s3 | local; unset picks supabase
+# when configured, else local
+STORAGE_BACKEND = config.get("STORAGE_BACKEND")
+STORAGE_LOCAL_DIR = config.get("STORAGE_LOCAL_DIR", os.path.join(os.getcwd(), "data", "storage"))
+STORAGE_LOCAL_URL = config.get("STORAGE_LOCAL_URL", "/files")  # public prefix (GET /files/{path})
+S3_BUCKET = config.get("S3_BUCKET")
+S3_ENDPOINT_URL = config.get("S3_ENDPOINT_URL")  # unset: AWS
+S3_REGION = config.get("S3_REGION")
+S3_ACCESS_KEY_ID = config.get("S3_ACCESS_KEY_ID")
+S3_SECRET_ACCESS_KEY = config.get("S3_SECRET_ACCESS_KEY")
+S3_PUBLIC_URL = config.get("S3_PUBLIC_URL")  # CDN / public bucket URL; default endpoint/bucket
+S3_MAX_POOL_CONNECTIONS = int(config.get("S3_MAX_POOL_CONNECTIONS", "10"))
+
+# Orphaned upload GC (api/attachment_gc.py); interval 0 = run only from the CLI
+ATTACHMENT_GC_GRACE_HOURS = float(config.get("ATTACHMENT_GC_GRACE_HOURS", "168"))  # keep newer objects
+ATTACHMENT_GC_BATCH_SIZE = int(config.get("ATTACHMENT_GC_BATCH_SIZE", "500"))  # objects per delete call
+ATTACHMENT_GC_INTERVAL = int(config.get("ATTACHMENT_GC_INTERVAL", "0"))  # seconds
+
+# Sync
+SYNC_BATCH_MAX_OPS = int(config.get("SYNC_BATCH_MAX_OPS", "1000"))
+# Cursors / backup ids never run ahead of the database clock minus this, so a
+# writer that commits after a pull with an earlier stamp is still picked up
+SYNC_CURSOR_MARGIN_SECONDS = int(config.get("SYNC_CURSOR_MARGIN_SECONDS", "300"))
+
+# Restore / import: rows per INSERT ... ON CONFLICT statement (api/restore.py)
+RESTORE_BATCH_SIZE = int(config.get("RESTORE_BATCH_SIZE", "1000"))
+IMPORT_MAX_LINE_BYTES = int(config.get("IMPORT_MAX_LINE_BYTES", str(32 * 1024 * 1024)))  # one NDJSON record
+
+# HTTP compression (api/compression.py)
+COMPRESSION_MIN_SIZE = int(config.get("COMPRESSION_MIN_SIZE", "1024"))  # bytes
+COMPRESSION_GZIP_LEVEL = int(config.get("COMPRESSION_GZIP_LEVEL", "6"))  # 1-9
+COMPRESSION_BROTLI_QUALITY = int(config.get("COMPRESSION_BROTLI_QUALITY", "4"))  # 0-11
+COMPRESSION_ZSTD_LEVEL = int(config.get("COMPRESSION_ZSTD_LEVEL", "3"))  # 1-22
+MAX_DECOMPRESSED_REQUEST_BYTES = int(config.get("MAX_DECOMPRESSED_REQUEST_BYTES", str(256 * 1024 * 1024)))
+
+# Auth principal cache (api/auth/cache.py); TTL 0 disables it
+AUTH_CACHE_TTL_SECONDS = float(config.get("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(config.get("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+# Server-side markdown rendering (api/render.py)
+RENDER_CACHE_MAX_BYTES = int(config.get("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 0 disables
+RENDER_HIGHLIGHT_MAX_BYTES = int(config.get("RENDER_HIGHLIGHT_MAX_BYTES", str(64 * 1024)))  # code per note
+RENDER_MARKDOWN_MAX_BYTES = int(config.get("RENDER_MARKDOWN_MAX_BYTES", str(2 * 1024 * 1024)))  # larger: plain text
+
+# Public share pages (api/share.py): in-process render cache, HTTP caching
+SHARE_CACHE_MAX_BYTES = int(config.get("SHARE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 0 disables
+SHARE_CACHE_TTL_SECONDS = float(config.get("SHARE_CACHE_TTL_SECONDS", "5"))  # served without a DB check
+SHARE_CACHE_MAX_AGE = int(config.get("SHARE_CACHE_MAX_AGE", "60"))  # Cache-Control max-age
+SHARE_STALE_WHILE_REVALIDATE = int(config.get("SHARE_STALE_WHILE_REVALIDATE", "300"))
+
+# Optional bearer token required by GET /api/metrics (open when unset)
+METRICS_TOKEN = config.get("METRICS_TOKEN")
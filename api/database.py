@@ -1,6 +1,14 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from sqlalchemy.sql import functions
 import urllib.parse as urlparse
+import threading
+import time
+import uuid
 
 import os
 
@@ -9,6 +17,375 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+# --- Connection pool profiles ---
+#
+# server:     long-lived process (uvicorn/Docker). Sized QueuePool, pre-ping to
+#             drop stale connections, recycle before server/LB idle timeouts.
+# serverless: short-lived functions (Vercel) behind a transaction pooler
+#             (PgBouncer / Supabase pooler). NullPool: one connection per
+#             checkout, closed on release, so instances never hoard connections.
+# sqlite:     default for sqlite:// URLs (self-hosted Docker / local dev).
+#             WAL + tuned pragmas on every connection, periodic maintenance.
+POOL_PROFILES = ("server", "serverless", "sqlite")
+
+DB_POOL_PROFILE = os.getenv("DB_POOL_PROFILE") or ("serverless" if os.getenv("VERCEL") else "server")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# The asyncio engine has its own pool next to the sync one, so each worker
+# can hold up to (DB_POOL_SIZE + DB_MAX_OVERFLOW) + (DB_ASYNC_POOL_SIZE +
+# DB_ASYNC_MAX_OVERFLOW) server connections. It serves one event loop and only
+# the hot endpoints, so it is sized smaller.
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "2"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "3"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a checkout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))  # seconds (PostgreSQL)
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # Safe with WAL
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))  # 64 MiB page cache
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_MAINTENANCE_INTERVAL = int(os.getenv("SQLITE_MAINTENANCE_INTERVAL", "3600"))  # seconds, 0 = off
+SQLITE_VACUUM_PAGES = int(os.getenv("SQLITE_VACUUM_PAGES", "1000"))  # pages freed per run
+
+
+class PoolStats:
+    """Checkout counters collected from pool events and the instrumented pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.disconnects = 0  # connections invalidated (e.g. failed pre-ping)
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "disconnects": self.disconnects,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_avg_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            # Only a checkout timeout; connect/auth errors propagate uncounted
+            self.stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """Same wait-time instrumentation for the asyncio engine's pool."""
+
+
+def _instrument(engine):
+    pool = engine.pool
+    if not hasattr(pool, "stats"):
+        pool.stats = PoolStats()
+    stats = pool.stats
+
+    event.listen(engine, "connect", lambda *a: stats.incr("connects"))
+    event.listen(engine, "checkout", lambda *a: stats.incr("checkouts"))
+    event.listen(engine, "invalidate", lambda *a: stats.incr("disconnects"))
+    return engine
+
+
+def _sqlite_on_connect(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    # Only takes effect on a brand-new file (before the first table exists)
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL: readers never block the writer and vice versa
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    # Wait for the write lock instead of failing with "database is locked"
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+@compiles(functions.now, "sqlite")
+def _sqlite_now(element, compiler, **kw):
+    # CURRENT_TIMESTAMP is 'YYYY-MM-DD HH:MM:SS', while SQLAlchemy stores and
+    # binds datetimes as 'YYYY-MM-DD HH:MM:SS.ffffff'. Stamp now() (defaults,
+    # onupdate) in the latter form so stored timestamps compare as plain text
+    # against bound values, which lets range predicates use the indexes.
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+def run_sqlite_maintenance(db_engine=None) -> dict:
+    """PRAGMA optimize + incremental vacuum + WAL checkpoint. Returns a report."""
+    db_engine = db_engine or engine
+    report = {}
+    with db_engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+        auto_vacuum = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        report["freelist_pages_before"] = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if auto_vacuum == 2:  # INCREMENTAL
+            conn.exec_driver_sql(f"PRAGMA incremental_vacuum({SQLITE_VACUUM_PAGES})")
+        report["freelist_pages_after"] = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        report["auto_vacuum"] = auto_vacuum
+        report["wal_checkpoint"] = list(conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").first() or ())
+        conn.commit()
+    return report
+
+
+def start_sqlite_maintenance(db_engine=None, interval: int = None):
+    """
+    Runs run_sqlite_maintenance() every `interval` seconds on a daemon thread.
+    Returns a threading.Event that stops the loop when set, or None if the
+    engine isn't SQLite or maintenance is disabled.
+    """
+    db_engine = db_engine or engine
+    interval = SQLITE_MAINTENANCE_INTERVAL if interval is None else interval
+    if db_engine.dialect.name != "sqlite" or interval <= 0:
+        return None
+
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                report = run_sqlite_maintenance(db_engine)
+                print(f"SQLite maintenance: {report}")
+            except Exception as e:
+                print(f"SQLite maintenance failed: {e}")
+
+    threading.Thread(target=loop, name="sqlite-maintenance", daemon=True).start()
+    return stop
+
+
+# Columns added to existing tables since the first release, with the value
+# existing rows get. create_all() never alters a table that already exists and
+# SQLite has no ADD COLUMN IF NOT EXISTS (PostgreSQL: migration.sql).
+SQLITE_ADDED_COLUMNS = (
+    ("folders", "updated_at", "strftime('%Y-%m-%d %H:%M:%f000', 'now')"),
+    ("notes", "changed_at", "updated_at"),
+)
+
+
+# Timestamps compared as raw text (keyset pagination, delta sync). Files
+# written before now() was stamped with fractional seconds hold
+# CURRENT_TIMESTAMP text ('YYYY-MM-DD HH:MM:SS'), which sorts below every
+# bound value; they are rewritten once (PRAGMA user_version 0 -> 1).
+SQLITE_TEXT_TIMESTAMPS = (
+    ("notes", "updated_at"),
+    ("notes", "changed_at"),
+    ("folders", "updated_at"),
+    ("tombstones", "deleted_at"),
+)
+SQLITE_SCHEMA_VERSION = 1
+
+
+def _normalize_sqlite_timestamps(conn):
+    for table, column in SQLITE_TEXT_TIMESTAMPS:
+        if column not in {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}:
+            continue
+        conn.exec_driver_sql(
+            f"UPDATE {table} SET {column} = strftime('%Y-%m-%d %H:%M:%f000', {column}) "
+            f"WHERE length({column}) = 19"
+        )
+
+
+def ensure_sqlite_schema(db_engine=None) -> list:
+    """
+    Brings an existing SQLite file up to date: adds missing columns
+    (SQLITE_ADDED_COLUMNS, backfilled) and indexes, and normalizes legacy
+    timestamps once. Safe to call on every startup; returns the columns
+    added. Call after create_all().
+    """
+    db_engine = db_engine or engine
+    if db_engine.dialect.name != "sqlite":
+        return []
+    added = []
+    with db_engine.begin() as conn:
+        for table, column, backfill in SQLITE_ADDED_COLUMNS:
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            if not existing or column in existing:
+                continue
+            # ADD COLUMN can't take a CURRENT_TIMESTAMP / expression default;
+            # new rows get theirs from the column's Python-side default
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} DATETIME")
+            conn.exec_driver_sql(f"UPDATE {table} SET {column} = {backfill}")
+            added.append(f"{table}.{column}")
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() < SQLITE_SCHEMA_VERSION:
+            _normalize_sqlite_timestamps(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+    return added
+
+
+def make_engine(url: str, profile: str = None, **kwargs):
+    """
+    Creates an engine for `url` using a pool profile (see POOL_PROFILES).
+    Raises on invalid configuration instead of falling back silently.
+    """
+    if profile is None:
+        profile = "sqlite" if url.startswith("sqlite") else DB_POOL_PROFILE
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_POOL_PROFILE '{profile}' (expected one of {POOL_PROFILES})")
+
+    connect_args = kwargs.pop("connect_args", {})
+    if url.startswith("postgresql"):
+        connect_args.setdefault("connect_timeout", DB_CONNECT_TIMEOUT)
+
+    if profile == "sqlite":
+        connect_args.setdefault("check_same_thread", False)
+        engine = create_engine(url, connect_args=connect_args, **kwargs)
+        event.listen(engine, "connect", _sqlite_on_connect)
+    elif profile == "serverless":
+        engine = create_engine(url, poolclass=NullPool, connect_args=connect_args, **kwargs)
+    else:
+        engine = create_engine(
+            url,
+            poolclass=InstrumentedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args=connect_args,
+            **kwargs,
+        )
+    engine.pool_profile = profile
+    return _instrument(engine)
+
+
+def _async_url(url: str):
+    """Maps a sync URL to its asyncio driver (aiosqlite / asyncpg) plus connect_args."""
+    u = make_url(url)
+    connect_args = {}
+    if u.get_backend_name() == "sqlite":
+        return u.set(drivername="sqlite+aiosqlite"), connect_args
+    if u.get_backend_name() == "postgresql":
+        query = dict(u.query)
+        # asyncpg takes libpq's sslmode values under the name `ssl`
+        sslmode = query.pop("sslmode", None)
+        if sslmode:
+            connect_args["ssl"] = sslmode
+        return u.set(drivername="postgresql+asyncpg", query=query), connect_args
+    raise ValueError(f"No asyncio driver for database URL '{u.get_backend_name()}'")
+
+
+def make_async_engine(url: str, profile: str = None, **kwargs):
+    """
+    asyncio counterpart of make_engine(): same profiles and settings (except
+    the DB_ASYNC_* pool sizes), using aiosqlite for SQLite and asyncpg for
+    PostgreSQL.
+    """
+    if profile is None:
+        profile = "sqlite" if url.startswith("sqlite") else DB_POOL_PROFILE
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_POOL_PROFILE '{profile}' (expected one of {POOL_PROFILES})")
+
+    async_url, connect_args = _async_url(url)
+    connect_args.update(kwargs.pop("connect_args", {}))
+    if async_url.get_backend_name() == "postgresql":
+        connect_args.setdefault("timeout", DB_CONNECT_TIMEOUT)
+
+    if profile == "sqlite":
+        engine = create_async_engine(async_url, connect_args=connect_args, **kwargs)
+        event.listen(engine.sync_engine, "connect", _sqlite_on_connect)
+    elif profile == "serverless":
+        if async_url.get_backend_name() == "postgresql":
+            # Transaction poolers (PgBouncer) can't keep named prepared statements
+            connect_args.setdefault("statement_cache_size", 0)
+            connect_args.setdefault("prepared_statement_name_func", lambda: f"__asyncpg_{uuid.uuid4()}__")
+        engine = create_async_engine(async_url, poolclass=NullPool, connect_args=connect_args, **kwargs)
+    else:
+        engine = create_async_engine(
+            async_url,
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=DB_ASYNC_POOL_SIZE,
+            max_overflow=DB_ASYNC_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args=connect_args,
+            **kwargs,
+        )
+    engine.sync_engine.pool_profile = profile
+    _instrument(engine.sync_engine)
+    return engine
+
+
+def pool_status(db_engine=None) -> dict:
+    """Current pool occupancy plus checkout/wait counters, for /api/metrics."""
+    db_engine = db_engine or engine
+    pool = db_engine.pool
+    status = {
+        "profile": getattr(db_engine, "pool_profile", None),
+        "pool_class": type(pool).__name__,
+    }
+    if isinstance(pool, QueuePool):
+        status.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                # From the pool itself: the sync and asyncio pools are sized apart
+                "max_overflow": pool._max_overflow,
+                "timeout_seconds": pool._timeout,
+            }
+        )
+    status.update(pool.stats.snapshot())
+    return status
+
+
+# WAL keeps SHYNOTE.db-wal / -shm next to the database, so it lives in a
+# directory (mounted as a whole in Docker) rather than as a single file
+SQLITE_DEFAULT_PATH = os.path.join("data", "SHYNOTE.db")
+SQLITE_LEGACY_PATH = "SHYNOTE.db"
+
+
+def _default_sqlite_url() -> str:
+    if os.path.exists(SQLITE_LEGACY_PATH) and not os.path.exists(SQLITE_DEFAULT_PATH):
+        print(f"Using legacy ./{SQLITE_LEGACY_PATH}; move it to ./{SQLITE_DEFAULT_PATH} to keep WAL files together")
+        return f"sqlite:///./{SQLITE_LEGACY_PATH}"
+    os.makedirs(os.path.dirname(SQLITE_DEFAULT_PATH), exist_ok=True)
+    return f"sqlite:///./{SQLITE_DEFAULT_PATH}"
+
+
 # Check for Vercel's POSTGRES_URL or generic DATABASE_URL
 SQLALCHEMY_DATABASE_URL = os.getenv("POSTGRES_URL") or os.getenv("DATABASE_URL")
 
@@ -24,28 +401,30 @@ if SQLALCHEMY_DATABASE_URL:
         query = urlparse.parse_qs(u.query)
         if 'supa' in query:
             del query['supa']
-        
+
         # Reconstruct URL without 'supa'
         new_query = urlparse.urlencode(query, doseq=True)
         SQLALCHEMY_DATABASE_URL = u._replace(query=new_query).geturl()
         print(f"Sanitized Database URL (removed 'supa'): {SQLALCHEMY_DATABASE_URL.split('@')[-1]}")
-    
-    try:
-        engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
+    # Fail fast: a broken DB config must not silently become an in-memory DB
+    try:
+        engine = make_engine(SQLALCHEMY_DATABASE_URL)
     except Exception as e:
         print(f"Error creating DB engine: {e}")
-        # Fallback to a memory engine to allow the app to start
-        engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+        raise
 
 else:
-    SQLALCHEMY_DATABASE_URL = "sqlite:///./SHYNOTE.db"
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-    )
+    SQLALCHEMY_DATABASE_URL = _default_sqlite_url()
+    engine = make_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# asyncio engine for the hot endpoints. Objects stay loaded after commit so
+# response serialization never triggers lazy IO outside the event loop.
+async_engine = make_async_engine(SQLALCHEMY_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -54,3 +433,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
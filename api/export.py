@@ -0,0 +1,299 @@
+import io
+import json
+import re
+import tarfile
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models, schemas, sync
+
+# Streaming backup export.
+#
+# Rows are read in batches (`yield_per`, a server-side cursor on PostgreSQL)
+# and serialized one at a time, so memory stays flat regardless of account
+# size and the first bytes go out immediately.
+#
+# - json:   same document as schemas.BackupData, accepted by POST /api/restore
+# - ndjson: one record per line; a "header" line, then "folder", "note" and
+#           (incremental only) "deleted" lines. Accepted by POST /api/import.
+# - zip / tar.gz: one .md file per note plus manifest.json (header, folders,
+#           note metadata with archive paths, deletions)
+#
+# Every backup carries a `backup_id` (the database time when it started).
+# Passing it back as `since` yields an incremental backup: rows changed at or
+# after that point plus tombstoned deletions, so a full backup followed by a
+# chain of incrementals can be replayed in order.
+
+BACKUP_VERSION = 1
+BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024  # coalesce small rows into fewer response chunks
+MANIFEST_SPOOL_SIZE = 1024 * 1024  # manifest spills to a temp file past this
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "zip": "application/zip",
+    "tar.gz": "application/gzip",
+}
+ARCHIVE_FORMATS = ("zip", "tar.gz")
+
+FOLDER_COLUMNS = tuple(getattr(models.Folder, name) for name in schemas.BackupFolder.model_fields)
+NOTE_COLUMNS = tuple(getattr(models.Note, name) for name in schemas.BackupNote.model_fields)
+
+_UNSAFE_PATH_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def parse_since(value: str) -> datetime:
+    """Accepts an ISO-8601 timestamp or a `backup_id` from an earlier backup."""
+    try:
+        since = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            since = sync.decode_cursor(value)
+        except HTTPException:
+            raise HTTPException(status_code=400, detail="Invalid since: expected a timestamp or backup_id")
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc)
+    return since
+
+
+def snapshot_time(db: Session) -> datetime:
+    # Database clock (the one that stamps changed_at / deleted_at) held back
+    # like a sync cursor, so writers still in flight reach the next
+    # incremental backup (see api/sync.py)
+    return sync.cursor_horizon(db)
+
+
+def _header(user_id: str, snapshot_at: datetime, since: Optional[datetime]) -> dict:
+    header = {
+        "backup_version": BACKUP_VERSION,
+        "created_at": datetime.utcnow().isoformat(),
+        "backup_user_id": user_id,
+        "backup_id": sync.encode_cursor(snapshot_at),
+    }
+    if since is not None:
+        header["since"] = since.isoformat()
+    return header
+
+
+def _rows(db: Session, columns, user_id: str, since: Optional[datetime], batch_size: int):
+    entity = columns[0].class_
+    stmt = select(*columns).where(entity.user_id == user_id)
+    if since is not None:
+        stamp = entity.changed_at if entity is models.Note else entity.updated_at
+        stmt = stmt.where(sync.at_or_after(db, stamp, since))
+    stmt = stmt.order_by(entity.id).execution_options(yield_per=batch_size)
+    return db.execute(stmt)
+
+
+def _folders(db: Session, user_id: str, since: Optional[datetime], batch_size: int) -> Iterator[str]:
+    for row in _rows(db, FOLDER_COLUMNS, user_id, since, batch_size):
+        yield schemas.BackupFolder.model_validate(row).model_dump_json()
+
+
+def _notes(db: Session, user_id: str, since: Optional[datetime], batch_size: int) -> Iterator[str]:
+    for row in _rows(db, NOTE_COLUMNS, user_id, since, batch_size):
+        yield schemas.BackupNote.model_validate(row).model_dump_json()
+
+
+def _deletions(db: Session, user_id: str, since: Optional[datetime]) -> Tuple[list, list]:
+    """(note_ids, folder_ids) deleted at or after `since`; nothing for full backups."""
+    if since is None:
+        return [], []
+    rows = db.execute(
+        select(models.Tombstone.entity_type, models.Tombstone.entity_id)
+        .where(
+            models.Tombstone.user_id == user_id,
+            sync.at_or_after(db, models.Tombstone.deleted_at, since),
+        )
+        .order_by(models.Tombstone.id)
+    )
+    deleted = {"note": {}, "folder": {}}
+    for entity_type, entity_id in rows:
+        if entity_type in deleted:
+            deleted[entity_type][entity_id] = None  # ordered de-dup
+    return list(deleted["note"]), list(deleted["folder"])
+
+
+def _json_array(items: Iterable[str]) -> Iterator[str]:
+    yield "["
+    for i, item in enumerate(items):
+        yield "," + item if i else item
+    yield "]"
+
+
+def _tagged(record_type: str, item: str) -> str:
+    # '{"type":"note",' + '{...}'[1:] without a decode/encode round trip
+    return '{"type":"%s",%s\n' % (record_type, item[1:])
+
+
+def _stream_json(db: Session, user_id: str, snapshot_at, since, batch_size: int) -> Iterator[str]:
+    yield json.dumps(_header(user_id, snapshot_at, since))[:-1] + ',"folders":'
+    yield from _json_array(_folders(db, user_id, since, batch_size))
+    yield ',"notes":'
+    yield from _json_array(_notes(db, user_id, since, batch_size))
+    note_ids, folder_ids = _deletions(db, user_id, since)
+    yield ',"deleted_note_ids":%s,"deleted_folder_ids":%s}' % (json.dumps(note_ids), json.dumps(folder_ids))
+
+
+def _stream_ndjson(db: Session, user_id: str, snapshot_at, since, batch_size: int) -> Iterator[str]:
+    yield json.dumps({"type": "header", **_header(user_id, snapshot_at, since)}) + "\n"
+    for item in _folders(db, user_id, since, batch_size):
+        yield _tagged("folder", item)
+    for item in _notes(db, user_id, since, batch_size):
+        yield _tagged("note", item)
+    note_ids, folder_ids = _deletions(db, user_id, since)
+    for entity, ids in (("folder", folder_ids), ("note", note_ids)):
+        for entity_id in ids:
+            yield json.dumps({"type": "deleted", "entity": entity, "id": entity_id}) + "\n"
+
+
+def _chunked(pieces: Iterable[str], chunk_size: int) -> Iterator[bytes]:
+    buffer, size = [], 0
+    for piece in pieces:
+        data = piece.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+# --- Archives ---
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer the archive writes into and we drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks, self.size = [], 0
+        return data
+
+
+class _ZipArchive:
+    def __init__(self, sink: _Sink):
+        self._zip = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+
+    def add(self, name: str, data: bytes, mtime: datetime):
+        info = zipfile.ZipInfo(name, date_time=max(mtime.timetuple()[:6], (1980, 1, 1, 0, 0, 0)))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        self._zip.writestr(info, data)
+
+    def add_file(self, name: str, fileobj, size: int, mtime: datetime):
+        with self._zip.open(name, "w", force_zip64=True) as dst:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                dst.write(chunk)
+
+    def close(self):
+        self._zip.close()
+
+
+class _TarArchive:
+    def __init__(self, sink: _Sink):
+        self._tar = tarfile.open(fileobj=sink, mode="w|gz")
+
+    def add(self, name: str, data: bytes, mtime: datetime):
+        self.add_file(name, io.BytesIO(data), len(data), mtime)
+
+    def add_file(self, name: str, fileobj, size: int, mtime: datetime):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = _utc(mtime).timestamp()
+        self._tar.addfile(info, fileobj)
+
+    def close(self):
+        self._tar.close()
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite hands back naive UTC datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _note_path(note: schemas.BackupNote) -> str:
+    title = _UNSAFE_PATH_CHARS.sub("_", note.title or "").strip(" .")[:60] or "Untitled"
+    return f"notes/{title}_{_UNSAFE_PATH_CHARS.sub('_', note.id)}.md"
+
+
+def _stream_archive(db: Session, user_id: str, snapshot_at, since, batch_size: int, fmt: str, chunk_size: int) -> Iterator[bytes]:
+    sink = _Sink()
+    archive = _ZipArchive(sink) if fmt == "zip" else _TarArchive(sink)
+    mtime = _utc(snapshot_at)
+
+    # The manifest indexes every note, so it is spooled (memory, then disk)
+    # while note files stream out, and added last.
+    with tempfile.SpooledTemporaryFile(max_size=MANIFEST_SPOOL_SIZE) as manifest:
+        manifest.write((json.dumps(_header(user_id, snapshot_at, since))[:-1] + ',"folders":').encode())
+        for piece in _json_array(_folders(db, user_id, since, batch_size)):
+            manifest.write(piece.encode())
+        manifest.write(b',"notes":[')
+
+        for i, row in enumerate(_rows(db, NOTE_COLUMNS, user_id, since, batch_size)):
+            note = schemas.BackupNote.model_validate(row)
+            path = _note_path(note)
+            archive.add(path, (note.content or "").encode(), note.updated_at or mtime)
+            meta = note.model_dump(mode="json", exclude={"content"})
+            meta["path"] = path
+            manifest.write((("," if i else "") + json.dumps(meta)).encode())
+            if sink.size >= chunk_size:
+                yield sink.drain()
+
+        note_ids, folder_ids = _deletions(db, user_id, since)
+        manifest.write(
+            ('],"deleted_note_ids":%s,"deleted_folder_ids":%s}' % (json.dumps(note_ids), json.dumps(folder_ids))).encode()
+        )
+        size = manifest.tell()
+        manifest.seek(0)
+        archive.add_file("manifest.json", manifest, size, mtime)
+
+    archive.close()
+    yield sink.drain()
+
+
+def stream_backup(
+    db: Session,
+    user_id: str,
+    fmt: str = "json",
+    since: Optional[datetime] = None,
+    batch_size: int = BATCH_SIZE,
+    chunk_size: int = CHUNK_SIZE,
+    snapshot_at: Optional[datetime] = None,
+) -> Iterator[bytes]:
+    """
+    Yields the encoded backup in ~chunk_size pieces. Owns `db` from here on:
+    the request's dependency cleanup runs before streaming starts, so the
+    session is closed when the generator finishes.
+    """
+    try:
+        snapshot_at = snapshot_at or snapshot_time(db)
+        if fmt in ARCHIVE_FORMATS:
+            yield from _stream_archive(db, user_id, snapshot_at, since, batch_size, fmt, chunk_size)
+        else:
+            stream = _stream_ndjson if fmt == "ndjson" else _stream_json
+            yield from _chunked(stream(db, user_id, snapshot_at, since, batch_size), chunk_size)
+    finally:
+        db.close()
@@ -0,0 +1,35 @@
+import hashlib
+
+from fastapi import Request, Response
+
+# Conditional GET helpers (ETag / If-None-Match).
+
+# Authenticated responses: browsers may keep them but must revalidate each time,
+# which turns unchanged polls into bodyless 304s without any client changes.
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the given version-identifying values."""
+    raw = "\x1f".join("" if p is None else str(p) for p in parts)
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses weak comparison, so ignore any W/ prefix
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
+
+
+def not_modified(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
+
+
+def cache_headers(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if cache_control.startswith("private"):
+        headers["Vary"] = "Authorization"
+    return headers
@@ -0,0 +1,127 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+from .config import IMAGE_QUEUE_MAX, IMAGE_VARIANT_WIDTHS, IMAGE_WORKERS
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: pip install .[images]
+    Image = None
+
+# Downscaled WebP variants of uploaded images.
+#
+# Decoding and resizing a 5-10MB phone photo is CPU-bound, so it runs in a
+# bounded process pool (IMAGE_WORKERS processes, at most IMAGE_QUEUE_MAX jobs
+# queued; beyond that new jobs are dropped and the original keeps being
+# served). Variants are stored next to the original as `w{width}.webp`.
+#
+# Workers get the path of the stored original (or a temporary download of it
+# for remote backends), not its bytes: the image is never held in the app
+# process or pickled across. This module only imports Pillow and the config,
+# so spawned workers start quickly and never touch the app's database engines.
+
+# Formats Pillow decodes reliably; GIF is left alone to keep animations
+DERIVABLE_TYPES = ("image/jpeg", "image/png", "image/webp", "image/bmp", "image/tiff")
+WEBP_QUALITY = 80
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pending = 0
+
+
+def enabled() -> bool:
+    return Image is not None and IMAGE_WORKERS > 0 and bool(IMAGE_VARIANT_WIDTHS)
+
+
+def derivable(content_type: Optional[str]) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() in DERIVABLE_TYPES
+
+
+def variant_path(path: str, width: int) -> str:
+    return f"{os.path.dirname(path)}/w{width}.webp"
+
+
+def parse_variants(value: Optional[str]) -> List[int]:
+    return sorted(int(w) for w in (value or "").split(",") if w)
+
+
+def pick_variant(path: str, variants: Optional[str], width: Optional[int]) -> str:
+    """The smallest stored variant at least `width` wide, else the original."""
+    if width:
+        for candidate in parse_variants(variants):
+            if candidate >= width:
+                return variant_path(path, candidate)
+    return path
+
+
+def make_variants(source: str, widths: Iterable[int]) -> List[Tuple[int, bytes]]:
+    """[(width, webp bytes)] for each width narrower than the image file. Runs in a worker process."""
+    out = []
+    with Image.open(source) as img:
+        widths = sorted((w for w in widths if w < img.width), reverse=True)
+        if not widths:
+            return out
+        # JPEG: decode at a reduced scale straight away when possible
+        img.draft("RGB", (widths[0], max(1, img.height * widths[0] // img.width)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        # Each size is scaled from the previous (larger) one
+        for width in widths:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+            buffer = io.BytesIO()
+            img.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+            out.append((width, buffer.getvalue()))
+    return out
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded server process (DB pools, locks) is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+async def render_variants(source: str, widths: Iterable[int] = IMAGE_VARIANT_WIDTHS) -> Optional[List[Tuple[int, bytes]]]:
+    """Variants computed in the process pool; None when disabled or the queue is full."""
+    global _pending
+    if not enabled():
+        return None
+    with _pool_lock:
+        if _pending >= IMAGE_QUEUE_MAX:
+            return None
+        _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor(), make_variants, source, tuple(widths))
+    finally:
+        with _pool_lock:
+            _pending -= 1
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def stats() -> dict:
+    return {
+        "enabled": enabled(),
+        "workers": IMAGE_WORKERS,
+        "pending": _pending,
+        "queue_max": IMAGE_QUEUE_MAX,
+        "widths": list(IMAGE_VARIANT_WIDTHS),
+    }
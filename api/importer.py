@@ -0,0 +1,227 @@
+import json
+import time
+import zlib
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import restore, schemas, share
+from .config import IMPORT_MAX_LINE_BYTES, RESTORE_BATCH_SIZE
+
+# Streaming NDJSON import (the `format=ndjson` output of GET /api/backup).
+#
+# The body (raw or a multipart file, optionally gzip) is split into lines as
+# it arrives; records are validated one by one and upserted/committed every
+# RESTORE_BATCH_SIZE records through api/restore.py. Memory is bounded by the
+# batch size and IMPORT_MAX_LINE_BYTES, not by the file size.
+#
+# Progress is kept in-process per import id so the client can poll
+# GET /api/import/{import_id} while the upload is running.
+
+GZIP_MAGIC = b"\x1f\x8b"
+READ_CHUNK_SIZE = 64 * 1024
+MAX_TRACKED_IMPORTS = 1000
+
+
+class ImportProgress:
+    def __init__(self, import_id: str, user_id: str):
+        self.import_id = import_id
+        self.user_id = user_id
+        self.status = "running"
+        self.bytes_read = 0
+        self.lines = 0
+        self.batches = 0
+        self.records_skipped = 0
+        self.counts = {
+            f"{entity}_{outcome}": 0
+            for entity in ("folders", "notes")
+            for outcome in ("added", "updated", "skipped", "deleted")
+        }
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def add(self, entity: str, counts: dict):
+        for outcome, value in counts.items():
+            self.counts[f"{entity}_{outcome}"] += value
+
+    def finish(self, error: Optional[str] = None):
+        self.status = "failed" if error else "completed"
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "import_id": self.import_id,
+            "status": self.status,
+            "bytes_read": self.bytes_read,
+            "lines": self.lines,
+            "batches": self.batches,
+            "records_skipped": self.records_skipped,
+            **self.counts,
+            "error": self.error,
+            "elapsed_ms": round((end - self.started_at) * 1000, 1),
+        }
+
+
+_imports: "OrderedDict[str, ImportProgress]" = OrderedDict()
+
+
+def start_import(import_id: str, user_id: str) -> ImportProgress:
+    if import_id in _imports:
+        raise HTTPException(status_code=409, detail="Import id already in use")
+    progress = _imports[import_id] = ImportProgress(import_id, user_id)
+    while len(_imports) > MAX_TRACKED_IMPORTS:
+        _imports.popitem(last=False)
+    return progress
+
+
+def get_progress(import_id: str, user_id: str) -> Optional[ImportProgress]:
+    progress = _imports.get(import_id)
+    if progress is None or progress.user_id != user_id:
+        return None
+    return progress
+
+
+async def iter_upload(upload) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await upload.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _decoded(chunks: AsyncIterator[bytes], progress: ImportProgress) -> AsyncIterator[bytes]:
+    # Gzip files (.ndjson.gz) are detected by magic bytes; a Content-Encoding
+    # header is handled earlier by CompressionMiddleware.
+    decompressor = None
+    sniffed = False
+    async for chunk in chunks:
+        progress.bytes_read += len(chunk)
+        if not chunk:
+            continue
+        if not sniffed:
+            sniffed = True
+            if chunk[:2] == GZIP_MAGIC:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if decompressor is not None:
+            try:
+                chunk = decompressor.decompress(chunk)
+            except zlib.error:
+                raise HTTPException(status_code=400, detail="Malformed gzip data")
+        yield chunk
+    if decompressor is not None and not decompressor.eof:
+        raise HTTPException(status_code=400, detail="Truncated gzip data")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = IMPORT_MAX_LINE_BYTES) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            yield bytes(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise HTTPException(status_code=413, detail="Import line too long")
+    if buffer:
+        yield bytes(buffer)
+
+
+def _write_batch(db: Session, user_id: str, folders: List, notes: List, deleted: dict) -> tuple:
+    # Folders first so notes in the same batch can reference them; deletions
+    # (incremental backups) last, as they were recorded after the upserts
+    folder_counts = restore.upsert_folders(db, user_id, folders)
+    note_counts = restore.upsert_notes(db, user_id, notes)
+    note_counts["deleted"] = restore.delete_notes(db, user_id, deleted["note"])
+    cascade = restore.delete_folders(db, user_id, deleted["folder"])
+    folder_counts["deleted"] = cascade["folders"]
+    note_counts["deleted"] += cascade["notes"]
+    return folder_counts, note_counts
+
+
+async def import_ndjson(
+    db: AsyncSession,
+    user_id: str,
+    chunks: AsyncIterator[bytes],
+    progress: ImportProgress,
+    batch_size: Optional[int] = None,
+):
+    """Parses and upserts an NDJSON backup stream, committing every batch."""
+    batch_size = batch_size or RESTORE_BATCH_SIZE
+    folders, notes = [], []
+    deleted = {"note": [], "folder": []}
+    # Shares as they were before the import; batches can delete or unshare them
+    cached = await db.run_sync(restore.shared_notes, user_id)
+
+    def pending() -> int:
+        return len(folders) + len(notes) + len(deleted["note"]) + len(deleted["folder"])
+
+    async def flush():
+        if not pending():
+            return
+        folder_counts, note_counts = await db.run_sync(_write_batch, user_id, folders, notes, deleted)
+        await db.commit()
+        share.invalidate_notes(cached)
+        share.invalidate_notes((n.id, n.share_id) for n in notes)
+        progress.add("folders", folder_counts)
+        progress.add("notes", note_counts)
+        progress.batches += 1
+        folders.clear()
+        notes.clear()
+        deleted["note"].clear()
+        deleted["folder"].clear()
+
+    async for line in iter_lines(_decoded(chunks, progress)):
+        progress.lines += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            record_type = record.pop("type", None)
+            if record_type == "header":
+                owner = record.get("backup_user_id")
+                if owner and owner != user_id:
+                    raise HTTPException(
+                        status_code=403,
+                        detail="This backup was created by another user and cannot be restored.",
+                    )
+            elif record_type == "folder":
+                folders.append(schemas.BackupFolder.model_validate(record))
+            elif record_type == "note":
+                notes.append(schemas.BackupNote.model_validate(record))
+            elif record_type == "deleted" and record.get("entity") in deleted:
+                deleted[record["entity"]].append(str(record["id"]))
+            else:
+                progress.records_skipped += 1
+        except (ValueError, AttributeError, KeyError):
+            # JSONDecodeError / pydantic ValidationError / non-object line
+            raise HTTPException(status_code=400, detail=f"Invalid record on line {progress.lines}")
+
+        if pending() >= batch_size:
+            await flush()
+
+    await flush()
+
+
+async def run_import(db: AsyncSession, user_id: str, chunks: AsyncIterator[bytes], progress: ImportProgress) -> dict:
+    try:
+        await import_ndjson(db, user_id, chunks, progress)
+    except HTTPException as e:
+        await db.rollback()
+        progress.finish(error=str(e.detail))
+        raise
+    except Exception as e:
+        await db.rollback()
+        progress.finish(error=str(e))
+        raise
+    progress.finish()
+    return progress.to_dict()
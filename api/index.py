@@ -2,14 +2,20 @@ import os
 import uuid
 import hashlib
 import secrets
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request
+from datetime import datetime
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from sqlalchemy import case, func, or_, select, exc as sa_exc
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from . import models, schemas, database
+from . import models, schemas, database, sync, pagination, search, http_cache, patch, config, export, restore, importer, render, share, uploads, images, attachment_gc
 from .auth import manager, utils
-from .storage import storage_service
+from .storage import StorageNotFound, storage_service
+from .storage.local import LocalStorage
+from .compression import CompressionMiddleware
 
 # Get the directory of the current file to resolve static paths correctly
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,14 +23,68 @@ STATIC_DIR = os.path.join(os.path.dirname(BASE_DIR), "static")
 
 app = FastAPI()
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=config.COMPRESSION_MIN_SIZE,
+    gzip_level=config.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=config.COMPRESSION_BROTLI_QUALITY,
+    zstd_level=config.COMPRESSION_ZSTD_LEVEL,
+    max_request_size=config.MAX_DECOMPRESSED_REQUEST_BYTES,
+)
+
+
+@app.exception_handler(sa_exc.TimeoutError)
+async def db_pool_timeout_handler(request: Request, e: sa_exc.TimeoutError):
+    # Pool exhausted for DB_POOL_TIMEOUT seconds: tell clients to back off
+    print(f"DB pool timeout: {database.pool_status()}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
 
 @app.on_event("startup")
 def on_startup():
+    # Fail fast: a server that can't reach or create its schema must not start
     try:
         models.Base.metadata.create_all(bind=database.engine)
     except Exception as e:
         print(f"Error creating database tables during startup: {e}")
-        # Application continues; logs will show the issue.
+        raise
+    database.ensure_sqlite_schema()
+    search.ensure_search_index(database.engine)
+
+
+@app.on_event("startup")
+def start_db_maintenance():
+    # No-op unless running on SQLite with SQLITE_MAINTENANCE_INTERVAL > 0
+    app.state.sqlite_maintenance = database.start_sqlite_maintenance()
+
+
+@app.on_event("shutdown")
+def stop_db_maintenance():
+    stop = getattr(app.state, "sqlite_maintenance", None)
+    if stop is not None:
+        stop.set()
+
+
+@app.on_event("startup")
+def start_attachment_gc():
+    # No-op unless ATTACHMENT_GC_INTERVAL > 0 (set it on one instance only)
+    app.state.attachment_gc = attachment_gc.start_attachment_gc()
+
+
+@app.on_event("shutdown")
+def stop_attachment_gc():
+    stop = getattr(app.state, "attachment_gc", None)
+    if stop is not None:
+        stop.set()
+
+
+@app.on_event("shutdown")
+def stop_image_workers():
+    images.shutdown()
 
 
 # Mount static files
@@ -124,7 +184,7 @@ def serve_oauth_callback():
 # OAuth 2.0 Callback - POST: Handle Token Exchange
 @app.post("/auth/google/callback")
 async def google_oauth_callback(
-    request: Request, db: Session = Depends(database.get_db)
+    request: Request, db: AsyncSession = Depends(database.get_async_db)
 ):
     import httpx
     from .config import GOOGLE_CLIENT_ID
@@ -204,7 +264,8 @@ async def google_oauth_callback(
         if not email:
             raise HTTPException(status_code=400, detail="Email not provided by Google")
 
-        user = db.query(models.User).filter(models.User.email == email).first()
+        result = await db.execute(select(models.User).where(models.User.email == email))
+        user = result.scalars().first()
 
         if not user:
             user = models.User(
@@ -214,13 +275,14 @@ async def google_oauth_callback(
                 provider="google",
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
         else:
             # Update info
             user.name = user_info.get("name")
             user.picture = user_info.get("picture")
-            db.commit()
+            await db.commit()
+            utils.principal_cache.invalidate_user(user.id)
 
         # 4. Create local JWT
         jwt_token = manager.create_access_token(data={"sub": str(user.id)})
@@ -258,6 +320,7 @@ def update_user_profile(
         current_user.view_mode = profile_update.view_mode
 
     db.commit()
+    utils.principal_cache.invalidate_user(current_user.id)
     db.refresh(current_user)
     return current_user
 
@@ -285,6 +348,7 @@ def create_api_key(
 ):
     current_user.api_key = generate_unique_api_key(db)
     db.commit()
+    utils.principal_cache.invalidate_user(current_user.id)  # Old key stops working now
     db.refresh(current_user)
     return {"api_key": current_user.api_key}
 
@@ -296,14 +360,46 @@ def delete_api_key(
 ):
     current_user.api_key = None
     db.commit()
+    utils.principal_cache.invalidate_user(current_user.id)
     db.refresh(current_user)
     return {"api_key": None}
 
 
+@app.get("/api/metrics")
+def read_metrics(request: Request):
+    """
+    Operational counters. Requires `Authorization: Bearer <METRICS_TOKEN>`
+    when METRICS_TOKEN is configured.
+    """
+    if config.METRICS_TOKEN:
+        expected = f"Bearer {config.METRICS_TOKEN}"
+        if not secrets.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+    return {
+        "auth_cache": utils.principal_cache.stats(),
+        "render_cache": render.html_cache.stats(),
+        "image_workers": images.stats(),
+        "share_cache": share.page_cache.stats(),
+        "db_pool": database.pool_status(),
+        "db_pool_async": database.pool_status(database.async_engine.sync_engine),
+    }
+
+
 # --- CRUD Operations (Protected) ---
 
 
-@app.post("/api/folders", response_model=schemas.Folder)
+def _folder_out(folder: models.Folder) -> dict:
+    # Plain fields only: serializing the ORM object would lazy-load Folder.notes
+    return {
+        "id": folder.id,
+        "name": folder.name,
+        "user_id": folder.user_id,
+        "updated_at": folder.updated_at,
+    }
+
+
+@app.post("/api/folders", response_model=schemas.FolderTree, response_model_exclude_unset=True)
 def create_folder(
     folder: schemas.FolderCreate,
     db: Session = Depends(database.get_db),
@@ -328,52 +424,123 @@ def create_folder(
 
         # If user matches, it's an idempotent retry. Return existing.
         # Note: We don't update name on POST (use PUT for updates), just ensure existence.
-        return existing_folder
+        return _folder_out(existing_folder)
 
     db_folder = models.Folder(id=folder.id, name=folder.name, user_id=current_user.id)
     db.add(db_folder)
+    sync.clear_tombstones(db, current_user.id, "folder", [folder.id])
     db.commit()
     db.refresh(db_folder)
-    return db_folder
+    return _folder_out(db_folder)
+
+
+def _folder_tree(db: Session, user_id: str, skip: int, limit: int) -> List[dict]:
+    # One LEFT JOIN ... GROUP BY for every folder's note stats
+    rows = db.execute(
+        select(
+            models.Folder.id,
+            models.Folder.name,
+            models.Folder.user_id,
+            models.Folder.updated_at,
+            func.count(models.Note.id).label("note_count"),
+            func.count(case((models.Note.is_pinned.is_(True), 1))).label("pinned_count"),
+            func.max(models.Note.updated_at).label("last_updated_at"),
+        )
+        .outerjoin(
+            models.Note,
+            (models.Note.folder_id == models.Folder.id) & (models.Note.user_id == models.Folder.user_id),
+        )
+        .where(models.Folder.user_id == user_id)
+        .group_by(models.Folder.id, models.Folder.name, models.Folder.user_id, models.Folder.updated_at)
+        .order_by(models.Folder.name, models.Folder.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return [dict(row._mapping) for row in rows]
 
 
-@app.get("/api/folders", response_model=List[schemas.Folder])
+@app.get("/api/folders", response_model=List[schemas.FolderTree], response_model_exclude_unset=True)
 def read_folders(
     skip: int = 0,
     limit: int = 100,
+    include_notes: bool = False,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(utils.get_current_user),
 ):
-    folders = (
-        db.query(models.Folder)
-        .filter(models.Folder.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    """
+    Folders with note_count / pinned_count / last_updated_at. Full notes are
+    embedded only with ?include_notes=true (fetched in one extra query).
+    """
+    folders = _folder_tree(db, current_user.id, skip, limit)
+    if include_notes and folders:
+        by_folder = {folder["id"]: folder for folder in folders}
+        for folder in folders:
+            folder["notes"] = []
+        notes = (
+            db.query(models.Note)
+            .filter(models.Note.user_id == current_user.id, models.Note.folder_id.in_(by_folder))
+            .order_by(models.Note.updated_at.desc(), models.Note.id.desc())
+        )
+        for note in notes:
+            by_folder[note.folder_id]["notes"].append(note)
     return folders
 
 
+ROOT_FOLDER = "root"  # DELETE /api/folders/{id}?move_to=root
+
+
 @app.delete("/api/folders/{folder_id}")
 def delete_folder(
     folder_id: str,
+    move_to: Optional[str] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(utils.get_current_user),
 ):
-    db_folder = (
-        db.query(models.Folder)
+    """
+    Deletes a folder with set-based SQL. Its notes are deleted too, or with
+    ?move_to=<folder_id> (or `root`) moved there in a single UPDATE.
+    """
+    exists = (
+        db.query(models.Folder.id)
         .filter(models.Folder.id == folder_id, models.Folder.user_id == current_user.id)
         .first()
     )
-    if db_folder is None:
+    if exists is None:
         raise HTTPException(status_code=404, detail="Folder not found")
 
-    db.delete(db_folder)
+    if move_to is not None:
+        target_id = None if move_to == ROOT_FOLDER else move_to
+        if target_id == folder_id:
+            raise HTTPException(status_code=400, detail="Cannot move notes into the deleted folder")
+        if target_id is not None and (
+            db.query(models.Folder.id)
+            .filter(models.Folder.id == target_id, models.Folder.user_id == current_user.id)
+            .first()
+            is None
+        ):
+            raise HTTPException(status_code=404, detail="Target folder not found")
+        moved = sync.move_folder_notes(db, current_user.id, folder_id, target_id)
+        sync.delete_folder_with_notes(db, current_user.id, folder_id)
+        db.commit()
+        return {"message": "Folder deleted successfully", "moved_notes": moved, "deleted_notes": 0}
+
+    share_ids = [
+        row.share_id
+        for row in db.query(models.Note.share_id).filter(
+            models.Note.folder_id == folder_id,
+            models.Note.user_id == current_user.id,
+            models.Note.is_shared.is_(True),
+        )
+    ]
+    # Records tombstones (folder + its notes) for delta sync
+    deleted = sync.delete_folder_with_notes(db, current_user.id, folder_id)
     db.commit()
-    return {"message": "Folder deleted successfully"}
+    for share_id in share_ids:
+        share.page_cache.invalidate(share_id)
+    return {"message": "Folder deleted successfully", "moved_notes": 0, "deleted_notes": deleted}
 
 
-@app.put("/api/folders/{folder_id}", response_model=schemas.Folder)
+@app.put("/api/folders/{folder_id}", response_model=schemas.FolderTree, response_model_exclude_unset=True)
 def update_folder(
     folder_id: str,
     folder: schemas.FolderUpdate,
@@ -391,24 +558,22 @@ def update_folder(
     db_folder.name = folder.name
     db.commit()
     db.refresh(db_folder)
-    return db_folder
+    return _folder_out(db_folder)
 
 
 @app.post("/api/notes", response_model=schemas.Note)
-def create_note(
+async def create_note(
     note: schemas.NoteCreate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(utils.get_any_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(utils.get_any_user_async),
 ):
     # Verify folder belongs to user if folder_id is provided
     if note.folder_id:
-        folder = (
-            db.query(models.Folder)
-            .filter(
+        folder = await db.scalar(
+            select(models.Folder.id).where(
                 models.Folder.id == note.folder_id,
                 models.Folder.user_id == current_user.id,
             )
-            .first()
         )
         if not folder:
             raise HTTPException(status_code=404, detail="Folder not found")
@@ -418,7 +583,7 @@ def create_note(
 
     # UPSERT: Check if note already exists
     # Check by ID only first to detect collisions even if user_id doesn't match
-    existing_note = db.query(models.Note).filter(models.Note.id == note_id).first()
+    existing_note = await db.get(models.Note, note_id)
 
     if existing_note:
         if existing_note.user_id != current_user.id:
@@ -440,6 +605,7 @@ def create_note(
             existing_note.is_pinned = note.is_pinned
         if hasattr(note, "is_shared"):
             existing_note.is_shared = note.is_shared
+        share.page_cache.invalidate(existing_note.share_id)
         db_note = existing_note
     else:
         # INSERT: Create new note
@@ -451,83 +617,269 @@ def create_note(
             user_id=current_user.id,
         )
         db.add(db_note)
+        await db.run_sync(sync.clear_tombstones, current_user.id, "note", [note_id])
 
-    db.commit()
-    db.refresh(db_note)
+    await db.commit()
+    await db.refresh(db_note)
     return db_note
 
 
-@app.get("/api/notes", response_model=List[schemas.Note])
-def read_notes(
-    skip: int = 0,
-    limit: int = None,
-    folder_id: str = None,
-    q: Optional[str] = None,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(utils.get_any_user),
-):
-    query = (
-        db.query(models.Note)
-        .filter(models.Note.user_id == current_user.id)
-        .order_by(models.Note.updated_at.desc())
+# Columns needed by the sidebar / command palette (everything but `content`)
+NOTE_SUMMARY_COLUMNS = (
+    models.Note.id,
+    models.Note.title,
+    models.Note.folder_id,
+    models.Note.created_at,
+    models.Note.updated_at,
+    models.Note.version,
+    models.Note.is_pinned,
+    models.Note.is_shared,
+)
+
+
+def _notes_query(user_id: str, folder_id: Optional[str], q: Optional[str], *entities):
+    query = pagination.order_notes(
+        select(*(entities or (models.Note,))).where(models.Note.user_id == user_id)
     )
     if folder_id is not None:
         query = query.filter(models.Note.folder_id == folder_id)
     if q:
         pattern = f"%{q}%"
         query = query.filter(models.Note.title.ilike(pattern))
+    return query
+
 
+async def _paginate(db: AsyncSession, query, response: Response, skip: int, limit: Optional[int], cursor: Optional[str]):
+    # `cursor` (keyset) supersedes `skip` (offset); the next page's cursor is
+    # returned in the X-Next-Cursor header so the list body stays unchanged.
+    if cursor:
+        query = pagination.apply_cursor(query, cursor)
+    elif skip:
+        query = query.offset(skip)
     if limit is not None:
         query = query.limit(limit)
-    notes = query.offset(skip).all()
-    return notes
+    result = await db.execute(query)
+    # Whole-entity selects come back as Note objects, column selects as rows
+    rows = result.scalars().all() if len(query.column_descriptions) == 1 else result.all()
+
+    next_cursor = pagination.next_cursor(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+async def _notes_list_etag(db: AsyncSession, user_id: str, request: Request) -> str:
+    # Cheap per-user aggregate: any insert/update/delete moves at least one of
+    # count / max(updated_at) / sum(version). Query params are part of the key.
+    result = await db.execute(
+        select(
+            func.count(models.Note.id),
+            func.max(models.Note.updated_at),
+            func.sum(models.Note.version),
+        ).where(models.Note.user_id == user_id)
+    )
+    count, last_updated, version_sum = result.one()
+    return http_cache.make_etag(
+        request.url.path, str(request.query_params), user_id, count, last_updated, version_sum
+    )
 
 
-@app.get("/api/notes/{note_id}", response_model=schemas.Note)
-def read_note(
-    note_id: str,
+def _set_cache_headers(response: Response, etag: str):
+    response.headers.update(http_cache.cache_headers(etag))
+
+
+@app.get("/api/notes", response_model=List[schemas.Note])
+async def read_notes(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = None,
+    cursor: Optional[str] = None,
+    folder_id: str = None,
+    q: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(utils.get_any_user_async),
+):
+    etag = await _notes_list_etag(db, current_user.id, request)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag)
+    _set_cache_headers(response, etag)
+
+    query = _notes_query(current_user.id, folder_id, q)
+    return await _paginate(db, query, response, skip, limit, cursor)
+
+
+@app.get("/api/notes/summary", response_model=List[schemas.NoteSummary])
+async def read_notes_summary(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = None,
+    cursor: Optional[str] = None,
+    folder_id: str = None,
+    q: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(utils.get_any_user_async),
+):
+    """
+    Same filters as GET /api/notes, but selects only metadata columns at the
+    SQL level so note bodies are never read or serialized.
+    """
+    etag = await _notes_list_etag(db, current_user.id, request)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag)
+    _set_cache_headers(response, etag)
+
+    query = _notes_query(current_user.id, folder_id, q, *NOTE_SUMMARY_COLUMNS)
+    return await _paginate(db, query, response, skip, limit, cursor)
+
+
+@app.get("/api/search", response_model=List[schemas.SearchHit])
+def search_notes(
+    q: str,
+    limit: int = 20,
+    folder_id: Optional[str] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(utils.get_any_user),
 ):
-    db_note = (
-        db.query(models.Note)
-        .filter(models.Note.id == note_id, models.Note.user_id == current_user.id)
-        .first()
+    """
+    Ranked full-text search over note titles and content (FTS5 on SQLite,
+    tsvector on PostgreSQL) with highlighted snippets.
+    """
+    limit = max(1, min(limit, 100))
+    return search.search_notes(db, current_user.id, q, limit=limit, folder_id=folder_id)
+
+
+def _note_etag(note_id: str, version: int, updated_at) -> str:
+    # updated_at covers changes that don't bump version (e.g. share toggle)
+    return http_cache.make_etag("note", note_id, version, updated_at)
+
+
+@app.get("/api/notes/{note_id}", response_model=schemas.Note)
+async def read_note(
+    note_id: str,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(utils.get_any_user_async),
+):
+    if request.headers.get("if-none-match"):
+        # Revalidation: compare against metadata only, never load content
+        result = await db.execute(
+            select(models.Note.id, models.Note.version, models.Note.updated_at).where(
+                models.Note.id == note_id, models.Note.user_id == current_user.id
+            )
+        )
+        meta = result.first()
+        if meta is None:
+            raise HTTPException(status_code=404, detail="Note not found")
+        etag = _note_etag(meta.id, meta.version, meta.updated_at)
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag)
+
+    db_note = await db.scalar(
+        select(models.Note).where(models.Note.id == note_id, models.Note.user_id == current_user.id)
     )
     if db_note is None:
         raise HTTPException(status_code=404, detail="Note not found")
+    _set_cache_headers(response, _note_etag(db_note.id, db_note.version, db_note.updated_at))
     return db_note
 
 
+async def _rendered_note(db: AsyncSession, note_id: str, version: int, updated_at) -> render.CachedRender:
+    """Sanitized HTML for a note version; content is loaded only on a cache miss."""
+    cached = render.html_cache.get(note_id, version, updated_at)
+    if cached is not None:
+        return cached
+    note = (
+        await db.execute(
+            select(models.Note.content, models.Note.version, models.Note.updated_at).where(
+                models.Note.id == note_id
+            )
+        )
+    ).first()
+    if note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    # Original widths let the renderer offer resized variants of uploads
+    image_widths = {}
+    refs = render.upload_refs(note.content)
+    if refs:
+        rows = await db.execute(
+            select(models.Blob.user_id, models.Blob.sha256, models.Blob.width).where(
+                models.Blob.sha256.in_({sha256 for _, sha256 in refs})
+            )
+        )
+        image_widths = {(row.user_id, row.sha256): row.width for row in rows if (row.user_id, row.sha256) in refs}
+    # Render with the values read alongside the content so they always match
+    return await run_in_threadpool(
+        render.note_html, note_id, note.version, note.updated_at, note.content, image_widths
+    )
+
+
+@app.get("/api/notes/{note_id}/html", response_class=HTMLResponse)
+async def read_note_html(
+    note_id: str,
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(utils.get_any_user_async),
+):
+    """The note's markdown rendered to a sanitized HTML fragment."""
+    meta = (
+        await db.execute(
+            select(models.Note.id, models.Note.version, models.Note.updated_at).where(
+                models.Note.id == note_id, models.Note.user_id == current_user.id
+            )
+        )
+    ).first()
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    rendered = await _rendered_note(db, meta.id, meta.version, meta.updated_at)
+    if http_cache.etag_matches(request, rendered.etag):
+        return http_cache.not_modified(rendered.etag)
+    headers = http_cache.cache_headers(rendered.etag)
+    headers["X-Note-Version"] = str(rendered.version)
+    return HTMLResponse(content=rendered.body, headers=headers)
+
+
 @app.put("/api/notes/{note_id}", response_model=schemas.Note)
-def update_note(
+async def update_note(
     note_id: str,
     note: schemas.NoteUpdate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(utils.get_any_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(utils.get_any_user_async),
 ):
-    # Check if note exists
-    db_note = (
-        db.query(models.Note)
-        .filter(models.Note.id == note_id, models.Note.user_id == current_user.id)
-        .first()
+    if note.patches is not None:
+        if note.content is not None:
+            raise HTTPException(status_code=400, detail="Send either content or patches")
+        if note.version is None:
+            raise HTTPException(status_code=400, detail="Patches require a base version")
+
+    # Check if note exists (row-locked when patching so the base can't move)
+    query = select(models.Note).where(
+        models.Note.id == note_id, models.Note.user_id == current_user.id
     )
+    if note.patches is not None:
+        query = query.with_for_update()
+    db_note = await db.scalar(query)
 
     update_data = note.dict(exclude_unset=True)
 
     # Validate folder_id if present
     if "folder_id" in update_data and update_data["folder_id"] is not None:
-        folder = (
-            db.query(models.Folder)
-            .filter(
+        folder = await db.scalar(
+            select(models.Folder.id).where(
                 models.Folder.id == update_data["folder_id"],
                 models.Folder.user_id == current_user.id,
             )
-            .first()
         )
         if not folder:
             raise HTTPException(status_code=400, detail="Invalid folder")
 
+    if db_note is None and note.patches is not None:
+        # Nothing to patch against; client should resend the full content
+        raise HTTPException(status_code=404, detail="Note not found")
+
     if db_note is None:
         # Not found? Create it! (Upsert for Sync)
         # We must allow creating with a specific ID to keep sync consistent
@@ -547,6 +899,7 @@ def update_note(
             is_pinned=update_data.get("is_pinned", False),
         )
         db.add(db_note)
+        await db.run_sync(sync.clear_tombstones, current_user.id, "note", [note_id])
         # Note: In postgres, we might need to reset sequence after manual insert,
         # but for simple sync recovery this should work. Validating ID collision handled by transaction.
     else:
@@ -568,6 +921,16 @@ def update_note(
         if "content" in update_data:
             db_note.content = update_data["content"]
 
+        if note.patches is not None:
+            try:
+                patched = patch.apply_text_edits(db_note.content, note.patches)
+            except patch.PatchError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid patch: {e}")
+            if note.checksum and patch.content_checksum(patched) != note.checksum.lower():
+                print(f"Conflict: Note {note_id} patch checksum mismatch")
+                raise HTTPException(status_code=409, detail="Conflict: Checksum mismatch")
+            db_note.content = patched
+
         if "folder_id" in update_data:
             db_note.folder_id = update_data["folder_id"]
 
@@ -576,9 +939,10 @@ def update_note(
 
         # Increment Version on successful update
         db_note.version += 1
+        share.page_cache.invalidate(db_note.share_id)
 
-    db.commit()
-    db.refresh(db_note)
+    await db.commit()
+    await db.refresh(db_note)
     return db_note
 
 
@@ -596,32 +960,111 @@ def delete_note(
     if db_note is None:
         raise HTTPException(status_code=404, detail="Note not found")
 
+    share_id = db_note.share_id
     db.delete(db_note)
+    sync.record_tombstones(db, current_user.id, "note", [note_id])
     db.commit()
+    share.page_cache.invalidate(share_id)
+    render.html_cache.invalidate(note_id)
     return {"message": "Note deleted successfully"}
 
 
+# --- Delta Sync ---
+
+
+@app.get("/api/sync/changes", response_model=schemas.SyncChanges)
+def read_sync_changes(
+    since: Optional[str] = None,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(utils.get_any_user),
+):
+    """
+    Returns notes/folders created or updated since the cursor, plus ids
+    deleted since the cursor. Omit `since` for an initial full pull.
+    """
+    since_ts = sync.decode_cursor(since) if since else None
+    return sync.collect_changes(db, current_user.id, since_ts)
+
+
+@app.post("/api/sync/batch", response_model=schemas.SyncBatchResponse)
+def sync_batch(
+    batch: schemas.SyncBatchRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(utils.get_current_user),
+):
+    """
+    Applies an ordered list of queued create/update/delete/move operations in
+    one transaction and returns a result per operation.
+    """
+    from .config import SYNC_BATCH_MAX_OPS
+
+    if len(batch.operations) > SYNC_BATCH_MAX_OPS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many operations (max {SYNC_BATCH_MAX_OPS})",
+        )
+
+    # Cached HTML / share pages of the notes the batch touches, directly or
+    # through a folder delete
+    note_ids = [op.id for op in batch.operations if op.entity == "note"]
+    folder_ids = [op.id for op in batch.operations if op.entity == "folder" and op.op == "delete"]
+    cached = []
+    if note_ids or folder_ids:
+        cached = db.query(models.Note.id, models.Note.share_id).filter(
+            models.Note.user_id == current_user.id,
+            or_(models.Note.id.in_(note_ids), models.Note.folder_id.in_(folder_ids)),
+        ).all()
+
+    results = sync.apply_batch(db, current_user.id, batch.operations)
+    db.commit()
+    share.invalidate_notes(cached)
+    return {"results": results}
+
+
 # --- Backup & Restore ---
 
 
-@app.get("/api/backup", response_model=schemas.BackupData)
+@app.get(
+    "/api/backup",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "model": schemas.BackupData,
+            "description": "Backup file (attachment). Schema shown for format=json.",
+            "content": {media_type: {} for media_type in export.MEDIA_TYPES.values()},
+        },
+        400: {"description": "Unknown format or invalid since"},
+    },
+)
 def backup_data(
+    format: str = "json",
+    since: Optional[str] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(utils.get_current_user),
 ):
     """
-    Exports all folders and notes for the current user.
+    Exports folders and notes for the current user, streamed in batches.
+    `format`: json (default, restorable via POST /api/restore), ndjson
+    (POST /api/import), zip or tar.gz (manifest.json + one .md per note).
+    `since`: a timestamp or an earlier backup's `backup_id` for an
+    incremental backup (changed rows plus deletions).
     """
-    folders = (
-        db.query(models.Folder).filter(models.Folder.user_id == current_user.id).all()
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported backup format: {format}")
+    since_at = export.parse_since(since) if since else None
+
+    snapshot_at = export.snapshot_time(db)
+    kind = "incremental" if since_at else "backup"
+    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
+    return StreamingResponse(
+        export.stream_backup(db, current_user.id, format, since=since_at, snapshot_at=snapshot_at),
+        media_type=export.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="shynote_{kind}_{timestamp}.{format}"',
+            "Cache-Control": "no-store",
+            "X-Backup-Id": sync.encode_cursor(snapshot_at),
+        },
     )
-    notes = db.query(models.Note).filter(models.Note.user_id == current_user.id).all()
-
-    return {
-        "folders": folders,
-        "notes": notes,
-        "backup_user_id": current_user.id  # Track who created this backup
-    }
 
 
 @app.post("/api/restore")
@@ -631,7 +1074,7 @@ def restore_data(
     current_user: models.User = Depends(utils.get_current_user),
 ):
     """
-    Restores folders and notes from a backup file using upsert logic.
+    Restores folders and notes from a backup file using batched upserts.
     Only allows restoring backups created by the same user.
     Idempotent: Safe to call multiple times with same data.
     """
@@ -643,99 +1086,45 @@ def restore_data(
             detail="This backup was created by another user and cannot be restored."
         )
 
-    # Track seen IDs to handle duplicates within the backup file itself
-    seen_folder_ids = set()
-    seen_note_ids = set()
-
-    folders_added = 0
-    folders_updated = 0
+    return restore.restore_backup(db, current_user.id, backup)
 
-    for folder_data in backup.folders:
-        # Skip duplicates within the backup file
-        if folder_data.id in seen_folder_ids:
-            continue
-        seen_folder_ids.add(folder_data.id)
 
-        existing = (
-            db.query(models.Folder)
-            .filter(
-                models.Folder.id == folder_data.id,
-                models.Folder.user_id == current_user.id,
-            )
-            .first()
-        )
-
-        if existing:
-            existing.name = folder_data.name
-            folders_updated += 1
-        else:
-            new_folder = models.Folder(
-                id=folder_data.id, name=folder_data.name, user_id=current_user.id
-            )
-            db.add(new_folder)
-            folders_added += 1
-
-    # Flush and commit folders before restoring notes
-    # This ensures folder IDs are visible when restoring notes
-    db.flush()
-    db.commit()
-
-    notes_added = 0
-    notes_updated = 0
+@app.post("/api/import")
+async def import_data(
+    request: Request,
+    import_id: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(utils.get_current_user_async),
+):
+    """
+    Streaming restore of an NDJSON backup (GET /api/backup?format=ndjson).
+    Body: raw NDJSON, or multipart/form-data with a `file` field; either may
+    be gzip-compressed. Records are upserted and committed in batches, so
+    progress is visible at GET /api/import/{import_id} while it runs.
+    """
+    progress = importer.start_import(import_id or utils.uuid7(), current_user.id)
 
-    for note_data in backup.notes:
-        # Skip duplicates within the backup file
-        if note_data.id in seen_note_ids:
-            continue
-        seen_note_ids.add(note_data.id)
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        async with request.form() as form:
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                progress.finish(error="Missing file field")
+                raise HTTPException(status_code=400, detail="Missing file field")
+            return await importer.run_import(db, current_user.id, importer.iter_upload(upload), progress)
 
-        existing = (
-            db.query(models.Note)
-            .filter(
-                models.Note.id == note_data.id, models.Note.user_id == current_user.id
-            )
-            .first()
-        )
+    return await importer.run_import(db, current_user.id, request.stream(), progress)
 
-        folder_id = note_data.folder_id
-        # Note: folder_id is preserved as-is since folders are already restored above
-
-        if existing:
-            existing.title = note_data.title
-            existing.content = note_data.content
-            existing.folder_id = folder_id
-            existing.updated_at = note_data.updated_at
-            existing.is_pinned = note_data.is_pinned
-            existing.is_shared = note_data.is_shared
-            existing.share_id = note_data.share_id
-            existing.version = note_data.version
-            notes_updated += 1
-        else:
-            new_note = models.Note(
-                id=note_data.id,
-                title=note_data.title,
-                content=note_data.content,
-                folder_id=folder_id,
-                user_id=current_user.id,
-                created_at=note_data.created_at,
-                updated_at=note_data.updated_at,
-                is_pinned=note_data.is_pinned,
-                is_shared=note_data.is_shared,
-                share_id=note_data.share_id,
-                version=note_data.version,
-            )
-            db.add(new_note)
-            notes_added += 1
 
-    db.commit()
+@app.get("/api/import/{import_id}")
+async def read_import_progress(
+    import_id: str,
+    current_user: models.User = Depends(utils.get_current_user_async),
+):
+    progress = importer.get_progress(import_id, current_user.id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return progress.to_dict()
 
-    return {
-        "message": "Restore successful",
-        "folders_added": folders_added,
-        "folders_updated": folders_updated,
-        "notes_added": notes_added,
-        "notes_updated": notes_updated,
-    }
 
 @app.delete("/api/reset")
 def reset_account(
@@ -745,12 +1134,25 @@ def reset_account(
     """
     NUCLEAR OPTION: Deletes ALL folders and notes for the current user.
     """
+    # Record deletions so other devices drop their copies on next delta sync
+    notes = db.query(models.Note.id, models.Note.share_id).filter(models.Note.user_id == current_user.id).all()
+    note_ids = [row.id for row in notes]
+    folder_ids = [
+        row.id
+        for row in db.query(models.Folder.id).filter(
+            models.Folder.user_id == current_user.id
+        )
+    ]
+    sync.record_tombstones(db, current_user.id, "note", note_ids)
+    sync.record_tombstones(db, current_user.id, "folder", folder_ids)
+
     # Delete notes first (foreign key constraint might not exist but logical order)
     db.query(models.Note).filter(models.Note.user_id == current_user.id).delete()
     # Delete folders
     db.query(models.Folder).filter(models.Folder.user_id == current_user.id).delete()
 
     db.commit()
+    share.invalidate_notes(notes)
     return {"message": "Account data reset successfully"}
 
 
@@ -789,89 +1191,157 @@ def share_note_toggle(
 
     db.commit()
     db.refresh(db_note)
+    share.page_cache.invalidate(db_note.share_id)
     return {"is_shared": db_note.is_shared, "share_id": db_note.share_id}
 
 
 @app.get("/share/{share_id}")
-def view_shared_note(share_id: str, db: Session = Depends(database.get_db)):
-    note = (
-        db.query(models.Note)
-        .filter(models.Note.share_id == share_id, models.Note.is_shared == True)
-        .first()
-    )
-
-    if not note:
-        raise HTTPException(status_code=404, detail="Shared note not found")
-
-    # Return simple HTML for viewing
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{note.title} - SHYNOTE </title>
-        <script src="https://cdn.tailwindcss.com"></script>
-        <script src="https://cdn.jsdelivr.net/npm/marked@4.3.0/marked.min.js"></script>
-        <script src="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.9.0/highlight.min.js"></script>
-        <link href='//spoqa.github.io/spoqa-han-sans/css/SpoqaHanSansNeo.css' rel='stylesheet' type='text/css'>
-        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/github-markdown-css/5.2.0/github-markdown-light.min.css">
-        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.9.0/styles/github.min.css">
-        <link rel="stylesheet" href="/static/style.css?v=7">
-        <style>
-            body {{ font-family: 'Spoqa Han Sans Neo', 'Inter', sans-serif; background-color: #ffffff; }}
-            .markdown-body {{ 
-                box-sizing: border-box; 
-                min-width: 200px; 
-                max-width: 980px; 
-                margin: 0 auto; 
-                padding: 45px; 
-                font-size: 16px !important;
-            }}
-            @media (max-width: 767px) {{ .markdown-body {{ padding: 15px; }} }}
-        </style>
-    </head>
-    <body>
-        <div class="max-w-4xl mx-auto py-10 px-4">
-            <h1 class="text-3xl font-bold text-gray-900 mb-2" style="font-family: 'Spoqa Han Sans Neo', sans-serif;">{note.title}</h1>
-            <p class="text-xs text-gray-400 mb-8 font-mono">Shared via SHYNOTE</p>
-            <div id="content" class="markdown-body shadow-none hidden">{note.content}</div>
-            <div id="preview" class="markdown-body"></div>
-        </div>
-        <script>
-            const content = document.getElementById('content').innerText;
-            document.getElementById('preview').innerHTML = marked.parse(content);
-            hljs.highlightAll();
-        </script>
-    </body>
-    </html>
-    """
-    from fastapi.responses import HTMLResponse
+async def view_shared_note(
+    share_id: str,
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    # Hot path: a page rendered or revalidated within the TTL needs no query
+    page = share.page_cache.get_fresh(share_id)
+    if page is None:
+        meta = (
+            await db.execute(
+                select(
+                    models.Note.id, models.Note.title, models.Note.version, models.Note.updated_at
+                ).where(models.Note.share_id == share_id, models.Note.is_shared == True)
+            )
+        ).first()
+        if meta is None:
+            share.page_cache.invalidate(share_id)
+            raise HTTPException(status_code=404, detail="Shared note not found")
+
+        page = share.page_cache.get(share_id, meta.version, meta.updated_at)
+        if page is None:
+            rendered = await _rendered_note(db, meta.id, meta.version, meta.updated_at)
+            page = share.page_cache.put(
+                share_id, rendered.version, rendered.updated_at, share.render_page(meta.title, rendered.body)
+            )
 
-    return HTMLResponse(content=html_content, status_code=200)
+    if http_cache.etag_matches(request, page.etag):
+        return http_cache.not_modified(page.etag, share.CACHE_CONTROL)
+    return HTMLResponse(content=page.body, headers=http_cache.cache_headers(page.etag, share.CACHE_CONTROL))
 
 
 @app.post("/api/upload")
 async def upload_image(
-    file: UploadFile = File(...),
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
     current_user: models.User = Depends(utils.get_current_user),
 ):
-    # Validate mime type
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Only images allowed")
-
+    """
+    Multipart image upload (`file` field), at most UPLOAD_MAX_BYTES.
+    Identical bytes uploaded again by the same user return the stored URL.
+    Resized WebP variants are generated after the response.
+    """
+    upload = await uploads.receive_image(request)
     try:
-        content = await file.read()
-        url = storage_service.upload_file(
-            file_content=content,
-            filename=file.filename,
-            content_type=file.content_type,
-            user_id=current_user.id,
+        # Hashing and the storage client block; keep them off the event loop
+        result = await run_in_threadpool(
+            uploads.store_image,
+            db,
+            storage_service,
+            current_user.id,
+            upload.file,
+            upload.content_type,
         )
-        return {"url": url}
+        if uploads.needs_variants(result, upload.content_type):
+            # The worker reads the stored original itself
+            background_tasks.add_task(
+                uploads.generate_variants,
+                database.SessionLocal,
+                storage_service,
+                current_user.id,
+                result,
+            )
+        return result
     except Exception as e:
         print(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await upload.close()
+
+
+@app.get("/img/{user_id}/{sha256}")
+def read_image(
+    user_id: str,
+    sha256: str,
+    w: Optional[int] = None,
+    db: Session = Depends(database.get_db),
+):
+    """
+    Redirects to the smallest stored variant at least `w` pixels wide (the
+    original without `w` or when none is big enough / generated yet).
+    """
+    blob = (
+        db.query(models.Blob.path, models.Blob.variants)
+        .filter(models.Blob.user_id == user_id, models.Blob.sha256 == sha256)
+        .first()
+    )
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = images.pick_variant(blob.path, blob.variants, w)
+    # Variants may still be generating: only cache the answer briefly until they exist
+    max_age = 86400 if blob.variants is not None or not w else 60
+    return RedirectResponse(
+        storage_service.public_url(path),
+        status_code=302,
+        headers={"Cache-Control": f"public, max-age={max_age}"},
+    )
+
+
+# Object paths are content-addressed, so files never change in place
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _stored_file_type(db: Session, path: str) -> str:
+    # Always the type recorded at upload (whitelisted), never one guessed
+    # from the object name: uploads/{user_id}/{sha256}/{name}
+    parts = path.split("/")
+    if len(parts) == 4 and parts[0] == "uploads":
+        blob = (
+            db.query(models.Blob.path, models.Blob.content_type, models.Blob.variants)
+            .filter(models.Blob.user_id == parts[1], models.Blob.sha256 == parts[2])
+            .first()
+        )
+        if blob is not None:
+            if path == blob.path:
+                return uploads.stored_type(blob.content_type)
+            if any(path == images.variant_path(blob.path, w) for w in images.parse_variants(blob.variants)):
+                return "image/webp"
+    return uploads.OPAQUE_TYPE
+
+
+@app.api_route("/files/{path:path}", methods=["GET", "HEAD"])
+def read_stored_file(path: str, request: Request, db: Session = Depends(database.get_db)):
+    """
+    Files of the local storage backend, with Range and conditional GET.
+    Served from the app's origin, so the stored type is enforced (nosniff),
+    active content is sandboxed and anything but raster images is a download.
+    """
+    if not isinstance(storage_service, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        full_path, stat = storage_service.stat(path)
+    except StorageNotFound:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    etag = http_cache.make_etag("file", path, stat.st_size, stat.st_mtime_ns)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, IMMUTABLE)
+    media_type = _stored_file_type(db, path)
+    headers = http_cache.cache_headers(etag, IMMUTABLE)
+    headers["X-Content-Type-Options"] = "nosniff"
+    headers["Content-Security-Policy"] = "sandbox"
+    if media_type not in uploads.RASTER_TYPES:
+        headers["Content-Disposition"] = "attachment"
+    # FileResponse answers Range requests with 206 from the same headers
+    return FileResponse(full_path, stat_result=stat, media_type=media_type, headers=headers)
 
 
 # Vercel will look for 'app' by default for ASGI.
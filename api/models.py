@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -24,6 +24,9 @@ class Folder(Base):
     id = Column(String, primary_key=True, index=True)
     name = Column(String)
     user_id = Column(String, ForeignKey("users.id"), index=True)
+    # default as well as server_default: a column added to an existing SQLite
+    # file has no server default (see database.ensure_sqlite_schema)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), server_default=func.now())
     
     user = relationship("User", back_populates="folders")
     notes = relationship("Note", back_populates="folder", cascade="all, delete-orphan")
@@ -37,7 +40,12 @@ class Note(Base):
     folder_id = Column(String, ForeignKey("folders.id"), nullable=True, index=True)
     user_id = Column(String, ForeignKey("users.id"), index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+    # Python-side defaults here and below: the DDL default of a table created
+    # by an older release is still CURRENT_TIMESTAMP on SQLite
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), server_default=func.now())
+    # Server-side change stamp for delta sync / incremental backups. Unlike
+    # updated_at it is never taken from a restored backup or import.
+    changed_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), server_default=func.now())
     version = Column(Integer, default=1, server_default="1")
     
     user = relationship("User", back_populates="notes")
@@ -47,3 +55,44 @@ class Note(Base):
     share_id = Column(String, unique=True, index=True, nullable=True)
     is_shared = Column(Boolean, default=False)
     is_pinned = Column(Boolean, default=False)
+
+    __table_args__ = (
+        # Keyset pagination: WHERE user_id = ? ORDER BY updated_at DESC, id DESC
+        Index("ix_notes_user_updated_id", "user_id", "updated_at", "id"),
+        # Delta sync: WHERE user_id = ? AND changed_at >= ?
+        Index("ix_notes_user_changed_at", "user_id", "changed_at"),
+    )
+
+class Tombstone(Base):
+    """Deletion marker so delta sync can report hard-deleted notes/folders."""
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    entity_type = Column(String) # 'note' | 'folder'
+    entity_id = Column(String, index=True)
+    deleted_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_tombstones_user_deleted_at", "user_id", "deleted_at"),
+    )
+
+class Blob(Base):
+    """Content-addressed index of uploaded files: one stored object per user and SHA-256."""
+    __tablename__ = "blobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    sha256 = Column(String(64))
+    path = Column(String) # storage object path
+    size = Column(Integer)
+    content_type = Column(String)
+    width = Column(Integer, nullable=True) # pixels, when decodable
+    height = Column(Integer, nullable=True)
+    variants = Column(String, nullable=True) # stored WebP widths, e.g. "320,640"; NULL until generated
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), nullable=True) # last dedup hit; protects it from GC
+
+    __table_args__ = (
+        Index("ix_blobs_user_sha256", "user_id", "sha256", unique=True),
+    )
@@ -0,0 +1,49 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+from . import models
+
+# Keyset (cursor) pagination for note listings ordered by (updated_at, id) desc.
+# Each page is a range scan on ix_notes_user_updated_id no matter how deep it
+# is, and concurrent edits can't shift rows between pages. The helpers accept
+# both legacy Query objects and 2.0 select() statements.
+
+
+def encode_cursor(updated_at: datetime, note_id: str) -> str:
+    raw = json.dumps([updated_at.isoformat(), note_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        updated_at, note_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(updated_at), str(note_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def order_notes(query):
+    return query.order_by(models.Note.updated_at.desc(), models.Note.id.desc())
+
+
+def apply_cursor(query, cursor: str):
+    updated_at, note_id = decode_cursor(cursor)
+    # The bare column against a bound value, so the index serves the range.
+    # On SQLite the bind is rendered in the stored text format (see
+    # api/database.py: now() is stamped in that format too).
+    return query.filter(tuple_(models.Note.updated_at, models.Note.id) < tuple_(updated_at, note_id))
+
+
+def next_cursor(rows: list, limit: Optional[int]) -> Optional[str]:
+    """Cursor for the page after `rows`, or None when this is the last page."""
+    if not limit or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last.updated_at, last.id)
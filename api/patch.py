@@ -0,0 +1,36 @@
+import hashlib
+from typing import Iterable
+
+from . import schemas
+
+# Text patches for PUT /api/notes/{id}.
+#
+# Offsets/lengths are UTF-16 code units, the same unit CodeMirror (and JS
+# strings) use for document positions. Edits apply in order, each against the
+# result of the previous one; emit them end-to-start to use base positions.
+
+
+class PatchError(ValueError):
+    pass
+
+
+def apply_text_edits(content: str, edits: Iterable[schemas.TextEdit]) -> str:
+    buf = (content or "").encode("utf-16-le")
+    for edit in edits:
+        start = edit.offset * 2
+        end = start + edit.delete * 2
+        if end > len(buf):
+            raise PatchError(
+                f"Edit out of range (offset={edit.offset}, delete={edit.delete}, length={len(buf) // 2})"
+            )
+        buf = buf[:start] + edit.insert.encode("utf-16-le") + buf[end:]
+    try:
+        # strict decode rejects edits that split a surrogate pair
+        return buf.decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise PatchError("Edit splits a surrogate pair")
+
+
+def content_checksum(content: str) -> str:
+    """sha256 hex digest of the UTF-8 encoded content."""
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
@@ -0,0 +1,281 @@
+import html
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+import nh3
+from markdown_it import MarkdownIt
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+
+from . import http_cache, images
+from .config import RENDER_CACHE_MAX_BYTES, RENDER_HIGHLIGHT_MAX_BYTES, RENDER_MARKDOWN_MAX_BYTES
+
+# Server-side markdown -> HTML for shared pages and GET /api/notes/{id}/html.
+#
+# markdown-it (CommonMark + GFM tables/strikethrough/autolinks) renders, Pygments
+# highlights fenced code with an explicit language, and nh3 sanitizes the
+# result, so raw HTML in a note can't inject script or event handlers.
+#
+# Cold cost stays bounded for large notes: parsing is linear, lexers are never
+# guessed, highlighting stops after RENDER_HIGHLIGHT_MAX_BYTES of code per
+# document (later blocks render as plain escaped code), and notes over
+# RENDER_MARKDOWN_MAX_BYTES are shown as preformatted text. Each version is
+# rendered once: concurrent misses for the same note wait for the first.
+
+# linkify turns bare URLs into links like the client's marked (GFM) does;
+# it needs linkify-it-py
+_md = MarkdownIt("commonmark", {"html": True, "linkify": True}).enable(["table", "strikethrough", "linkify"])
+_formatter = HtmlFormatter(nowrap=True)
+_budget = threading.local()
+
+# Pygments classes on the highlight spans, plus what markdown-it emits
+_ALLOWED_ATTRIBUTES = {
+    **nh3.ALLOWED_ATTRIBUTES,
+    "code": {"class"},
+    "pre": {"class"},
+    "span": {"class"},
+    "ol": {"start"},
+}
+_URL_SCHEMES = {"http", "https", "mailto"}
+
+# Content-addressed uploads (api/uploads.py): .../uploads/{user_id}/{sha256}/{file}
+_IMG_TAG = re.compile(r"<img\b([^>]*)>")
+_UPLOAD_SRC = re.compile(r'\ssrc="([^"]*/uploads/([^/"]+)/([0-9a-f]{64})/[^"]*)"')
+_UPLOAD_REF = re.compile(r"/uploads/([^/\s\"'()<>]+)/([0-9a-f]{64})/")
+# Notes are laid out at most 980px wide (share page .markdown-body)
+IMG_SIZES = "(max-width: 980px) 100vw, 980px"
+
+# Served alongside rendered notes (scoped so it can't leak into the app)
+HIGHLIGHT_CSS = HtmlFormatter(style="default").get_style_defs(".markdown-body pre code")
+
+
+@lru_cache(maxsize=128)
+def _lexer(lang: str):
+    try:
+        return get_lexer_by_name(lang, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return None
+
+
+def _highlight(code: str, lang: str, attrs) -> str:
+    # "" tells markdown-it to fall back to escaped, unhighlighted code
+    remaining = getattr(_budget, "remaining", 0)
+    if not lang or len(code) > remaining:
+        return ""
+    lexer = _lexer(lang.split()[0].lower())
+    if lexer is None:
+        return ""
+    _budget.remaining = remaining - len(code)
+    return highlight(code, lexer, _formatter)
+
+
+_md.options["highlight"] = _highlight
+
+
+def upload_refs(content: Optional[str]) -> set:
+    """(user_id, sha256) of the content-addressed uploads a note links to."""
+    return set(_UPLOAD_REF.findall(content or ""))
+
+
+def _responsive_img(match, image_widths: dict) -> str:
+    # Lazy-load every image. Uploads of known width also list the variant
+    # sizes below it (GET /img redirects; the original until they exist)
+    attrs = match.group(1).rstrip("/").rstrip()
+    extra = ' loading="lazy" decoding="async"'
+    upload = _UPLOAD_SRC.search(attrs)
+    if upload is not None and images.enabled():
+        src, user_id, sha256 = upload.groups()
+        width = image_widths.get((user_id, sha256))
+        if width:
+            base = f"/img/{user_id}/{sha256}"
+            candidates = [f"{base}?w={w} {w}w" for w in sorted(images.IMAGE_VARIANT_WIDTHS) if w < width]
+            if candidates:
+                candidates.append(f"{src} {width}w")
+                extra += f' srcset="{", ".join(candidates)}" sizes="{IMG_SIZES}"'
+    return f"<img{attrs}{extra}>"
+
+
+def render_markdown(
+    content: Optional[str],
+    highlight_budget: int = RENDER_HIGHLIGHT_MAX_BYTES,
+    image_widths: Optional[dict] = None,
+) -> str:
+    """
+    Sanitized HTML fragment for a note's markdown. `image_widths` maps
+    upload_refs() entries to the original's pixel width.
+    """
+    content = content or ""
+    if len(content) > RENDER_MARKDOWN_MAX_BYTES:
+        return "<pre>" + html.escape(content, quote=False) + "</pre>"
+    _budget.remaining = highlight_budget
+    try:
+        raw = _md.render(content)
+    finally:
+        _budget.remaining = 0
+    clean = nh3.clean(raw, attributes=_ALLOWED_ATTRIBUTES, url_schemes=_URL_SCHEMES)
+    image_widths = image_widths or {}
+    return _IMG_TAG.sub(lambda match: _responsive_img(match, image_widths), clean)
+
+
+class CachedRender:
+    __slots__ = ("version", "updated_at", "etag", "body", "checked_at")
+
+    def __init__(self, version: int, updated_at: Optional[datetime], etag: str, body: bytes, checked_at: float):
+        self.version = version
+        self.updated_at = updated_at
+        self.etag = etag
+        self.body = body
+        self.checked_at = checked_at
+
+
+class RenderCache:
+    """
+    LRU of rendered bodies bounded by total bytes. One entry per key, valid
+    for a single (version, updated_at) of the note: version changes on edits,
+    updated_at also covers writes that don't bump it. `get_fresh` serves an
+    entry without that check for `ttl` seconds after it was last confirmed.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int = 64 * 1024 * 1024, ttl: float = 0.0):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> CachedRender
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get_fresh(self, key: str) -> Optional[CachedRender]:
+        """The cached entry if it was stored or revalidated within the TTL."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.checked_at >= self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get(self, key: str, version: int, updated_at: Optional[datetime]) -> Optional[CachedRender]:
+        """The cached entry if it matches the note's current version; restarts its TTL."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version or entry.updated_at != updated_at:
+                self.misses += 1
+                return None
+            entry.checked_at = time.monotonic()
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key: str, version: int, updated_at: Optional[datetime]) -> Optional[CachedRender]:
+        """Like `get`, without touching LRU order or counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version or entry.updated_at != updated_at:
+                return None
+            return entry
+
+    def put(self, key: str, version: int, updated_at: Optional[datetime], body: bytes) -> CachedRender:
+        entry = CachedRender(
+            version,
+            updated_at,
+            http_cache.make_etag(self.namespace, key, version, updated_at),
+            body,
+            time.monotonic(),
+        )
+        if not self.enabled or len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, key: Optional[str]):
+        if not key:
+            return
+        with self._lock:
+            if self._remove(key):
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: str) -> bool:
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry.body)
+        return True
+
+
+# Note HTML fragments keyed by note id, always checked against the row
+html_cache = RenderCache("note-html", max_bytes=RENDER_CACHE_MAX_BYTES)
+
+
+_render_locks = {}  # note_id -> [lock, waiters]
+_render_locks_guard = threading.Lock()
+
+
+def note_html(
+    note_id: str,
+    version: int,
+    updated_at: Optional[datetime],
+    content: Optional[str],
+    image_widths: Optional[dict] = None,
+) -> CachedRender:
+    """
+    Renders and caches this note version after an `html_cache.get` miss.
+    Blocking (large notes take a while): call it off the event loop.
+    """
+    with _render_locks_guard:
+        slot = _render_locks.setdefault(note_id, [threading.Lock(), 0])
+        slot[1] += 1
+    try:
+        with slot[0]:
+            # Another request may have rendered it while we waited
+            entry = html_cache.peek(note_id, version, updated_at)
+            if entry is None:
+                entry = html_cache.put(note_id, version, updated_at, render_markdown(content, image_widths=image_widths).encode())
+            return entry
+    finally:
+        with _render_locks_guard:
+            slot[1] -= 1
+            if not slot[1]:
+                del _render_locks[note_id]
@@ -0,0 +1,241 @@
+import time
+from typing import Iterable, List, Sequence, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+from . import models, schemas, share, sync
+from .config import RESTORE_BATCH_SIZE
+
+# Set-based restore.
+#
+# Existing ids are prefetched in chunks to classify rows (added / updated /
+# owned by another user), then rows are written with multi-row
+# INSERT ... ON CONFLICT (id) DO UPDATE statements, RESTORE_BATCH_SIZE rows
+# each. The DO UPDATE is guarded by user_id so another user's row with the
+# same id is never overwritten. Other backends fall back to Session.merge()
+# per row.
+#
+# Notes keep the backup's updated_at; changed_at is stamped now() on insert
+# and update alike, so restored rows show up in delta sync and incremental
+# backups taken since.
+#
+# A restored note can keep its (version, updated_at) while its content or
+# share state changes, so cached HTML and share pages are dropped explicitly
+# after the commit: the restored ids plus every share_id the user had before.
+#
+# SQLite uses the same ON CONFLICT form rather than INSERT OR REPLACE: REPLACE
+# deletes the old row without firing delete triggers, which would corrupt the
+# notes_fts index (see api/search.py).
+
+NOTE_UPDATE_COLUMNS = (
+    "title",
+    "content",
+    "folder_id",
+    "updated_at",
+    "is_pinned",
+    "is_shared",
+    "share_id",
+    "version",
+)
+
+
+# Dialects with INSERT ... ON CONFLICT; others take the ORM merge path
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _chunks(items: Sequence, size: int) -> Iterable[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _unique(items: Iterable) -> list:
+    # First occurrence wins, as in the original per-row restore
+    seen = {}
+    for item in items:
+        seen.setdefault(item.id, item)
+    return list(seen.values())
+
+
+def _owners(db: Session, model, ids: List[str], batch_size: int) -> dict:
+    """{id: user_id} for the ids that already exist, fetched in chunks."""
+    owners = {}
+    for chunk in _chunks(ids, batch_size):
+        owners.update(db.execute(select(model.id, model.user_id).where(model.id.in_(chunk))).all())
+    return owners
+
+
+def _upsert(db: Session, model, rows: List[dict], set_columns, batch_size: int):
+    table = model.__table__
+    # onupdate isn't applied by ON CONFLICT
+    stamps = [name for name in ("updated_at", "changed_at") if name not in set_columns and name in table.c]
+    insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is None:
+        _merge(db, model, rows, set_columns, stamps, batch_size)
+        return
+    for chunk in _chunks(rows, batch_size):
+        stmt = insert(table).values(list(chunk))
+        set_ = {name: stmt.excluded[name] for name in set_columns}
+        set_.update({name: func.now() for name in stamps})
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_=set_,
+                where=table.c.user_id == stmt.excluded.user_id,
+            )
+        )
+
+
+def _merge(db: Session, model, rows: List[dict], set_columns, stamps, batch_size: int):
+    # Generic backends: Session.merge() (SELECT by id, then INSERT or UPDATE)
+    # row by row, as restore worked before the bulk path. Rows were already
+    # classified, so none belongs to another user.
+    for chunk in _chunks(rows, batch_size):
+        for row in chunk:
+            merged = db.merge(model(**row, **{name: func.now() for name in stamps}))
+            # Written even when unchanged, so onupdate can't replace updated_at
+            for name in set_columns:
+                flag_modified(merged, name)
+        db.flush()
+
+
+def _classify(items: list, owners: dict, user_id: str):
+    mine = [item for item in items if owners.get(item.id, user_id) == user_id]
+    updated = sum(1 for item in mine if item.id in owners)
+    return mine, {"added": len(mine) - updated, "updated": updated, "skipped": len(items) - len(mine)}
+
+
+def upsert_folders(
+    db: Session, user_id: str, folders: Iterable[schemas.BackupFolder], batch_size: int = RESTORE_BATCH_SIZE
+) -> dict:
+    """Upserts folders for `user_id`. Returns added/updated/skipped counts. Caller commits."""
+    folders = _unique(folders)
+    owners = _owners(db, models.Folder, [f.id for f in folders], batch_size)
+    folders, counts = _classify(folders, owners, user_id)
+    _upsert(
+        db,
+        models.Folder,
+        [{"id": f.id, "name": f.name, "user_id": user_id} for f in folders],
+        ("name",),
+        batch_size,
+    )
+    for chunk in _chunks([f.id for f in folders], batch_size):
+        sync.clear_tombstones(db, user_id, "folder", chunk)
+    return counts
+
+
+def upsert_notes(
+    db: Session, user_id: str, notes: Iterable[schemas.BackupNote], batch_size: int = RESTORE_BATCH_SIZE
+) -> dict:
+    """Upserts notes for `user_id`. Returns added/updated/skipped counts. Caller commits."""
+    notes = _unique(notes)
+    owners = _owners(db, models.Note, [n.id for n in notes], batch_size)
+    notes, counts = _classify(notes, owners, user_id)
+    _upsert(
+        db,
+        models.Note,
+        [
+            {
+                "id": n.id,
+                "user_id": user_id,
+                "created_at": n.created_at,
+                **{name: getattr(n, name) for name in NOTE_UPDATE_COLUMNS},
+            }
+            for n in notes
+        ],
+        NOTE_UPDATE_COLUMNS,
+        batch_size,
+    )
+    for chunk in _chunks([n.id for n in notes], batch_size):
+        sync.clear_tombstones(db, user_id, "note", chunk)
+    return counts
+
+
+def shared_notes(db: Session, user_id: str) -> List[Tuple[str, str]]:
+    """(id, share_id) of the user's shared notes, read before a bulk write."""
+    return db.execute(
+        select(models.Note.id, models.Note.share_id).where(
+            models.Note.user_id == user_id, models.Note.share_id.is_not(None)
+        )
+    ).all()
+
+
+def _owned_ids(db: Session, model, user_id: str, ids, column=None) -> List[str]:
+    column = model.id if column is None else column
+    return list(
+        db.scalars(select(model.id).where(model.user_id == user_id, column.in_(list(ids))))
+    )
+
+
+def delete_notes(db: Session, user_id: str, note_ids: Iterable[str], batch_size: int = RESTORE_BATCH_SIZE) -> int:
+    """Deletes the user's notes among `note_ids` and tombstones them. Caller commits."""
+    deleted = 0
+    for chunk in _chunks(list(dict.fromkeys(note_ids)), batch_size):
+        ids = _owned_ids(db, models.Note, user_id, chunk)
+        if ids:
+            db.execute(delete(models.Note).where(models.Note.id.in_(ids)))
+            sync.record_tombstones(db, user_id, "note", ids)
+            deleted += len(ids)
+    return deleted
+
+
+def delete_folders(db: Session, user_id: str, folder_ids: Iterable[str], batch_size: int = RESTORE_BATCH_SIZE) -> dict:
+    """
+    Deletes the user's folders among `folder_ids` together with their notes
+    (the ORM cascade, done set-based) and tombstones both. Caller commits.
+    """
+    counts = {"folders": 0, "notes": 0}
+    for chunk in _chunks(list(dict.fromkeys(folder_ids)), batch_size):
+        ids = _owned_ids(db, models.Folder, user_id, chunk)
+        if not ids:
+            continue
+        note_ids = _owned_ids(db, models.Note, user_id, ids, column=models.Note.folder_id)
+        counts["notes"] += delete_notes(db, user_id, note_ids, batch_size)
+        db.execute(delete(models.Folder).where(models.Folder.id.in_(ids)))
+        sync.record_tombstones(db, user_id, "folder", ids)
+        counts["folders"] += len(ids)
+    return counts
+
+
+def restore_backup(
+    db: Session,
+    user_id: str,
+    backup: schemas.BackupData,
+    batch_size: int = RESTORE_BATCH_SIZE,
+) -> dict:
+    """Upserts the backup's folders then notes in one transaction. Commits."""
+    started = time.perf_counter()
+    cached = shared_notes(db, user_id)
+    folders = upsert_folders(db, user_id, backup.folders, batch_size)
+    folders_done = time.perf_counter()
+    notes = upsert_notes(db, user_id, backup.notes, batch_size)
+    # Incremental backups carry deletions; replaying them keeps a chain exact
+    notes["deleted"] = delete_notes(db, user_id, backup.deleted_note_ids, batch_size)
+    deleted = delete_folders(db, user_id, backup.deleted_folder_ids, batch_size)
+    folders["deleted"] = deleted["folders"]
+    notes["deleted"] += deleted["notes"]
+    notes_done = time.perf_counter()
+    db.commit()
+    finished = time.perf_counter()
+    share.invalidate_notes(cached)
+    share.invalidate_notes((n.id, n.share_id) for n in backup.notes)
+
+    return {
+        "message": "Restore successful",
+        "folders_added": folders["added"],
+        "folders_updated": folders["updated"],
+        "folders_skipped": folders["skipped"],
+        "notes_added": notes["added"],
+        "notes_updated": notes["updated"],
+        "notes_skipped": notes["skipped"],
+        "folders_deleted": folders["deleted"],
+        "notes_deleted": notes["deleted"],
+        "timing_ms": {
+            "folders": round((folders_done - started) * 1000, 1),
+            "notes": round((notes_done - folders_done) * 1000, 1),
+            "commit": round((finished - notes_done) * 1000, 1),
+            "total": round((finished - started) * 1000, 1),
+        },
+    }
@@ -63,12 +63,21 @@ class NoteCreate(NoteBase):
     id: Optional[str] = None  # Optional client-generated UUID
 
 
+class TextEdit(BaseModel):
+    offset: int = Field(ge=0)  # UTF-16 code units
+    delete: int = Field(default=0, ge=0)
+    insert: str = ""
+
+
 class NoteUpdate(BaseModel):
     title: Optional[str] = None
     content: Optional[str] = None
     folder_id: Optional[str] = None
     is_pinned: Optional[bool] = None
     version: Optional[int] = None  # For Optimistic Locking
+    # Patch mode: edits against `version` instead of the full `content`
+    patches: Optional[List[TextEdit]] = None
+    checksum: Optional[str] = None  # sha256 hex of the patched content (UTF-8)
 
 
 class Note(NoteBase):
@@ -85,6 +94,21 @@ class Note(NoteBase):
         from_attributes = True
 
 
+class NoteSummary(BaseModel):
+    """Lightweight listing projection (no `content`)."""
+    id: str
+    title: Optional[str] = None
+    folder_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: int = 1
+    is_pinned: bool = False
+    is_shared: bool = False
+
+    class Config:
+        from_attributes = True
+
+
 class FolderBase(BaseModel):
     name: str
 
@@ -106,6 +130,77 @@ class Folder(FolderBase):
         from_attributes = True
 
 
+class FolderTree(FolderBase):
+    """Folder with aggregate note stats; `notes` only when explicitly requested."""
+    id: str
+    user_id: str
+    updated_at: Optional[datetime] = None
+    note_count: int = 0
+    pinned_count: int = 0
+    last_updated_at: Optional[datetime] = None  # newest note in the folder
+    notes: Optional[List[Note]] = None
+
+
+class SearchHit(BaseModel):
+    id: str
+    title: Optional[str] = None
+    folder_id: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    rank: float = 0.0
+    title_highlight: str = ""  # HTML-escaped, matches wrapped in <mark>
+    snippet: str = ""  # HTML-escaped, matches wrapped in <mark>
+
+
+# --- Sync Schemas ---
+
+
+class SyncFolder(FolderBase):
+    id: str
+    user_id: str
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class SyncChanges(BaseModel):
+    notes: List[Note]
+    folders: List[SyncFolder]
+    deleted_note_ids: List[str] = []
+    deleted_folder_ids: List[str] = []
+    cursor: Optional[str] = None  # Pass back as `since` on the next pull
+
+
+class SyncOperation(BaseModel):
+    op: str  # 'create' | 'update' | 'delete' | 'move'
+    entity: str = "note"  # 'note' | 'folder'
+    id: str
+    version: Optional[int] = None  # Expected server version (notes only)
+    title: Optional[str] = None
+    content: Optional[str] = None
+    folder_id: Optional[str] = None
+    is_pinned: Optional[bool] = None
+    name: Optional[str] = None  # Folder name
+
+
+class SyncBatchRequest(BaseModel):
+    operations: List[SyncOperation]
+
+
+class SyncOperationResult(BaseModel):
+    id: str
+    entity: str
+    op: str
+    status: str  # 'ok' | 'conflict' | 'not_found' | 'error'
+    status_code: int
+    version: Optional[int] = None  # New version on ok, server version on conflict
+    detail: Optional[str] = None
+
+
+class SyncBatchResponse(BaseModel):
+    results: List[SyncOperationResult]
+
+
 # --- Backup & Restore Schemas ---
 
 
@@ -141,3 +236,7 @@ class BackupData(BaseModel):
     backup_version: int = 1
     created_at: datetime = Field(default_factory=datetime.utcnow)
     backup_user_id: Optional[str] = None  # Track who created this backup
+    backup_id: Optional[str] = None  # Pass as ?since= to get the next incremental backup
+    since: Optional[datetime] = None  # Set on incremental backups
+    deleted_note_ids: List[str] = []
+    deleted_folder_ids: List[str] = []
@@ -0,0 +1,219 @@
+import html
+import re
+from typing import List, Optional
+
+from sqlalchemy import literal, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Full-text search over note title + content.
+#
+# - SQLite: external-content FTS5 table `notes_fts` kept in sync by triggers.
+# - PostgreSQL: generated `notes.search_vector` tsvector column + GIN index.
+#
+# Both are maintained by the database itself, so every write path (API,
+# batch sync, restore, bulk deletes) keeps the index current. When neither is
+# available the search falls back to an unindexed LIKE scan.
+
+# Highlight sentinels: the snippet is HTML-escaped first, then these become <mark>.
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+_SQLITE_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        title, content,
+        content='notes', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, content)
+        VALUES ('delete', old.rowid, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF title, content ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, content)
+        VALUES ('delete', old.rowid, old.title, old.content);
+        INSERT INTO notes_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+    END
+    """,
+]
+
+# 'simple' config: no stemming/stop words, so Korean and English tokenise alike
+_POSTGRES_SETUP = [
+    """
+    ALTER TABLE notes ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(content, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_notes_search_vector ON notes USING GIN (search_vector)",
+]
+
+# Dialect names for which the full-text index was set up successfully
+_fts_dialects = set()
+
+
+def ensure_search_index(engine):
+    """Creates the FTS structures if missing. Safe to call on every startup."""
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                existed = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'")
+                ).first()
+                for stmt in _SQLITE_SETUP:
+                    conn.execute(text(stmt))
+                if not existed:
+                    # Index notes written before FTS was enabled
+                    conn.execute(text("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')"))
+            elif dialect == "postgresql":
+                for stmt in _POSTGRES_SETUP:
+                    conn.execute(text(stmt))
+            else:
+                return
+        _fts_dialects.add(dialect)
+    except Exception as e:
+        print(f"Full-text search unavailable, falling back to LIKE: {e}")
+
+
+def _tokens(q: str) -> List[str]:
+    return re.findall(r"\w+", q)
+
+
+def _render(fragment: Optional[str]) -> str:
+    return (
+        html.escape(fragment or "")
+        .replace(_MARK_START, "<mark>")
+        .replace(_MARK_END, "</mark>")
+    )
+
+
+def search_notes(
+    db: Session,
+    user_id: str,
+    q: str,
+    limit: int = 20,
+    folder_id: Optional[str] = None,
+) -> List[dict]:
+    """
+    Returns ranked hits (best first) with HTML-escaped, <mark>-highlighted
+    title and content snippets. Each token is prefix-matched.
+    """
+    tokens = _tokens(q)
+    if not tokens:
+        return []
+
+    dialect = db.get_bind().dialect.name
+    if dialect in _fts_dialects and dialect == "sqlite":
+        rows = _search_sqlite(db, user_id, tokens, limit, folder_id)
+    elif dialect in _fts_dialects and dialect == "postgresql":
+        rows = _search_postgres(db, user_id, tokens, limit, folder_id)
+    else:
+        rows = _search_like(db, user_id, tokens, limit, folder_id)
+
+    return [
+        {
+            "id": row.id,
+            "title": row.title,
+            "folder_id": row.folder_id,
+            "updated_at": row.updated_at,
+            "rank": float(row.rank or 0),
+            "title_highlight": _render(row.title_highlight),
+            "snippet": _render(row.snippet),
+        }
+        for row in rows
+    ]
+
+
+def _search_sqlite(db: Session, user_id: str, tokens: List[str], limit: int, folder_id: Optional[str]):
+    match = " ".join('"{}"*'.format(t.replace('"', '""')) for t in tokens)
+    folder_filter = "AND n.folder_id = :folder_id" if folder_id is not None else ""
+    sql = f"""
+        SELECT n.id, n.title, n.folder_id, n.updated_at,
+               -bm25(notes_fts, 10.0, 1.0) AS rank,
+               highlight(notes_fts, 0, :ms, :me) AS title_highlight,
+               snippet(notes_fts, 1, :ms, :me, '…', 24) AS snippet
+        FROM notes_fts
+        JOIN notes n ON n.rowid = notes_fts.rowid
+        WHERE notes_fts MATCH :match AND n.user_id = :user_id {folder_filter}
+        ORDER BY bm25(notes_fts, 10.0, 1.0)
+        LIMIT :limit
+    """
+    return db.execute(
+        text(sql),
+        {
+            "match": match,
+            "user_id": user_id,
+            "folder_id": folder_id,
+            "limit": limit,
+            "ms": _MARK_START,
+            "me": _MARK_END,
+        },
+    ).all()
+
+
+def _search_postgres(db: Session, user_id: str, tokens: List[str], limit: int, folder_id: Optional[str]):
+    tsquery = " & ".join("'{}':*".format(t.replace("'", "''")) for t in tokens)
+    folder_filter = "AND folder_id = :folder_id" if folder_id is not None else ""
+    # ts_headline is costly, so rank/limit first and highlight only the page
+    sql = f"""
+        WITH hits AS (
+            SELECT id, title, content, folder_id, updated_at,
+                   ts_rank_cd(search_vector, to_tsquery('simple', :tsquery)) AS rank
+            FROM notes
+            WHERE user_id = :user_id {folder_filter}
+              AND search_vector @@ to_tsquery('simple', :tsquery)
+            ORDER BY rank DESC
+            LIMIT :limit
+        )
+        SELECT id, title, folder_id, updated_at, rank,
+               ts_headline('simple', coalesce(title, ''), to_tsquery('simple', :tsquery),
+                           'StartSel=' || :ms || ', StopSel=' || :me || ', HighlightAll=true') AS title_highlight,
+               ts_headline('simple', coalesce(content, ''), to_tsquery('simple', :tsquery),
+                           'StartSel=' || :ms || ', StopSel=' || :me || ', MaxFragments=2, MaxWords=24, MinWords=8') AS snippet
+        FROM hits
+        ORDER BY rank DESC
+    """
+    return db.execute(
+        text(sql),
+        {
+            "tsquery": tsquery,
+            "user_id": user_id,
+            "folder_id": folder_id,
+            "limit": limit,
+            "ms": _MARK_START,
+            "me": _MARK_END,
+        },
+    ).all()
+
+
+def _search_like(db: Session, user_id: str, tokens: List[str], limit: int, folder_id: Optional[str]):
+    query = db.query(
+        models.Note.id,
+        models.Note.title,
+        models.Note.folder_id,
+        models.Note.updated_at,
+        literal(0.0).label("rank"),
+        models.Note.title.label("title_highlight"),
+        literal("").label("snippet"),
+    ).filter(models.Note.user_id == user_id)
+    if folder_id is not None:
+        query = query.filter(models.Note.folder_id == folder_id)
+    for token in tokens:
+        pattern = f"%{token}%"
+        query = query.filter(
+            models.Note.title.ilike(pattern) | models.Note.content.ilike(pattern)
+        )
+    return query.order_by(models.Note.updated_at.desc()).limit(limit).all()
@@ -0,0 +1,84 @@
+import html
+from typing import Iterable, Optional, Tuple
+
+from . import render
+from .config import (
+    SHARE_CACHE_MAX_BYTES,
+    SHARE_CACHE_MAX_AGE,
+    SHARE_CACHE_TTL_SECONDS,
+    SHARE_STALE_WHILE_REVALIDATE,
+)
+
+# Public /share/{share_id} pages.
+#
+# Pages are rendered on the server (api/render.py) and need no scripts.
+# They are cached in-process per share_id (render.RenderCache): version
+# changes on edits, and updated_at also covers writes that don't bump it
+# (share toggle, POST overwrite). For SHARE_CACHE_TTL_SECONDS after
+# a render or revalidation the page is served without touching the database;
+# after that a one-row metadata query confirms it (or misses and re-renders).
+#
+# Edits, deletes and unsharing through this process invalidate immediately;
+# so do bulk writes (sync batches, restore, import, reset), which can keep a
+# note's (version, updated_at) while changing it. Other workers converge
+# within the TTL. Bounded by total rendered bytes (LRU).
+
+# Shared caches (CDN, browser) may keep a page for max-age and serve it stale
+# while revalidating, so an unshare can take up to that long to propagate.
+CACHE_CONTROL = f"public, max-age={SHARE_CACHE_MAX_AGE}, stale-while-revalidate={SHARE_STALE_WHILE_REVALIDATE}"
+
+
+page_cache = render.RenderCache("share", max_bytes=SHARE_CACHE_MAX_BYTES, ttl=SHARE_CACHE_TTL_SECONDS)
+
+
+def invalidate_notes(notes: Iterable[Tuple[str, Optional[str]]]):
+    """Drops the cached HTML and share page of each (note_id, share_id). Call after commit."""
+    for note_id, share_id in notes:
+        render.html_cache.invalidate(note_id)
+        page_cache.invalidate(share_id)
+
+
+_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title} - SHYNOTE</title>
+    <link href='//spoqa.github.io/spoqa-han-sans/css/SpoqaHanSansNeo.css' rel='stylesheet' type='text/css'>
+    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/github-markdown-css/5.2.0/github-markdown-light.min.css">
+    <style>
+        body {{ font-family: 'Spoqa Han Sans Neo', 'Inter', sans-serif; background-color: #ffffff; margin: 0; }}
+        .page {{ max-width: 56rem; margin: 0 auto; padding: 2.5rem 1rem; }}
+        .page h1.title {{ font-size: 1.875rem; font-weight: 700; color: #111827; margin: 0 0 0.5rem; }}
+        .page .byline {{ font-size: 0.75rem; color: #9ca3af; margin: 0 0 2rem; font-family: monospace; }}
+        .markdown-body {{
+            box-sizing: border-box;
+            min-width: 200px;
+            max-width: 980px;
+            margin: 0 auto;
+            padding: 45px;
+            font-size: 16px !important;
+        }}
+        @media (max-width: 767px) {{ .markdown-body {{ padding: 15px; }} }}
+{highlight_css}
+    </style>
+</head>
+<body>
+    <div class="page">
+        <h1 class="title">{title}</h1>
+        <p class="byline">Shared via SHYNOTE</p>
+        <article class="markdown-body">{body}</article>
+    </div>
+</body>
+</html>
+"""
+
+
+_PAGE_HEAD, _PAGE_TAIL = _PAGE_TEMPLATE.split("{body}")
+_PAGE_TAIL = _PAGE_TAIL.encode()
+
+
+def render_page(title: Optional[str], body: bytes) -> bytes:
+    """Wraps a sanitized note fragment (render.note_html) in the share page."""
+    head = _PAGE_HEAD.format(title=html.escape(title or ""), highlight_css=render.HIGHLIGHT_CSS)
+    return head.encode() + body + _PAGE_TAIL
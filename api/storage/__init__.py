@@ -0,0 +1,40 @@
+from .. import config
+from .base import StorageBackend, StorageError, StorageNotFound, StoredObject
+
+# Image storage backends, selected by STORAGE_BACKEND:
+#
+#   supabase: Supabase Storage bucket (SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY)
+#   s3:       any S3-compatible endpoint (S3_* settings, needs boto3)
+#   local:    a directory on disk, served at GET /files/{path}
+#
+# Unset: supabase when its credentials are present, otherwise local, so a
+# self-hosted instance or test run needs no outside services. One backend
+# instance per process, so clients and their connection pools are reused.
+
+
+def create_backend(name: str = None) -> StorageBackend:
+    name = name or config.STORAGE_BACKEND or ("supabase" if config.SUPABASE_URL and config.SUPABASE_KEY else "local")
+    if name == "supabase":
+        from .supabase import SupabaseStorage
+
+        return SupabaseStorage(config.SUPABASE_URL, config.SUPABASE_KEY, config.SUPABASE_BUCKET)
+    if name == "s3":
+        from .s3 import S3Storage
+
+        return S3Storage(
+            bucket=config.S3_BUCKET,
+            endpoint_url=config.S3_ENDPOINT_URL,
+            region=config.S3_REGION,
+            access_key_id=config.S3_ACCESS_KEY_ID,
+            secret_access_key=config.S3_SECRET_ACCESS_KEY,
+            public_base_url=config.S3_PUBLIC_URL,
+            max_pool_connections=config.S3_MAX_POOL_CONNECTIONS,
+        )
+    if name == "local":
+        from .local import LocalStorage
+
+        return LocalStorage(config.STORAGE_LOCAL_DIR, config.STORAGE_LOCAL_URL)
+    raise StorageError(f"Unknown STORAGE_BACKEND: {name}")
+
+
+storage_service = create_backend()
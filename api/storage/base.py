@@ -0,0 +1,54 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional
+
+# Storage backend interface. Implementations are synchronous (blocking I/O);
+# request handlers call them through run_in_threadpool.
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageNotFound(StorageError):
+    pass
+
+
+class StoredObject(NamedTuple):
+    path: str
+    size: int
+    modified_at: datetime  # UTC, timezone-aware
+
+
+class StorageBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def put(self, path: str, fileobj: BinaryIO, content_type: str) -> None:
+        """Stores the file object's remaining bytes at `path`, replacing any existing object."""
+
+    def get(self, path: str) -> bytes:
+        """The whole object. Raises StorageNotFound."""
+        return b"".join(self.stream(path))
+
+    def local_path(self, path: str) -> Optional[str]:
+        """Filesystem path of the object when the backend keeps it on local disk, else None."""
+        return None
+
+    @abstractmethod
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Bytes [start, end] (inclusive, like an HTTP Range) in chunks. Raises StorageNotFound."""
+
+    @abstractmethod
+    def delete(self, paths: Iterable[str]) -> None:
+        """Deletes the given objects; missing ones are ignored."""
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        """Every object under `prefix` (recursively), streamed page by page."""
+
+    @abstractmethod
+    def public_url(self, path: str) -> str:
+        """URL the object is served from."""
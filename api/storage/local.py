@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from .base import STREAM_CHUNK_SIZE, StorageBackend, StorageNotFound, StoredObject
+
+# Files under a local directory, served by GET /files/{path} (see api/index.py)
+# with Range, ETag and immutable caching. No outside services needed: the
+# default when Supabase isn't configured, and a baseline for benchmarks.
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, root: str, public_base_url: str = "/files"):
+        self.root = os.path.realpath(root)
+        self.public_base_url = public_base_url.rstrip("/")
+
+    def resolve(self, path: str) -> str:
+        """Absolute file path for an object path; never escapes the root."""
+        full = os.path.realpath(os.path.join(self.root, path.lstrip("/")))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            raise StorageNotFound(path)
+        return full
+
+    def stat(self, path: str) -> Tuple[str, os.stat_result]:
+        full = self.resolve(path)
+        try:
+            stat = os.stat(full)
+        except FileNotFoundError:
+            raise StorageNotFound(path)
+        if not os.path.isfile(full):
+            raise StorageNotFound(path)
+        return full, stat
+
+    def local_path(self, path: str) -> Optional[str]:
+        return self.stat(path)[0]
+
+    def put(self, path: str, fileobj: BinaryIO, content_type: str) -> None:
+        full = self.resolve(path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        # Write then rename, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(full), prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as dst:
+                shutil.copyfileobj(fileobj, dst, STREAM_CHUNK_SIZE)
+            os.replace(tmp, full)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        full, stat = self.stat(path)
+        end = stat.st_size - 1 if end is None else min(end, stat.st_size - 1)
+        with open(full, "rb") as src:
+            src.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = src.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            try:
+                os.unlink(self.resolve(path))
+            except (FileNotFoundError, StorageNotFound):
+                pass
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        top = self.resolve(prefix)
+        for dirpath, _, filenames in os.walk(top):
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                yield StoredObject(
+                    os.path.relpath(full, self.root).replace(os.sep, "/"),
+                    stat.st_size,
+                    datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+                )
+
+    def public_url(self, path: str) -> str:
+        return f"{self.public_base_url}/{quote(path)}"
@@ -0,0 +1,82 @@
+from typing import BinaryIO, Iterable, Iterator, Optional
+from urllib.parse import quote
+
+from .base import STREAM_CHUNK_SIZE, StorageBackend, StorageError, StorageNotFound, StoredObject
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # optional: pip install .[s3]
+    boto3 = None
+
+# Any S3-compatible endpoint (AWS, MinIO, R2, Supabase S3, ...). One boto3
+# client per backend: it is thread-safe and keeps a pool of HTTP
+# connections sized by S3_MAX_POOL_CONNECTIONS.
+
+DELETE_BATCH_SIZE = 1000  # DeleteObjects limit
+
+
+class S3Storage(StorageBackend):
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        public_base_url: Optional[str] = None,
+        max_pool_connections: int = 10,
+    ):
+        if boto3 is None:
+            raise StorageError("S3 storage requires boto3 (pip install .[s3])")
+        if not bucket:
+            raise StorageError("S3_BUCKET is not set")
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=BotoConfig(max_pool_connections=max_pool_connections),
+        )
+        base = public_base_url or f"{self.client.meta.endpoint_url}/{bucket}"
+        self.public_base_url = base.rstrip("/")
+
+    def put(self, path: str, fileobj: BinaryIO, content_type: str) -> None:
+        # Multipart for large files, streamed from the spooled upload
+        self.client.upload_fileobj(fileobj, self.bucket, path, ExtraArgs={"ContentType": content_type})
+
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        kwargs = {}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=path, **kwargs)["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise StorageNotFound(path)
+            raise
+        with body:
+            yield from body.iter_chunks(STREAM_CHUNK_SIZE)
+
+    def delete(self, paths: Iterable[str]) -> None:
+        paths = list(paths)
+        for start in range(0, len(paths), DELETE_BATCH_SIZE):
+            chunk = paths[start:start + DELETE_BATCH_SIZE]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True},
+            )
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", ()):
+                yield StoredObject(item["Key"], item["Size"], item["LastModified"])
+
+    def public_url(self, path: str) -> str:
+        return f"{self.public_base_url}/{quote(path)}"
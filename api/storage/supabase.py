@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from storage3.exceptions import StorageApiError
+from supabase import create_client, Client
+
+from .base import StorageBackend, StorageError, StorageNotFound, StoredObject, STREAM_CHUNK_SIZE
+
+# Supabase Storage bucket. The client is created once per backend and reuses
+# its HTTP connection pool across requests.
+
+LIST_PAGE_SIZE = 1000
+
+
+class SupabaseStorage(StorageBackend):
+    name = "supabase"
+
+    def __init__(self, url: str, key: str, bucket: str):
+        self.client: Client = None
+        self.bucket_name = bucket
+        if url and key:
+            try:
+                self.client = create_client(url, key)
+            except Exception as e:
+                print(f"Failed to initialize Supabase client: {e}")
+
+    @property
+    def bucket(self):
+        if not self.client:
+            raise StorageError("Supabase client not initialized. Check config.")
+        return self.client.storage.from_(self.bucket_name)
+
+    def put(self, path: str, fileobj: BinaryIO, content_type: str) -> None:
+        # https://github.com/supabase-community/storage-py (takes the whole body)
+        self.bucket.upload(
+            file=fileobj.read(),
+            path=path,
+            file_options={"content-type": content_type, "upsert": "true"},
+        )
+
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        # The storage API has no ranged download; slice the whole object
+        try:
+            data = self.bucket.download(path)
+        except StorageApiError as e:
+            if str(e.status) in ("400", "404"):  # missing objects come back as either
+                raise StorageNotFound(path) from e
+            raise
+        data = data[start:None if end is None else end + 1]
+        for offset in range(0, len(data), STREAM_CHUNK_SIZE):
+            yield data[offset:offset + STREAM_CHUNK_SIZE]
+
+    def delete(self, paths: Iterable[str]) -> None:
+        paths = list(paths)
+        if paths:
+            self.bucket.remove(paths)
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        # The API lists one level at a time; folders come back without an id
+        folders = [prefix.strip("/")]
+        while folders:
+            folder = folders.pop()
+            offset = 0
+            while True:
+                items = self.bucket.list(folder, {"limit": LIST_PAGE_SIZE, "offset": offset})
+                for item in items:
+                    path = f"{folder}/{item['name']}"
+                    if item.get("id") is None:
+                        folders.append(path)
+                        continue
+                    stamp = item.get("updated_at") or item.get("created_at")
+                    modified_at = (
+                        datetime.fromisoformat(stamp.replace("Z", "+00:00"))
+                        if stamp
+                        else datetime.now(timezone.utc)
+                    )
+                    yield StoredObject(path, (item.get("metadata") or {}).get("size", 0), modified_at)
+                if len(items) < LIST_PAGE_SIZE:
+                    break
+                offset += LIST_PAGE_SIZE
+
+    def public_url(self, path: str) -> str:
+        return self.bucket.get_public_url(path)
@@ -0,0 +1,322 @@
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .config import SYNC_CURSOR_MARGIN_SECONDS
+
+# Delta sync helpers.
+#
+# A cursor is an opaque, url-safe token wrapping the newest change timestamp
+# the client has seen. Changes are returned with `>=` so rows sharing the
+# cursor timestamp (SQLite's now() has millisecond resolution) are never
+# skipped; clients apply them idempotently.
+#
+# Stamps come from now() when a write runs, not when it commits (on
+# PostgreSQL, the transaction start). A writer that commits after a pull can
+# therefore land behind the cursor that pull handed out, so cursors are held
+# SYNC_CURSOR_MARGIN_SECONDS behind the database clock: the overlap is sent
+# again and transactions shorter than the margin are never skipped.
+
+
+def encode_cursor(ts: Optional[datetime]) -> Optional[str]:
+    if ts is None:
+        return None
+    return base64.urlsafe_b64encode(ts.isoformat().encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> datetime:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return datetime.fromisoformat(base64.urlsafe_b64decode(padded).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+
+
+def cursor_horizon(db: Session) -> datetime:
+    """The newest timestamp a cursor may carry: database time minus the margin."""
+    return db.scalar(select(func.now())) - timedelta(seconds=SYNC_CURSOR_MARGIN_SECONDS)
+
+
+def cap_cursor(db: Session, latest: Optional[datetime]) -> Optional[datetime]:
+    if latest is None:
+        return None
+    horizon = cursor_horizon(db)
+    # SQLite hands back naive UTC, PostgreSQL aware timestamps
+    if horizon.tzinfo is None and latest.tzinfo is not None:
+        latest = latest.astimezone(timezone.utc).replace(tzinfo=None)
+    elif horizon.tzinfo is not None and latest.tzinfo is None:
+        latest = latest.replace(tzinfo=timezone.utc)
+    return min(latest, horizon)
+
+
+def at_or_after(db: Session, column, since: datetime):
+    # The bare column against a bound value, so the (user_id, stamp) indexes
+    # serve the range. SQLite keeps DATETIME as UTC text in the format the
+    # bind renders (api/database.py), so drop the offset there.
+    if db.get_bind().dialect.name == "sqlite" and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return column >= since
+
+
+def record_tombstones(db: Session, user_id: str, entity_type: str, entity_ids: Iterable[str]):
+    """Adds deletion markers to the session. Caller commits."""
+    db.add_all(
+        models.Tombstone(user_id=user_id, entity_type=entity_type, entity_id=entity_id)
+        for entity_id in entity_ids
+    )
+
+
+def clear_tombstones(db: Session, user_id: str, entity_type: str, entity_ids: Iterable[str]):
+    """Drops deletion markers for ids that were (re)created. Caller commits."""
+    ids = list(entity_ids)
+    if not ids:
+        return
+    # Markers added earlier in this session are still pending (autoflush is
+    # off), so the DELETE below can't see them: drop them from the session
+    wanted = set(ids)
+    for obj in list(db.new):
+        if (
+            isinstance(obj, models.Tombstone)
+            and obj.user_id == user_id
+            and obj.entity_type == entity_type
+            and obj.entity_id in wanted
+        ):
+            db.expunge(obj)
+    db.query(models.Tombstone).filter(
+        models.Tombstone.user_id == user_id,
+        models.Tombstone.entity_type == entity_type,
+        models.Tombstone.entity_id.in_(ids),
+    ).delete(synchronize_session=False)
+
+
+def delete_folder_with_notes(db: Session, user_id: str, folder_id: str) -> int:
+    """
+    Deletes a folder and its notes set-based (no ORM cascade: notes are never
+    loaded) and records tombstones. Returns the number of notes deleted.
+    Caller commits.
+    """
+    # Notes are matched by owner too: restore doesn't validate folder_id, so
+    # another user's notes may point at this id
+    in_folder = (models.Note.folder_id == folder_id) & (models.Note.user_id == user_id)
+    db.execute(
+        insert(models.Tombstone).from_select(
+            ["user_id", "entity_type", "entity_id"],
+            select(literal(user_id), literal("note"), models.Note.id).where(in_folder),
+        )
+    )
+    deleted = db.execute(delete(models.Note).where(in_folder)).rowcount
+    record_tombstones(db, user_id, "folder", [folder_id])
+    db.execute(delete(models.Folder).where(models.Folder.id == folder_id, models.Folder.user_id == user_id))
+    return deleted
+
+
+def move_folder_notes(db: Session, user_id: str, folder_id: str, target_id: Optional[str]) -> int:
+    """
+    Moves every note of a folder to `target_id` (None: the root) in one
+    UPDATE. Bumps version/updated_at so delta sync and stale editors see the
+    move. Returns the number of notes moved. Caller commits.
+    """
+    return db.execute(
+        update(models.Note)
+        .where(models.Note.folder_id == folder_id, models.Note.user_id == user_id)
+        .values(folder_id=target_id, version=models.Note.version + 1, updated_at=func.now())
+    ).rowcount
+
+
+def collect_changes(db: Session, user_id: str, since: Optional[datetime]) -> dict:
+    """
+    Returns notes/folders changed at or after `since` plus tombstoned ids.
+    With no `since`, returns the full (live) data set and no deletions.
+    """
+    notes_q = db.query(models.Note).filter(models.Note.user_id == user_id)
+    folders_q = db.query(models.Folder).filter(models.Folder.user_id == user_id)
+    deleted_note_ids = []
+    deleted_folder_ids = []
+
+    if since is not None:
+        notes_q = notes_q.filter(at_or_after(db, models.Note.changed_at, since))
+        folders_q = folders_q.filter(at_or_after(db, models.Folder.updated_at, since))
+        tombstones = (
+            db.query(
+                models.Tombstone.entity_type,
+                models.Tombstone.entity_id,
+                models.Tombstone.deleted_at,
+            )
+            .filter(
+                models.Tombstone.user_id == user_id,
+                at_or_after(db, models.Tombstone.deleted_at, since),
+            )
+            .all()
+        )
+    else:
+        tombstones = []
+
+    notes = notes_q.all()
+    folders = folders_q.all()
+
+    latest = since
+    for ts in [n.changed_at for n in notes] + [f.updated_at for f in folders]:
+        if ts is not None and (latest is None or ts > latest):
+            latest = ts
+
+    for entity_type, entity_id, deleted_at in tombstones:
+        if entity_type == "note":
+            deleted_note_ids.append(entity_id)
+        elif entity_type == "folder":
+            deleted_folder_ids.append(entity_id)
+        if deleted_at is not None and (latest is None or deleted_at > latest):
+            latest = deleted_at
+
+    return {
+        "notes": notes,
+        "folders": folders,
+        "deleted_note_ids": deleted_note_ids,
+        "deleted_folder_ids": deleted_folder_ids,
+        "cursor": encode_cursor(cap_cursor(db, latest)),
+    }
+
+
+# --- Batched writes ---
+
+
+def _result(op: schemas.SyncOperation, status: str, status_code: int, version=None, detail=None):
+    return schemas.SyncOperationResult(
+        id=op.id,
+        entity=op.entity,
+        op=op.op,
+        status=status,
+        status_code=status_code,
+        version=version,
+        detail=detail,
+    )
+
+
+def apply_batch(db: Session, user_id: str, operations: List[schemas.SyncOperation]):
+    """
+    Applies queued client operations in order inside the caller's transaction.
+    Mirrors the single-item endpoints (POST/PUT/DELETE notes, folders) but
+    prefetches every referenced row up front, so the whole batch costs a
+    couple of SELECTs plus one flush. Per-operation failures are reported,
+    not raised; nothing is mutated for a failed operation.
+    """
+    note_ids = {op.id for op in operations if op.entity == "note"}
+    folder_ids = {op.id for op in operations if op.entity == "folder"}
+    folder_ids |= {op.folder_id for op in operations if op.entity == "note" and op.folder_id}
+
+    # Fetched by id only so collisions with other users' ids can be detected
+    notes = {}
+    if note_ids:
+        notes = {n.id: n for n in db.query(models.Note).filter(models.Note.id.in_(note_ids))}
+    folders = {}
+    if folder_ids:
+        folders = {f.id: f for f in db.query(models.Folder).filter(models.Folder.id.in_(folder_ids))}
+
+    results = []
+    for op in operations:
+        if op.entity == "note":
+            results.append(_apply_note_op(db, user_id, op, notes, folders))
+        elif op.entity == "folder":
+            results.append(_apply_folder_op(db, user_id, op, notes, folders))
+        else:
+            results.append(_result(op, "error", 400, detail=f"Unsupported entity: {op.entity}"))
+
+    db.flush()
+    return results
+
+
+def _apply_note_op(db: Session, user_id: str, op: schemas.SyncOperation, notes: dict, folders: dict):
+    if op.op not in ("create", "update", "move", "delete"):
+        return _result(op, "error", 400, detail=f"Unsupported op: {op.op}")
+
+    data = op.dict(exclude_unset=True)
+    db_note = notes.get(op.id)
+
+    if db_note is not None and db_note.user_id != user_id:
+        return _result(op, "conflict", 409, detail="Note ID collision with another user")
+
+    if op.op in ("delete", "move") and db_note is None:
+        return _result(op, "not_found", 404, detail="Note not found")
+
+    if data.get("folder_id") is not None:
+        folder = folders.get(op.folder_id)
+        if folder is None or folder.user_id != user_id:
+            return _result(op, "error", 400, detail="Invalid folder")
+
+    # Optimistic Locking Check (same rule as PUT /api/notes/{id})
+    if db_note is not None and op.op != "create" and op.version is not None:
+        if db_note.version != op.version:
+            return _result(op, "conflict", 409, version=db_note.version, detail="Conflict: Stale version")
+
+    if op.op == "delete":
+        db.delete(db_note)
+        record_tombstones(db, user_id, "note", [op.id])
+        del notes[op.id]
+        return _result(op, "ok", 200)
+
+    if db_note is None:
+        # Upsert for Sync: create/update/move of an unknown id creates it
+        db_note = models.Note(
+            id=op.id,
+            title=data.get("title", "Untitled Note"),
+            content=data.get("content", ""),
+            folder_id=data.get("folder_id"),
+            user_id=user_id,
+            is_pinned=data.get("is_pinned", False),
+            version=1,
+        )
+        db.add(db_note)
+        notes[op.id] = db_note
+        clear_tombstones(db, user_id, "note", [op.id])
+        return _result(op, "ok", 200, version=db_note.version)
+
+    if op.op == "move":
+        db_note.folder_id = op.folder_id
+    else:
+        for field in ("title", "content", "folder_id", "is_pinned"):
+            if field in data:
+                setattr(db_note, field, data[field])
+
+    # POST /api/notes on an existing id overwrites without bumping version
+    if op.op != "create":
+        db_note.version += 1
+    return _result(op, "ok", 200, version=db_note.version)
+
+
+def _apply_folder_op(db: Session, user_id: str, op: schemas.SyncOperation, notes: dict, folders: dict):
+    if op.op not in ("create", "update", "delete"):
+        return _result(op, "error", 400, detail=f"Unsupported op: {op.op}")
+
+    db_folder = folders.get(op.id)
+
+    if db_folder is not None and db_folder.user_id != user_id:
+        return _result(op, "conflict", 409, detail="Folder ID collision with another user")
+
+    if op.op == "create":
+        # Idempotent, like POST /api/folders
+        if db_folder is None:
+            db_folder = models.Folder(id=op.id, name=op.name, user_id=user_id)
+            db.add(db_folder)
+            folders[op.id] = db_folder
+            clear_tombstones(db, user_id, "folder", [op.id])
+        return _result(op, "ok", 200)
+
+    if db_folder is None:
+        return _result(op, "not_found", 404, detail="Folder not found")
+
+    if op.op == "update":
+        if op.name is not None:
+            db_folder.name = op.name
+        return _result(op, "ok", 200)
+
+    db.flush()  # The set-based delete must see notes created earlier in the batch
+    delete_folder_with_notes(db, user_id, op.id)
+    db.expunge(folders.pop(op.id))
+    for note_id in [nid for nid, n in notes.items() if n.folder_id == op.id and n.user_id == user_id]:
+        db.expunge(notes.pop(note_id))
+    return _result(op, "ok", 200)
@@ -0,0 +1,257 @@
+import hashlib
+import io
+import os
+import tempfile
+from typing import AsyncIterator, BinaryIO, Optional, Tuple
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import exc as sa_exc
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from . import images, models
+from .config import UPLOAD_MAX_BYTES
+from .storage import StorageBackend
+
+# Streaming receive for POST /api/upload.
+#
+# The multipart body is parsed as it arrives; Starlette spools file parts to
+# a SpooledTemporaryFile (memory up to 1MB, then disk), so a request never
+# holds the whole image in memory. The byte count is enforced on the raw
+# stream, so an oversized or unbounded (chunked) body is cut off with 413
+# instead of being written to disk first.
+#
+# Stored objects are content-addressed per user: the spooled file is hashed
+# (SHA-256) and looked up in the `blobs` index, so re-uploading the same image
+# returns the existing URL without touching the storage backend.
+#
+# After the response, decodable images get downscaled WebP variants
+# (api/images.py) stored next to the original; GET /img/{user_id}/{sha256}?w=
+# redirects to the best stored size.
+
+# Boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class _TooLarge(MultiPartException):
+    # A MultiPartException so the parser closes the parts it spooled so far
+    def __init__(self):
+        super().__init__("Upload too large")
+
+
+async def _limited(stream: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > max_bytes:
+            raise _TooLarge()
+        yield chunk
+
+
+async def receive_image(request: Request, max_bytes: Optional[int] = None) -> UploadFile:
+    """
+    The `file` part of a multipart image upload, spooled and rewound.
+    The caller closes it.
+    """
+    max_bytes = max_bytes or UPLOAD_MAX_BYTES
+    limit = max_bytes + MULTIPART_OVERHEAD
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail="Upload too large")
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    parser = MultiPartParser(request.headers, _limited(request.stream(), limit), max_files=1, max_fields=10)
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=413 if isinstance(e, _TooLarge) else 400, detail=e.message)
+
+    upload = form.get("file")
+    if upload is None or isinstance(upload, str):
+        await form.close()
+        raise HTTPException(status_code=400, detail="Missing file field")
+    if not (upload.content_type or "").startswith("image/"):
+        await form.close()
+        raise HTTPException(status_code=400, detail="Only images allowed")
+    if upload.size is not None and upload.size > max_bytes:
+        await form.close()
+        raise HTTPException(status_code=413, detail="Upload too large")
+    await upload.seek(0)
+    return upload
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _digest(fileobj: BinaryIO) -> Tuple[str, int]:
+    """(sha256 hex, size) of the file; leaves it rewound."""
+    sha, size = hashlib.sha256(), 0
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b""):
+        sha.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return sha.hexdigest(), size
+
+
+# Stored type -> object extension. Anything else is kept as an opaque
+# application/octet-stream `.bin`; the client's filename is never used.
+IMAGE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/avif": "avif",
+    "image/bmp": "bmp",
+    "image/tiff": "tiff",
+    "image/svg+xml": "svg",
+}
+# Safe to display inline on our origin (SVG can carry scripts)
+RASTER_TYPES = frozenset(IMAGE_EXTENSIONS) - {"image/svg+xml"}
+OPAQUE_TYPE = "application/octet-stream"
+
+
+def stored_type(content_type: Optional[str]) -> str:
+    """The declared type if whitelisted, else application/octet-stream."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type if content_type in IMAGE_EXTENSIONS else OPAQUE_TYPE
+
+
+def blob_path(user_id: str, sha256: str, content_type: str) -> str:
+    # Same uploads/{user_id}/ prefix as before, with the hash instead of a uuid
+    return f"uploads/{user_id}/{sha256}/{sha256}.{IMAGE_EXTENSIONS.get(content_type, 'bin')}"
+
+
+def _dimensions(fileobj: BinaryIO) -> Tuple[Optional[int], Optional[int]]:
+    # Header only; the pixels are decoded later in the worker pool
+    if images.Image is None:
+        return None, None
+    try:
+        with images.Image.open(fileobj) as img:
+            return img.width, img.height
+    except Exception:
+        return None, None
+    finally:
+        fileobj.seek(0)
+
+
+def _result(backend: StorageBackend, blob: models.Blob, deduplicated: bool) -> dict:
+    return {
+        "url": backend.public_url(blob.path),
+        "path": blob.path,
+        "sha256": blob.sha256,
+        "size": blob.size,
+        "width": blob.width,
+        "height": blob.height,
+        "variants": images.parse_variants(blob.variants),
+        "deduplicated": deduplicated,
+    }
+
+
+def store_image(
+    db: Session,
+    backend: StorageBackend,
+    user_id: str,
+    fileobj: BinaryIO,
+    content_type: str,
+) -> dict:
+    """
+    Stores an uploaded image unless the user already has the same bytes.
+    Blocking (hashing, storage I/O): run it in the threadpool. Commits.
+    """
+    sha256, size = _digest(fileobj)
+    content_type = stored_type(content_type)
+    blob = (
+        db.query(models.Blob)
+        .filter(models.Blob.user_id == user_id, models.Blob.sha256 == sha256)
+        .first()
+    )
+    if blob is not None:
+        # The URL is about to be pasted again: restart its GC grace period
+        blob.last_used_at = func.now()
+        db.commit()
+        return _result(backend, blob, deduplicated=True)
+
+    width, height = _dimensions(fileobj)
+    path = blob_path(user_id, sha256, content_type)
+    backend.put(path, fileobj, content_type)
+    blob = models.Blob(
+        user_id=user_id,
+        sha256=sha256,
+        path=path,
+        size=size,
+        content_type=content_type,
+        width=width,
+        height=height,
+    )
+    db.add(blob)
+    try:
+        db.commit()
+    except sa_exc.IntegrityError:
+        # A concurrent upload of the same bytes won; use its object
+        db.rollback()
+        blob = (
+            db.query(models.Blob)
+            .filter(models.Blob.user_id == user_id, models.Blob.sha256 == sha256)
+            .one()
+        )
+        return _result(backend, blob, deduplicated=True)
+    return _result(backend, blob, deduplicated=False)
+
+
+def needs_variants(result: dict, content_type: str) -> bool:
+    if not images.enabled() or not images.derivable(content_type) or result["variants"]:
+        return False
+    width = result["width"]
+    return width is not None and any(w < width for w in images.IMAGE_VARIANT_WIDTHS)
+
+
+def _save_variants(session_factory, backend: StorageBackend, user_id: str, sha256: str, path: str, variants):
+    for width, data in variants:
+        backend.put(images.variant_path(path, width), io.BytesIO(data), "image/webp")
+    db = session_factory()
+    try:
+        db.query(models.Blob).filter(models.Blob.user_id == user_id, models.Blob.sha256 == sha256).update(
+            {models.Blob.variants: ",".join(str(width) for width, _ in sorted(variants))},
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _source_file(backend: StorageBackend, path: str) -> Tuple[str, bool]:
+    """(file path, is temporary) for the stored original; remote objects are downloaded to a temp file."""
+    local = backend.local_path(path)
+    if local:
+        return local, False
+    fd, tmp = tempfile.mkstemp(prefix="shynote-variant-")
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            for chunk in backend.stream(path):
+                dst.write(chunk)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return tmp, True
+
+
+async def generate_variants(session_factory, backend: StorageBackend, user_id: str, result: dict):
+    """Background task: resize the stored original in the process pool, then store and record the variants."""
+    source, temporary = None, False
+    try:
+        source, temporary = await run_in_threadpool(_source_file, backend, result["path"])
+        variants = await images.render_variants(source)
+        if variants:
+            await run_in_threadpool(
+                _save_variants, session_factory, backend, user_id, result["sha256"], result["path"], variants
+            )
+    except Exception as e:
+        # The original is already stored and served; variants are best effort
+        print(f"Image variants failed for {result['path']}: {e}")
+    finally:
+        if temporary:
+            os.unlink(source)
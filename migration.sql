@@ -4,3 +4,55 @@
 ALTER TABLE notes ADD COLUMN IF NOT EXISTS version INTEGER DEFAULT 1;
 ALTER TABLE users ADD COLUMN IF NOT EXISTS api_key TEXT;
 CREATE UNIQUE INDEX IF NOT EXISTS users_api_key_idx ON users(api_key);
+
+-- Delta sync (change cursor + tombstones)
+ALTER TABLE folders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now();
+CREATE TABLE IF NOT EXISTS tombstones (
+    id SERIAL PRIMARY KEY,
+    user_id VARCHAR REFERENCES users(id),
+    entity_type VARCHAR,
+    entity_id VARCHAR,
+    deleted_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_tombstones_user_id ON tombstones(user_id);
+CREATE INDEX IF NOT EXISTS ix_tombstones_entity_id ON tombstones(entity_id);
+CREATE INDEX IF NOT EXISTS ix_tombstones_user_deleted_at ON tombstones(user_id, deleted_at);
+
+-- Keyset pagination for GET /api/notes
+CREATE INDEX IF NOT EXISTS ix_notes_user_updated_id ON notes(user_id, updated_at, id);
+
+-- Full-text search (GET /api/search); also applied automatically on startup
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(content, '')), 'B')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS ix_notes_search_vector ON notes USING GIN (search_vector);
+
+-- Upload deduplication (POST /api/upload): content-addressed blob index
+CREATE TABLE IF NOT EXISTS blobs (
+    id SERIAL PRIMARY KEY,
+    user_id VARCHAR REFERENCES users(id),
+    sha256 VARCHAR(64),
+    path VARCHAR,
+    size INTEGER,
+    content_type VARCHAR,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_blobs_user_id ON blobs(user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_blobs_user_sha256 ON blobs(user_id, sha256);
+
+-- Image variants (downscaled WebP next to the original)
+ALTER TABLE blobs ADD COLUMN IF NOT EXISTS width INTEGER;
+ALTER TABLE blobs ADD COLUMN IF NOT EXISTS height INTEGER;
+ALTER TABLE blobs ADD COLUMN IF NOT EXISTS variants VARCHAR;
+
+-- Orphaned upload GC: dedup hits refresh the grace period
+ALTER TABLE blobs ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMPTZ;
+
+-- Delta sync / incremental backups: server-side change stamp for notes
+-- (restore and import keep the backup's updated_at)
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS changed_at TIMESTAMPTZ;
+UPDATE notes SET changed_at = updated_at WHERE changed_at IS NULL;
+ALTER TABLE notes ALTER COLUMN changed_at SET DEFAULT now();
+CREATE INDEX IF NOT EXISTS ix_notes_user_changed_at ON notes(user_id, changed_at);
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.storage import create_backend  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure put/get throughput of the configured storage backend.")
+    parser.add_argument("--backend", help="supabase | s3 | local (default: STORAGE_BACKEND)")
+    parser.add_argument("--count", type=int, default=200, help="Objects to write and read")
+    parser.add_argument("--size", type=int, default=512 * 1024, help="Object size in bytes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel requests")
+    args = parser.parse_args()
+
+    backend = create_backend(args.backend)
+    payload = os.urandom(args.size)
+    prefix = f"bench/{uuid.uuid4()}"
+    paths = [f"{prefix}/{i}.bin" for i in range(args.count)]
+    total_mb = args.count * args.size / (1024 * 1024)
+
+    def run(label, fn):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(fn, paths))
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {args.count} x {args.size} B in {elapsed:.2f}s, {total_mb / elapsed:.1f} MB/s, {args.count / elapsed:.0f} ops/s")
+
+    print(f"backend={backend.name} concurrency={args.concurrency}")
+    try:
+        run("put", lambda path: backend.put(path, io.BytesIO(payload), "application/octet-stream"))
+        run("get", backend.get)
+    finally:
+        backend.delete(paths)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
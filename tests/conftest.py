@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep app startup (create_all) away from the on-disk SHYNOTE.db
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from api import database, index, models, render, search, share  # noqa: E402
+from api.auth import utils  # noqa: E402
+from api.storage.local import LocalStorage  # noqa: E402
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    # File-backed so the sync and asyncio engines see the same database;
+    # make_engine applies the same SQLite pragmas as the app's engine
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    search.ensure_search_index(engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def async_db_engine(db_session):
+    # NullPool: connections never outlive the TestClient's event loop
+    return database.make_async_engine(str(db_session.get_bind().url), poolclass=NullPool)
+
+
+@pytest.fixture
+def user(db_session):
+    db_user = models.User(id="test_user", email="test@example.com", provider="google")
+    db_session.add(db_user)
+    db_session.commit()
+    return db_user
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    backend = LocalStorage(str(tmp_path / "storage"))
+    monkeypatch.setattr(index, "storage_service", backend)
+    return backend
+
+
+@pytest.fixture
+def client(db_session, async_db_engine, user, local_storage):
+    TestingAsyncSessionLocal = async_sessionmaker(
+        bind=async_db_engine, autoflush=False, expire_on_commit=False
+    )
+
+    def override_get_db():
+        yield db_session
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    index.app.dependency_overrides[database.get_db] = override_get_db
+    index.app.dependency_overrides[database.get_async_db] = override_get_async_db
+    utils.principal_cache.clear()
+    render.html_cache.clear()
+    share.page_cache.clear()
+    token = utils.create_access_token(data={"sub": user.id})
+    with TestClient(index.app) as test_client:
+        test_client.headers["Authorization"] = f"Bearer {token}"
+        yield test_client
+    index.app.dependency_overrides.clear()
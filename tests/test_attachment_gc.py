@@ -0,0 +1,108 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from api import attachment_gc, models
+
+SHA_KEPT = "a" * 64
+SHA_ORPHAN = "b" * 64
+SHA_REUSED = "c" * 64
+
+
+def _put(backend, path, data=b"x" * 100, age_hours=0):
+    backend.put(path, io.BytesIO(data), "image/png")
+    if age_hours:
+        stamp = time.time() - age_hours * 3600
+        os.utime(backend.resolve(path), (stamp, stamp))
+
+
+def _seed(db_session, local_storage, user):
+    # Referenced by URL, referenced via /img, orphaned (with a variant), a
+    # legacy uuid upload, a fresh orphan and a recently re-used orphan
+    _put(local_storage, f"uploads/{user.id}/{SHA_KEPT}/a.png", age_hours=500)
+    _put(local_storage, f"uploads/{user.id}/{'d' * 64}/d.png", age_hours=500)
+    _put(local_storage, f"uploads/{user.id}/{SHA_ORPHAN}/b.png", age_hours=500)
+    _put(local_storage, f"uploads/{user.id}/{SHA_ORPHAN}/w320.webp", b"y" * 40, age_hours=500)
+    _put(local_storage, f"uploads/{user.id}/0b6f1c2e-legacy/old.png", age_hours=500)
+    _put(local_storage, f"uploads/{user.id}/{'e' * 64}/fresh.png")
+    _put(local_storage, f"uploads/{user.id}/{SHA_REUSED}/c.png", age_hours=500)
+    db_session.add_all([
+        models.Blob(user_id=user.id, sha256=SHA_ORPHAN, path=f"uploads/{user.id}/{SHA_ORPHAN}/b.png", size=100),
+        models.Blob(
+            user_id=user.id,
+            sha256=SHA_REUSED,
+            path=f"uploads/{user.id}/{SHA_REUSED}/c.png",
+            size=100,
+            last_used_at=datetime.now(timezone.utc) - timedelta(hours=1),
+        ),
+        models.Note(
+            id="n1",
+            user_id=user.id,
+            title="t",
+            content=f"![a](/files/uploads/{user.id}/{SHA_KEPT}/a.png) ![d](/img/{user.id}/{'d' * 64}?w=640)",
+        ),
+    ])
+    db_session.commit()
+
+
+def test_dry_run_reports_without_deleting(db_session, local_storage, user):
+    _seed(db_session, local_storage, user)
+
+    report = attachment_gc.collect(db_session, local_storage, dry_run=True)
+
+    assert report["objects_scanned"] == 7
+    assert report["referenced"] == 2
+    assert report["skipped_recent"] == 2
+    assert report["orphaned"] == 3
+    assert report["orphaned_bytes"] == 240
+    assert report["users"] == {user.id: {"orphaned": 3, "orphaned_bytes": 240}}
+    assert report["deleted"] == 0
+    assert len(list(local_storage.list("uploads/"))) == 7
+    assert db_session.query(models.Blob).count() == 2
+
+
+def test_collect_deletes_orphans_in_batches(db_session, local_storage, user, monkeypatch):
+    _seed(db_session, local_storage, user)
+    calls = []
+    delete = local_storage.delete
+    monkeypatch.setattr(local_storage, "delete", lambda paths: (calls.append(list(paths)), delete(paths)))
+
+    report = attachment_gc.collect(db_session, local_storage, batch_size=2)
+
+    assert report["deleted"] == 3
+    assert report["deleted_bytes"] == 240
+    assert [len(paths) for paths in calls] == [2, 1]
+    remaining = sorted(obj.path for obj in local_storage.list("uploads/"))
+    assert remaining == sorted([
+        f"uploads/{user.id}/{SHA_KEPT}/a.png",
+        f"uploads/{user.id}/{'d' * 64}/d.png",
+        f"uploads/{user.id}/{'e' * 64}/fresh.png",
+        f"uploads/{user.id}/{SHA_REUSED}/c.png",
+    ])
+    assert [blob.sha256 for blob in db_session.query(models.Blob)] == [SHA_REUSED]
+
+
+def test_references_from_other_users_keep_uploads(db_session, local_storage, user):
+    _put(local_storage, f"uploads/{user.id}/{SHA_KEPT}/a.png", age_hours=500)
+    _put(local_storage, f"uploads/other/{SHA_KEPT}/a.png", age_hours=500)
+    db_session.add(models.User(id="other", email="o@example.com", provider="google"))
+    db_session.add(models.Note(id="n2", user_id="other", title="t", content=f"uploads/{user.id}/{SHA_KEPT}/a.png"))
+    db_session.commit()
+
+    report = attachment_gc.collect(db_session, local_storage, user_id=user.id)
+
+    assert report["objects_scanned"] == 1
+    assert report["referenced"] == 1
+    assert report["deleted"] == 0
+    assert local_storage.stat(f"uploads/other/{SHA_KEPT}/a.png")
+
+
+def test_dedup_hit_refreshes_last_used(client, db_session):
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+    client.post("/api/upload", files={"file": ("a.png", png, "image/png")})
+    assert db_session.query(models.Blob).one().last_used_at is None
+
+    client.post("/api/upload", files={"file": ("a.png", png, "image/png")})
+    db_session.expire_all()
+    assert db_session.query(models.Blob).one().last_used_at is not None
@@ -0,0 +1,54 @@
+from sqlalchemy import event
+
+from api.auth import utils
+
+
+def _count_user_queries(*engines):
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            statements.append(statement)
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_execute)
+    return statements
+
+
+def test_repeat_requests_hit_principal_cache(client, db_session, async_db_engine):
+    client.get("/api/notes")  # warm
+    statements = _count_user_queries(db_session.get_bind(), async_db_engine.sync_engine)
+
+    for _ in range(3):
+        assert client.get("/api/notes").status_code == 200
+
+    assert statements == []
+    assert utils.principal_cache.stats()["hits"] >= 3
+
+
+def test_profile_update_through_cached_principal_persists(client):
+    client.get("/auth/me")  # warm cache
+    res = client.patch("/auth/me", json={"is_dark_mode": True})
+    assert res.status_code == 200
+    assert client.get("/auth/me").json()["is_dark_mode"] is True
+
+
+def test_rotated_api_key_is_invalidated(client):
+    old_key = client.post("/api/api-key").json()["api_key"]
+    assert client.get("/api/notes", headers={"Authorization": f"Bearer {old_key}"}).status_code == 200
+
+    client.post("/api/api-key")
+    assert client.get("/api/notes", headers={"Authorization": f"Bearer {old_key}"}).status_code == 401
+
+
+def test_cached_api_key_does_not_satisfy_jwt_only_routes(client):
+    key = client.post("/api/api-key").json()["api_key"]
+    client.get("/api/notes", headers={"Authorization": f"Bearer {key}"})  # cached as api_key
+
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {key}"}).status_code == 401
+
+
+def test_metrics_exposes_cache_counters(client):
+    client.get("/api/notes")
+    stats = client.get("/api/metrics").json()["auth_cache"]
+    assert {"hits", "misses", "size"} <= set(stats)
@@ -0,0 +1,303 @@
+import gzip
+import io
+import json
+import tarfile
+import zipfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from api import export, importer, models, restore, schemas
+
+
+def _seed(client):
+    client.post("/api/folders", json={"id": "f1", "name": "Folder"})
+    client.post("/api/notes", json={"id": "n1", "title": "One", "content": "a", "folder_id": "f1"})
+    client.post("/api/notes", json={"id": "n2", "title": "Two", "content": "b"})
+
+
+def test_json_backup_round_trips_through_restore(client):
+    _seed(client)
+
+    res = client.get("/api/backup")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/json")
+    assert "attachment" in res.headers["content-disposition"]
+    data = res.json()
+    assert data["backup_user_id"] == "test_user"
+    assert [f["id"] for f in data["folders"]] == ["f1"]
+    assert [n["id"] for n in data["notes"]] == ["n1", "n2"]
+
+    client.delete("/api/reset")
+    restored = client.post("/api/restore", json=data).json()
+    assert restored["folders_added"] == 1
+    assert restored["notes_added"] == 2
+
+
+def test_ndjson_backup_writes_one_record_per_line(client):
+    _seed(client)
+
+    res = client.get("/api/backup", params={"format": "ndjson"})
+    assert res.status_code == 200
+    records = [json.loads(line) for line in res.text.splitlines()]
+    assert [r["type"] for r in records] == ["header", "folder", "note", "note"]
+    assert records[0]["backup_user_id"] == "test_user"
+    assert records[2]["content"] == "a"
+
+
+def test_backup_openapi_lists_every_format(client):
+    responses = client.get("/openapi.json").json()["paths"]["/api/backup"]["get"]["responses"]
+    content = responses["200"]["content"]
+    assert set(content) == set(export.MEDIA_TYPES.values())
+    assert content["application/json"]["schema"]["$ref"].endswith("/BackupData")
+
+
+def test_unknown_backup_format_is_rejected(client):
+    assert client.get("/api/backup", params={"format": "xml"}).status_code == 400
+
+
+def test_stream_backup_yields_bounded_chunks(client, db_session):
+    _seed(client)
+
+    chunks = list(export.stream_backup(db_session, "test_user", batch_size=1, chunk_size=1))
+    assert len(chunks) > 3
+    assert json.loads(b"".join(chunks))["notes"][1]["title"] == "Two"
+
+
+def _backup(notes, folders=()):
+    note_defaults = {"created_at": "2024-01-01T00:00:00", "updated_at": "2024-01-02T00:00:00"}
+    return {
+        "folders": [{"user_id": "test_user", **f} for f in folders],
+        "notes": [{"user_id": "test_user", **note_defaults, **n} for n in notes],
+    }
+
+
+def test_restore_counts_added_and_updated(client):
+    data = _backup(
+        [{"id": "n1", "title": "One", "content": "alpha", "folder_id": "f1"}, {"id": "n2", "title": "Two"}],
+        [{"id": "f1", "name": "Folder"}],
+    )
+    first = client.post("/api/restore", json=data).json()
+    assert (first["folders_added"], first["notes_added"], first["notes_updated"]) == (1, 2, 0)
+    assert "total" in first["timing_ms"]
+
+    data["notes"][0]["content"] = "bravo"
+    second = client.post("/api/restore", json=data).json()
+    assert (second["folders_updated"], second["notes_added"], second["notes_updated"]) == (1, 0, 2)
+
+    assert client.get("/api/notes/n1").json()["content"] == "bravo"
+    # Upsert goes through UPDATE, so the FTS triggers keep the index current
+    assert [hit["id"] for hit in client.get("/api/search", params={"q": "bravo"}).json()] == ["n1"]
+    assert client.get("/api/search", params={"q": "alpha"}).json() == []
+
+
+def test_restore_skips_ids_owned_by_another_user(client, db_session):
+    db_session.add(models.User(id="other", email="other@example.com", provider="google"))
+    db_session.add(models.Note(id="theirs", title="Theirs", content="secret", user_id="other"))
+    db_session.commit()
+
+    result = client.post("/api/restore", json=_backup([{"id": "theirs", "title": "Mine"}])).json()
+    assert (result["notes_added"], result["notes_updated"], result["notes_skipped"]) == (0, 0, 1)
+    db_session.expire_all()
+    assert db_session.get(models.Note, "theirs").title == "Theirs"
+
+
+def test_restore_keeps_notes_whose_folder_is_missing(client):
+    # Partial or hand-edited backups may point at folders they don't contain
+    result = client.post("/api/restore", json=_backup([{"id": "n1", "title": "One", "folder_id": "gone"}])).json()
+    assert result["notes_added"] == 1
+    assert client.get("/api/notes/n1").json()["folder_id"] == "gone"
+
+
+def test_restore_writes_in_batches(db_session, user):
+    backup = schemas.BackupData(**_backup([{"id": f"n{i}", "title": str(i)} for i in range(5)]))
+    result = restore.restore_backup(db_session, user.id, backup, batch_size=2)
+    assert result["notes_added"] == 5
+
+
+def test_restore_falls_back_to_merge_without_on_conflict(client, monkeypatch):
+    monkeypatch.setattr(restore, "UPSERT_INSERTS", {})
+    data = _backup([{"id": "n1", "title": "One", "folder_id": "f1"}], [{"id": "f1", "name": "Folder"}])
+    first = client.post("/api/restore", json=data).json()
+    assert (first["folders_added"], first["notes_added"]) == (1, 1)
+
+    data["notes"][0]["title"] = "Uno"
+    second = client.post("/api/restore", json=data).json()
+    assert (second["folders_updated"], second["notes_updated"]) == (1, 1)
+    note = client.get("/api/notes/n1").json()
+    assert note["title"] == "Uno"
+    assert note["updated_at"].startswith("2024-01-02")
+
+
+def _ndjson_backup(client):
+    _seed(client)
+    body = client.get("/api/backup", params={"format": "ndjson"}).content
+    client.delete("/api/reset")
+    return body
+
+
+def test_import_raw_ndjson_stream(client):
+    body = _ndjson_backup(client)
+
+    res = client.post(
+        "/api/import",
+        params={"import_id": "imp-raw"},
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert res.status_code == 200
+    result = res.json()
+    assert result["status"] == "completed"
+    assert (result["folders_added"], result["notes_added"]) == (1, 2)
+    assert client.get("/api/import/imp-raw").json()["lines"] == 4
+    assert client.get("/api/notes/n1").json()["folder_id"] == "f1"
+
+
+def test_import_gzip_file_upload(client):
+    body = gzip.compress(_ndjson_backup(client))
+
+    res = client.post("/api/import", files={"file": ("backup.ndjson.gz", body, "application/gzip")})
+    assert res.status_code == 200
+    assert res.json()["notes_added"] == 2
+
+
+def test_import_content_encoding_gzip(client):
+    body = gzip.compress(_ndjson_backup(client))
+
+    res = client.post(
+        "/api/import",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+    )
+    assert res.status_code == 200
+    assert res.json()["notes_added"] == 2
+
+
+def test_import_reports_bad_line_and_keeps_committed_batches(client, monkeypatch):
+    monkeypatch.setattr(importer, "RESTORE_BATCH_SIZE", 1)
+    lines = _ndjson_backup(client).splitlines()
+    body = b"\n".join(lines[:3] + [b"{not json"] + lines[3:])
+
+    res = client.post("/api/import", params={"import_id": "imp-bad"}, content=body)
+    assert res.status_code == 400
+    assert "line 4" in res.json()["detail"]
+
+    progress = client.get("/api/import/imp-bad").json()
+    assert progress["status"] == "failed"
+    assert progress["batches"] == 2
+    assert len(client.get("/api/notes").json()) == 1
+
+
+def test_import_progress_is_private(client):
+    assert client.get("/api/import/unknown").status_code == 404
+
+
+def _age_everything(db_session):
+    # Pretend the seeded rows were written long before the full backup
+    old = datetime(2020, 1, 1)
+    db_session.execute(update(models.Note).values(updated_at=old, changed_at=old))
+    db_session.execute(update(models.Folder).values(updated_at=old))
+    db_session.commit()
+
+
+def test_incremental_backup_chain_replays_changes_and_deletions(client, db_session):
+    _seed(client)
+    client.post("/api/notes", json={"id": "n3", "title": "Three", "content": "c"})
+    _age_everything(db_session)
+
+    full = client.get("/api/backup")
+    backup_id = full.headers["X-Backup-Id"]
+    assert full.json()["backup_id"] == backup_id
+
+    client.put("/api/notes/n1", json={"content": "changed", "version": 1})
+    client.delete("/api/notes/n3")
+
+    incremental = client.get("/api/backup", params={"since": backup_id}).json()
+    assert [n["id"] for n in incremental["notes"]] == ["n1"]
+    assert incremental["folders"] == []
+    assert incremental["deleted_note_ids"] == ["n3"]
+    assert incremental["since"]
+
+    client.delete("/api/reset")
+    client.post("/api/restore", json=full.json())
+    result = client.post("/api/restore", json=incremental).json()
+    assert (result["notes_updated"], result["notes_deleted"]) == (1, 1)
+
+    notes = {n["id"]: n for n in client.get("/api/notes").json()}
+    assert sorted(notes) == ["n1", "n2"]
+    assert notes["n1"]["content"] == "changed"
+
+
+def test_restored_notes_reach_delta_sync_and_incremental_backups(client, db_session):
+    _seed(client)
+    _age_everything(db_session)
+    # backup_id is a sync cursor too: the database time the backup started
+    backup_id = client.get("/api/backup").headers["X-Backup-Id"]
+
+    # The backup's own updated_at is years older than both cursors
+    client.post("/api/restore", json=_backup([{"id": "n1", "title": "Restored", "folder_id": "f1"}]))
+
+    changes = client.get("/api/sync/changes", params={"since": backup_id}).json()
+    assert [n["title"] for n in changes["notes"]] == ["Restored"]
+    assert changes["notes"][0]["updated_at"].startswith("2024-01-02")
+    incremental = client.get("/api/backup", params={"since": backup_id}).json()
+    assert [n["id"] for n in incremental["notes"]] == ["n1"]
+
+
+def test_incremental_backup_includes_writers_committed_after_the_backup(client, db_session, user):
+    backup_id = client.get("/api/backup").headers["X-Backup-Id"]
+
+    # Stamped before the backup started, committed after it
+    late = datetime.utcnow() - timedelta(seconds=60)
+    db_session.add(models.Note(id="late", title="Late", user_id=user.id, updated_at=late, changed_at=late))
+    db_session.commit()
+
+    incremental = client.get("/api/backup", params={"since": backup_id}).json()
+    assert [n["id"] for n in incremental["notes"]] == ["late"]
+
+
+def test_incremental_ndjson_import_applies_deleted_records(client):
+    _seed(client)
+    backup_id = client.get("/api/backup").headers["X-Backup-Id"]
+    client.delete("/api/folders/f1")
+
+    body = client.get("/api/backup", params={"format": "ndjson", "since": backup_id}).content
+    records = [json.loads(line) for line in body.splitlines()]
+    assert {(r["entity"], r["id"]) for r in records if r["type"] == "deleted"} == {("folder", "f1"), ("note", "n1")}
+
+    client.post("/api/restore", json=_backup(
+        [{"id": "n1", "title": "One", "folder_id": "f1"}], [{"id": "f1", "name": "Folder"}]
+    ))
+    result = client.post("/api/import", content=body).json()
+    assert (result["folders_deleted"], result["notes_deleted"]) == (1, 1)
+    assert [n["id"] for n in client.get("/api/notes").json()] == ["n2"]
+
+
+def test_invalid_since_is_rejected(client):
+    assert client.get("/api/backup", params={"since": "not-a-cursor!"}).status_code == 400
+
+
+def test_zip_archive_has_manifest_and_markdown_files(client):
+    _seed(client)
+
+    res = client.get("/api/backup", params={"format": "zip"})
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(res.content))
+    manifest = json.loads(archive.read("manifest.json"))
+    assert [f["id"] for f in manifest["folders"]] == ["f1"]
+    paths = {n["id"]: n["path"] for n in manifest["notes"]}
+    assert "content" not in manifest["notes"][0]
+    assert archive.read(paths["n1"]) == b"a"
+    assert paths["n2"].endswith(".md")
+
+
+def test_tar_gz_archive_round_trips_note_content(client):
+    _seed(client)
+
+    res = client.get("/api/backup", params={"format": "tar.gz"})
+    assert res.status_code == 200
+    with tarfile.open(fileobj=io.BytesIO(res.content), mode="r:gz") as archive:
+        manifest = json.load(archive.extractfile("manifest.json"))
+        path = next(n["path"] for n in manifest["notes"] if n["id"] == "n2")
+        assert archive.extractfile(path).read() == b"b"
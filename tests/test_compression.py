@@ -0,0 +1,109 @@
+import gzip
+import json
+import tracemalloc
+import zlib
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from api import compression
+
+
+def test_large_json_response_is_gzipped(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Big", "content": "lorem ipsum " * 1000})
+
+    res = client.get("/api/notes/n1", headers={"Accept-Encoding": "gzip"})
+    assert res.status_code == 200
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.headers["etag"].startswith('W/"')
+    assert res.json()["content"].startswith("lorem ipsum")  # httpx decodes transparently
+
+
+def test_small_response_is_not_compressed(client):
+    res = client.get("/api/notes", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in res.headers
+
+
+def test_gzip_request_body_is_accepted(client):
+    body = gzip.compress(json.dumps({"id": "n1", "title": "Zipped", "content": "x" * 5000}).encode())
+    res = client.post(
+        "/api/notes",
+        content=body,
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    assert res.status_code == 200
+    assert res.json()["content"] == "x" * 5000
+
+
+def test_compressed_body_rejected_on_other_routes(client):
+    body = gzip.compress(json.dumps({"id": "f1", "name": "Folder"}).encode())
+    res = client.post(
+        "/api/folders",
+        content=body,
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    assert res.status_code == 415
+
+
+def _echo_app(max_request_size):
+    inner = FastAPI()
+
+    @inner.post("/api/notes")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    return TestClient(compression.CompressionMiddleware(inner, max_request_size=max_request_size))
+
+
+def _bomb(encoding):
+    zeros = b"\0" * (32 * 1024 * 1024)
+    if encoding == "gzip":
+        return gzip.compress(zeros, 9)
+    if encoding == "deflate":
+        return zlib.compress(zeros, 9)
+    if encoding == "br":
+        brotli = pytest.importorskip("brotli")
+        return brotli.compress(zeros)
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdCompressor(level=19).compress(zeros)
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "br", "zstd"])
+def test_decompression_bomb_is_rejected_without_expanding(encoding):
+    client = _echo_app(max_request_size=1024)
+    body = _bomb(encoding)
+    headers = {"Content-Encoding": encoding, "Content-Type": "application/octet-stream"}
+
+    tracemalloc.start()
+    try:
+        res = client.post("/api/notes", content=body, headers=headers)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert res.status_code == 413
+    # 32MB of zeros: only ever a bounded slice is materialized
+    assert peak < 4 * 1024 * 1024
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_compressed_body_round_trips_in_bounded_chunks(encoding):
+    client = _echo_app(max_request_size=8 * 1024 * 1024)
+    data = b"shynote " * 200_000
+    if encoding == "gzip":
+        body = gzip.compress(data)
+    elif encoding == "br":
+        body = pytest.importorskip("brotli").compress(data)
+    else:
+        body = pytest.importorskip("zstandard").ZstdCompressor().compress(data)
+
+    res = client.post("/api/notes", content=body, headers={"Content-Encoding": encoding})
+
+    assert res.status_code == 200
+    assert res.json()["size"] == len(data)
+
+
+def test_zstd_is_not_accepted_on_streaming_routes():
+    assert compression._decompressor("zstd", 0) is None
+    assert compression._decompressor("gzip", 0) is not None
@@ -0,0 +1,165 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import event, exc, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from api import database, models
+
+
+def test_server_profile_uses_instrumented_queue_pool(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path}/pool.db", profile="server")
+    assert isinstance(engine.pool, database.InstrumentedQueuePool)
+    assert engine.pool._pre_ping
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        status = database.pool_status(engine)
+        assert status["checked_out"] == 1
+
+    status = database.pool_status(engine)
+    assert status["profile"] == "server"
+    assert status["checked_out"] == 0
+    assert status["checkouts"] == 1
+    assert status["wait_max_ms"] >= 0
+    engine.dispose()
+
+
+def test_async_server_profile_has_its_own_pool_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_ASYNC_POOL_SIZE", 1)
+    monkeypatch.setattr(database, "DB_ASYNC_MAX_OVERFLOW", 2)
+    engine = database.make_async_engine(f"sqlite:///{tmp_path}/pool.db", profile="server")
+    pool = engine.sync_engine.pool
+    assert isinstance(pool, database.InstrumentedAsyncQueuePool)
+    assert (pool.size(), pool._max_overflow) == (1, 2)
+    assert database.pool_status(engine.sync_engine)["max_overflow"] == 2
+
+
+def test_only_checkout_timeouts_count_as_timeouts():
+    def refuse():
+        raise ConnectionRefusedError("db down")
+
+    pool = database.InstrumentedQueuePool(refuse, pool_size=1, max_overflow=0, timeout=0.01)
+    with pytest.raises(ConnectionRefusedError):
+        pool.connect()
+    assert pool.stats.snapshot()["timeouts"] == 0
+
+    pool = database.InstrumentedQueuePool(lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=0, timeout=0.01)
+    held = pool.connect()
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    assert pool.stats.snapshot()["timeouts"] == 1
+    held.close()
+
+
+def test_serverless_profile_uses_null_pool(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path}/pool.db", profile="serverless")
+    assert isinstance(engine.pool, NullPool)
+    assert database.pool_status(engine)["pool_class"] == "NullPool"
+    engine.dispose()
+
+
+def test_unknown_profile_fails_fast():
+    with pytest.raises(ValueError):
+        database.make_engine("sqlite://", profile="bogus")
+
+
+def test_sqlite_profile_applies_pragmas(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path}/tuned.db")
+    assert engine.pool_profile == "sqlite"
+
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+        assert conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2  # INCREMENTAL
+
+    report = database.run_sqlite_maintenance(engine)
+    assert report["auto_vacuum"] == 2
+    engine.dispose()
+
+
+def test_sqlite_maintenance_thread_stops(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path}/tuned.db")
+    stop = database.start_sqlite_maintenance(engine, interval=60)
+    assert stop is not None
+    stop.set()
+    assert database.start_sqlite_maintenance(engine, interval=0) is None
+    engine.dispose()
+
+
+def test_async_url_maps_drivers():
+    url, connect_args = database._async_url("postgresql://u:p@db:5432/app?sslmode=require")
+    assert url.drivername == "postgresql+asyncpg"
+    assert "sslmode" not in url.query
+    assert connect_args == {"ssl": "require"}
+
+    url, _ = database._async_url("sqlite:///./SHYNOTE.db")
+    assert url.drivername == "sqlite+aiosqlite"
+
+
+def test_hot_endpoints_run_on_async_engine(client, db_session, async_db_engine):
+    statements = []
+    event.listen(async_db_engine.sync_engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    res = client.post("/api/notes", json={"id": "n1", "title": "A", "content": "x"})
+    assert res.status_code == 200
+    assert client.put("/api/notes/n1", json={"content": "y", "version": 1}).json()["version"] == 2
+    assert client.get("/api/notes/n1").json()["content"] == "y"
+    assert [n["id"] for n in client.get("/api/notes").json()] == ["n1"]
+
+    assert any("INSERT INTO notes" in s for s in statements)
+    assert any("UPDATE notes" in s for s in statements)
+
+
+def test_default_sqlite_url_keeps_wal_files_in_data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert database._default_sqlite_url() == "sqlite:///./data/SHYNOTE.db"
+    assert (tmp_path / "data").is_dir()
+
+
+def test_default_sqlite_url_keeps_using_legacy_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "SHYNOTE.db").touch()
+    assert database._default_sqlite_url() == "sqlite:///./SHYNOTE.db"
+
+
+# Tables as the first release created them (no folders.updated_at / notes.changed_at)
+_LEGACY_SCHEMA = [
+    "CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR, provider VARCHAR, provider_id VARCHAR,"
+    " created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), is_dark_mode BOOLEAN, view_mode VARCHAR, api_key VARCHAR)",
+    "CREATE TABLE folders (id VARCHAR PRIMARY KEY, name VARCHAR, user_id VARCHAR REFERENCES users(id))",
+    "CREATE TABLE notes (id VARCHAR PRIMARY KEY, title VARCHAR, content TEXT, folder_id VARCHAR, user_id VARCHAR,"
+    " created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP),"
+    " version INTEGER DEFAULT '1', share_id VARCHAR, is_shared BOOLEAN, is_pinned BOOLEAN)",
+    "INSERT INTO users (id) VALUES ('u1')",
+    "INSERT INTO folders (id, name, user_id) VALUES ('f1', 'Old', 'u1')",
+    "INSERT INTO notes (id, title, user_id, updated_at) VALUES ('n1', 'Old', 'u1', '2025-01-01 10:00:00')",
+]
+
+
+def test_ensure_sqlite_schema_upgrades_an_existing_file(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with engine.begin() as conn:
+        for stmt in _LEGACY_SCHEMA:
+            conn.exec_driver_sql(stmt)
+    models.Base.metadata.create_all(bind=engine)
+
+    assert database.ensure_sqlite_schema(engine) == ["folders.updated_at", "notes.changed_at"]
+    assert database.ensure_sqlite_schema(engine) == []
+
+    with Session(engine) as db:
+        note = db.get(models.Note, "n1")
+        assert note.changed_at == note.updated_at
+        assert db.get(models.Folder, "f1").updated_at is not None
+        db.add(models.Folder(id="f2", name="New", user_id="u1"))
+        db.commit()
+        assert db.get(models.Folder, "f2").updated_at is not None
+    with engine.connect() as conn:
+        indexes = {row[1] for row in conn.exec_driver_sql("PRAGMA index_list(notes)")}
+        stamps = conn.exec_driver_sql("SELECT updated_at, changed_at FROM notes WHERE id = 'n1'").one()
+        assert conn.exec_driver_sql("PRAGMA user_version").scalar() == database.SQLITE_SCHEMA_VERSION
+    assert tuple(stamps) == ("2025-01-01 10:00:00.000000",) * 2
+    assert {"ix_notes_user_updated_id", "ix_notes_user_changed_at"} <= indexes
+    engine.dispose()
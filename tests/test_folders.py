@@ -0,0 +1,121 @@
+from sqlalchemy import event
+
+from api import models
+
+
+def _seed(client):
+    client.post("/api/folders", json={"id": "f1", "name": "Work"})
+    client.post("/api/folders", json={"id": "f2", "name": "Empty"})
+    for i in range(3):
+        client.post("/api/notes", json={"id": f"n{i}", "title": f"N{i}", "content": "body", "folder_id": "f1"})
+    client.put("/api/notes/n1", json={"is_pinned": True})
+    client.post("/api/notes", json={"id": "loose", "title": "Root", "content": "x"})
+
+
+def test_folder_tree_returns_counts_without_notes(client, db_session):
+    _seed(client)
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        res = client.get("/api/folders")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert res.status_code == 200
+    folders = {f["id"]: f for f in res.json()}
+    assert folders["f1"]["note_count"] == 3
+    assert folders["f1"]["pinned_count"] == 1
+    assert folders["f1"]["last_updated_at"] is not None
+    assert folders["f2"]["note_count"] == 0
+    assert folders["f2"]["last_updated_at"] is None
+    assert all("notes" not in f for f in folders.values())
+    # One aggregate query, no per-folder note loads
+    assert len([sql for sql in statements if "FROM folders" in sql]) == 1
+    assert not [sql for sql in statements if "FROM notes" in sql and "GROUP BY" not in sql]
+
+
+def test_folder_tree_nested_notes_are_opt_in(client):
+    _seed(client)
+
+    res = client.get("/api/folders", params={"include_notes": "true"})
+
+    folders = {f["id"]: f for f in res.json()}
+    assert sorted(n["id"] for n in folders["f1"]["notes"]) == ["n0", "n1", "n2"]
+    assert folders["f1"]["notes"][0]["content"] == "body"
+    assert folders["f2"]["notes"] == []
+
+
+def test_create_and_rename_folder_response(client):
+    res = client.post("/api/folders", json={"id": "f1", "name": "Work"})
+    assert res.json()["name"] == "Work"
+    assert "notes" not in res.json()
+
+    res = client.put("/api/folders/f1", json={"name": "Renamed"})
+    assert res.status_code == 200
+    assert res.json()["name"] == "Renamed"
+
+
+def test_delete_folder_deletes_notes_set_based(client, db_session):
+    _seed(client)
+    cursor = client.get("/api/sync/changes").json()["cursor"]
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        res = client.delete("/api/folders/f1")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert res.status_code == 200
+    assert res.json()["deleted_notes"] == 3
+    assert len([sql for sql in statements if sql.startswith("DELETE FROM notes")]) == 1
+    assert [n["id"] for n in client.get("/api/notes").json()] == ["loose"]
+    body = client.get("/api/sync/changes", params={"since": cursor}).json()
+    assert sorted(body["deleted_note_ids"]) == ["n0", "n1", "n2"]
+    assert body["deleted_folder_ids"] == ["f1"]
+
+
+def test_delete_folder_leaves_other_users_notes_alone(client, db_session):
+    _seed(client)
+    # e.g. restored from a backup whose folder ids collide with ours
+    db_session.add(models.User(id="other", email="o@example.com", provider="google"))
+    db_session.add(models.Note(id="theirs", title="T", content="x", user_id="other", folder_id="f1"))
+    db_session.commit()
+
+    assert client.delete("/api/folders/f1").json()["deleted_notes"] == 3
+
+    db_session.expire_all()
+    assert db_session.get(models.Note, "theirs") is not None
+    assert db_session.query(models.Tombstone).filter(models.Tombstone.entity_id == "theirs").count() == 0
+
+
+def test_delete_folder_moves_notes(client):
+    _seed(client)
+
+    res = client.delete("/api/folders/f1", params={"move_to": "f2"})
+
+    assert res.json()["moved_notes"] == 3
+    folders = {f["id"]: f for f in client.get("/api/folders").json()}
+    assert list(folders) == ["f2"]
+    assert folders["f2"]["note_count"] == 3
+    assert client.get("/api/notes/n0").json()["version"] == 2
+
+
+def test_delete_folder_moves_notes_to_root(client):
+    _seed(client)
+
+    res = client.delete("/api/folders/f1", params={"move_to": "root"})
+
+    assert res.json()["moved_notes"] == 3
+    assert all(n["folder_id"] is None for n in client.get("/api/notes").json())
+
+
+def test_delete_folder_rejects_bad_move_target(client):
+    _seed(client)
+
+    assert client.delete("/api/folders/f1", params={"move_to": "f1"}).status_code == 400
+    assert client.delete("/api/folders/f1", params={"move_to": "missing"}).status_code == 404
+    assert client.get("/api/folders").json()[1]["note_count"] == 3
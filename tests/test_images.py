@@ -0,0 +1,91 @@
+import io
+import os
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from api import database, images, models, render, uploads
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+def _jpeg(width=2000, height=1000) -> bytes:
+    buffer = io.BytesIO()
+    PIL.new("RGB", (width, height), (200, 80, 40)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def test_make_variants_downscales_to_webp(tmp_path):
+    source = tmp_path / "photo.jpg"
+    source.write_bytes(_jpeg())
+    variants = dict(images.make_variants(str(source), (320, 1280, 4000)))
+
+    assert sorted(variants) == [320, 1280]  # never upscaled
+    with PIL.open(io.BytesIO(variants[320])) as img:
+        assert img.format == "WEBP"
+        assert img.size == (320, 160)
+
+
+def test_pick_variant():
+    path = "uploads/u/abc/photo.jpg"
+    assert images.pick_variant(path, "320,640", 500) == "uploads/u/abc/w640.webp"
+    assert images.pick_variant(path, "320,640", 900) == path
+    assert images.pick_variant(path, None, 320) == path
+    assert images.pick_variant(path, "320,640", None) == path
+
+
+def test_upload_generates_variants_in_background(client, db_session, local_storage, monkeypatch):
+    # The background task records variants through its own session
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=db_session.get_bind()))
+
+    res = client.post("/api/upload", files={"file": ("photo.jpg", _jpeg(), "image/jpeg")})
+    assert res.status_code == 200
+    body = res.json()
+    assert (body["width"], body["height"]) == (2000, 1000)
+
+    db_session.expire_all()
+    blob = db_session.query(models.Blob).one()
+    assert images.parse_variants(blob.variants) == [320, 640, 1280, 1920]
+    assert local_storage.get(images.variant_path(blob.path, 640))[:4] == b"RIFF"
+
+    sized = client.get(f"/img/test_user/{blob.sha256}?w=500", follow_redirects=False)
+    assert sized.status_code == 302
+    assert sized.headers["location"].endswith("/w640.webp")
+    assert client.get(sized.headers["location"]).headers["content-type"] == "image/webp"
+    original = client.get(f"/img/test_user/{blob.sha256}", follow_redirects=False)
+    assert original.headers["location"] == body["url"]
+    assert client.get(f"/img/test_user/{'0' * 64}").status_code == 404
+
+    note = client.post("/api/notes", json={"title": "T", "content": f"![p]({body['url']})"}).json()
+    html = client.get(f"/api/notes/{note['id']}/html").text
+    assert f"/img/test_user/{blob.sha256}?w=1280 1280w" in html
+    assert f"{body['url']} 2000w" in html
+    assert 'loading="lazy"' in html
+
+
+def test_remote_original_is_downloaded_to_a_temp_file(client, db_session, local_storage, monkeypatch):
+    # Without a local path (S3/Supabase) the worker reads a temporary download
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=db_session.get_bind()))
+    monkeypatch.setattr(local_storage, "local_path", lambda path: None)
+    sources = []
+    source_file = uploads._source_file
+
+    def recording_source_file(backend, path):
+        sources.append(source_file(backend, path))
+        return sources[-1]
+
+    monkeypatch.setattr(uploads, "_source_file", recording_source_file)
+
+    res = client.post("/api/upload", files={"file": ("photo.jpg", _jpeg(), "image/jpeg")})
+    assert res.status_code == 200
+
+    db_session.expire_all()
+    assert images.parse_variants(db_session.query(models.Blob).one().variants) == [320, 640, 1280, 1920]
+    [(tmp, temporary)] = sources
+    assert temporary and not os.path.exists(tmp)
+
+
+def test_responsive_img_skips_unknown_uploads():
+    html = render.render_markdown(f"![p](/files/uploads/u/{'a' * 64}/p.png)")
+    assert "srcset" not in html
+    assert 'loading="lazy"' in html
@@ -0,0 +1,148 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+from api import database, index, models, pagination
+
+
+def test_notes_summary_omits_content(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1", "content": "x" * 1000})
+
+    res = client.get("/api/notes/summary")
+    assert res.status_code == 200
+    [row] = res.json()
+    assert row["id"] == "n1"
+    assert row["title"] == "Note 1"
+    assert row["version"] == 1
+    assert "content" not in row
+
+
+def test_cursor_pagination_walks_all_notes_once(client):
+    for i in range(7):
+        client.post("/api/notes", json={"id": f"n{i}", "title": f"Note {i}"})
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        res = client.get("/api/notes", params=params)
+        assert res.status_code == 200
+        seen.extend(n["id"] for n in res.json())
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert sorted(seen) == [f"n{i}" for i in range(7)]
+    assert len(seen) == 7
+
+
+def test_cursor_pagination_with_shared_timestamps(client, db_session, user):
+    # Restored rows often share one updated_at; id breaks the tie
+    stamp = datetime(2024, 1, 1)
+    db_session.add_all(models.Note(id=f"r{i}", title="r", user_id=user.id, updated_at=stamp) for i in range(5))
+    db_session.commit()
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1"})
+
+    seen, params = [], {"limit": 2}
+    while True:
+        res = client.get("/api/notes", params=params)
+        seen.extend(n["id"] for n in res.json())
+        if "X-Next-Cursor" not in res.headers:
+            break
+        params["cursor"] = res.headers["X-Next-Cursor"]
+
+    assert seen == ["n1", "r4", "r3", "r2", "r1", "r0"]
+
+
+def test_cursor_pagination_over_legacy_second_resolution_rows(client, db_session, user):
+    # Rows stamped by CURRENT_TIMESTAMP before now() carried fractional seconds
+    for i in range(5):
+        db_session.execute(
+            text(
+                "INSERT INTO notes (id, title, user_id, updated_at, is_shared, is_pinned)"
+                " VALUES (:id, 'old', :user, :at, 0, 0)"
+            ),
+            {"id": f"L{i}", "user": user.id, "at": f"2025-01-01 10:00:0{i}"},
+        )
+    db_session.commit()
+    database.ensure_sqlite_schema(db_session.get_bind())
+
+    seen, params = [], {"limit": 2}
+    for _ in range(5):
+        res = client.get("/api/notes", params=params)
+        seen.extend(n["id"] for n in res.json())
+        if "X-Next-Cursor" not in res.headers:
+            break
+        params["cursor"] = res.headers["X-Next-Cursor"]
+
+    assert seen == ["L4", "L3", "L2", "L1", "L0"]
+
+
+def test_cursor_predicate_is_an_index_range(db_session, user):
+    query = pagination.apply_cursor(
+        index._notes_query(user.id, None, None, models.Note.id),
+        pagination.encode_cursor(datetime(2024, 1, 1), "n1"),
+    )
+    compiled = query.compile(db_session.get_bind(), compile_kwargs={"literal_binds": True})
+    plan = " ".join(row[-1] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+    assert "ix_notes_user_updated_id (user_id=? AND (updated_at,id)<(?,?))" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_invalid_pagination_cursor_is_rejected(client):
+    res = client.get("/api/notes", params={"cursor": "garbage", "limit": 2})
+    assert res.status_code == 400
+
+
+def test_read_note_conditional_get(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1", "content": "A"})
+
+    res = client.get("/api/notes/n1")
+    etag = res.headers["ETag"]
+    assert client.get("/api/notes/n1", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put("/api/notes/n1", json={"content": "B"})
+    res = client.get("/api/notes/n1", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.json()["content"] == "B"
+
+
+def test_list_etag_changes_on_delete(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1"})
+    client.post("/api/notes", json={"id": "n2", "title": "Note 2"})
+
+    etag = client.get("/api/notes").headers["ETag"]
+    assert client.get("/api/notes", headers={"If-None-Match": etag}).status_code == 304
+    # Different query params never share an ETag
+    assert client.get("/api/notes", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 200
+
+    client.delete("/api/notes/n2")
+    assert client.get("/api/notes", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_patch_update_applies_edits(client):
+    from api.patch import content_checksum
+
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1", "content": "Hello 😀 world"})
+
+    # Offsets are UTF-16 code units: the emoji counts as two
+    edits = [{"offset": 9, "delete": 5, "insert": "there"}, {"offset": 0, "delete": 5, "insert": "Hi"}]
+    res = client.put(
+        "/api/notes/n1",
+        json={"version": 1, "patches": edits, "checksum": content_checksum("Hi 😀 there")},
+    )
+    assert res.status_code == 200
+    assert res.json()["content"] == "Hi 😀 there"
+    assert res.json()["version"] == 2
+
+
+def test_patch_update_conflicts(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1", "content": "abc"})
+    edit = [{"offset": 0, "delete": 1, "insert": "x"}]
+
+    assert client.put("/api/notes/n1", json={"version": 5, "patches": edit}).status_code == 409
+    assert client.put("/api/notes/n1", json={"version": 1, "patches": edit, "checksum": "0" * 64}).status_code == 409
+    assert client.put("/api/notes/n1", json={"version": 1, "patches": [{"offset": 10, "delete": 1}]}).status_code == 400
+    assert client.get("/api/notes/n1").json()["content"] == "abc"
@@ -0,0 +1,61 @@
+from api import render
+
+
+def test_markdown_is_highlighted_and_sanitized():
+    html = render.render_markdown(
+        "# Title\n\n"
+        "<img src=x onerror=alert(1)><script>alert(2)</script>\n\n"
+        "[bad](javascript:alert(3)) [good](https://example.com)\n\n"
+        "```python\ndef f():\n    return 1\n```\n\n"
+        "| a | b |\n|---|---|\n| 1 | 2 |\n"
+    )
+
+    assert "<h1>Title</h1>" in html
+    assert "onerror" not in html and "<script" not in html
+    assert 'href="javascript' not in html
+    assert 'href="https://example.com"' in html
+    assert '<span class="k">def</span>' in html
+    assert "<table>" in html
+
+
+def test_bare_urls_are_linked():
+    html = render.render_markdown("See https://example.com/a?b=1 or www.example.org.\n\n`https://in.code`")
+    assert '<a href="https://example.com/a?b=1"' in html
+    assert '<a href="http://www.example.org"' in html
+    assert "<code>https://in.code</code>" in html
+
+
+def test_highlight_budget_bounds_work():
+    code = "```python\nx = 1\n```\n\n"
+    html = render.render_markdown(code * 3, highlight_budget=len("x = 1\n") * 2)
+    assert html.count('<span class="n">x</span>') == 2  # third block left plain
+
+
+def test_note_html_endpoint(client):
+    note = client.post("/api/notes", json={"title": "T", "content": "**bold** <b onclick=x>b</b>"}).json()
+
+    res = client.get(f"/api/notes/{note['id']}/html")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/html")
+    assert "<strong>bold</strong>" in res.text
+    assert "onclick" not in res.text
+    assert res.headers["x-note-version"] == str(note["version"])
+
+    again = client.get(f"/api/notes/{note['id']}/html", headers={"If-None-Match": res.headers["etag"]})
+    assert again.status_code == 304
+
+    client.put(f"/api/notes/{note['id']}", json={"content": "changed"})
+    assert "<p>changed</p>" in client.get(f"/api/notes/{note['id']}/html").text
+
+
+def test_note_html_is_cached_per_version(client):
+    note = client.post("/api/notes", json={"title": "T", "content": "cached"}).json()
+    client.get(f"/api/notes/{note['id']}/html")
+    hits = render.html_cache.stats()["hits"]
+
+    client.get(f"/api/notes/{note['id']}/html")
+    assert render.html_cache.stats()["hits"] == hits + 1
+
+
+def test_note_html_requires_ownership(client):
+    assert client.get("/api/notes/missing/html").status_code == 404
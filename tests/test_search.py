@@ -0,0 +1,29 @@
+def test_search_matches_content_with_highlight(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Meeting", "content": "Quarterly roadmap <b>review</b>"})
+    client.post("/api/notes", json={"id": "n2", "title": "Groceries", "content": "milk eggs"})
+
+    res = client.get("/api/search", params={"q": "roadm"})
+    assert res.status_code == 200
+    hits = res.json()
+    assert [h["id"] for h in hits] == ["n1"]
+    assert "<mark>roadmap</mark>" in hits[0]["snippet"]
+    assert "&lt;b&gt;" in hits[0]["snippet"]
+
+
+def test_search_ranks_title_matches_first(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Other", "content": "mentions sync once"})
+    client.post("/api/notes", json={"id": "n2", "title": "Sync design", "content": "details"})
+
+    hits = client.get("/api/search", params={"q": "sync"}).json()
+    assert [h["id"] for h in hits] == ["n2", "n1"]
+
+
+def test_search_index_follows_updates_and_deletes(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Draft", "content": "alpha"})
+    client.put("/api/notes/n1", json={"content": "beta"})
+
+    assert client.get("/api/search", params={"q": "alpha"}).json() == []
+    assert [h["id"] for h in client.get("/api/search", params={"q": "beta"}).json()] == ["n1"]
+
+    client.delete("/api/notes/n1")
+    assert client.get("/api/search", params={"q": "beta"}).json() == []
@@ -0,0 +1,122 @@
+import json
+
+from sqlalchemy import event
+
+from api import render, share
+
+
+def _count_note_queries(*engines):
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        if "FROM notes" in statement:
+            statements.append(statement)
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_execute)
+    return statements
+
+
+def _shared_note(client, content="# Hello\n<script>alert(1)</script>"):
+    note = client.post("/api/notes", json={"title": "<b>Shared</b>", "content": content}).json()
+    share_id = client.put(f"/api/notes/{note['id']}/share").json()["share_id"]
+    return note, share_id
+
+
+def test_share_page_is_rendered_and_sets_cache_headers(client):
+    _, share_id = _shared_note(client)
+    res = client.get(f"/share/{share_id}", headers={"Accept-Encoding": "identity"})
+
+    assert res.status_code == 200
+    assert "&lt;b&gt;Shared&lt;/b&gt;" in res.text
+    assert "<h1>Hello</h1>" in res.text  # rendered on the server
+    assert "<script" not in res.text
+    assert res.headers["etag"].startswith('"')
+    assert res.headers["cache-control"] == share.CACHE_CONTROL
+    assert "stale-while-revalidate" in res.headers["cache-control"]
+
+    again = client.get(f"/share/{share_id}", headers={"If-None-Match": res.headers["etag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_cached_share_page_skips_database(client, db_session, async_db_engine):
+    _, share_id = _shared_note(client)
+    client.get(f"/share/{share_id}")  # render + cache
+    statements = _count_note_queries(db_session.get_bind(), async_db_engine.sync_engine)
+
+    for _ in range(5):
+        assert client.get(f"/share/{share_id}").status_code == 200
+
+    assert statements == []
+    assert share.page_cache.stats()["hits"] >= 5
+
+
+def test_expired_entry_revalidates_without_rerender(client, monkeypatch):
+    _, share_id = _shared_note(client)
+    etag = client.get(f"/share/{share_id}").headers["etag"]
+    misses = share.page_cache.stats()["misses"]
+    monkeypatch.setattr(share.page_cache, "ttl", 0)
+
+    res = client.get(f"/share/{share_id}")
+    assert res.headers["etag"] == etag
+    assert share.page_cache.stats()["misses"] == misses  # version matched, no re-render
+
+
+def test_update_invalidates_share_page(client):
+    note, share_id = _shared_note(client, "first version")
+    first = client.get(f"/share/{share_id}")
+    assert "first version" in first.text
+
+    client.put(f"/api/notes/{note['id']}", json={"content": "second version"})
+    res = client.get(f"/share/{share_id}", headers={"If-None-Match": first.headers["etag"]})
+    assert res.status_code == 200
+    assert "second version" in res.text
+    assert res.headers["etag"] != first.headers["etag"]
+
+
+def test_unshare_invalidates_share_page(client):
+    note, share_id = _shared_note(client)
+    assert client.get(f"/share/{share_id}").status_code == 200
+
+    client.put(f"/api/notes/{note['id']}/share")  # toggle off
+    assert client.get(f"/share/{share_id}").status_code == 404
+
+
+def test_page_cache_evicts_by_size():
+    cache = render.RenderCache("test", max_bytes=10, ttl=60)
+    cache.put("a", 1, None, b"12345")
+    cache.put("b", 1, None, b"12345")
+    cache.put("c", 1, None, b"12345")
+
+    assert cache.get_fresh("a") is None
+    assert cache.get("c", 1, None) is not None
+    assert cache.get("c", 2, None) is None  # another version
+    assert cache.stats()["evictions"] == 1
+
+
+def test_bulk_deletes_invalidate_share_page(client):
+    note, share_id = _shared_note(client)
+    assert client.get(f"/share/{share_id}").status_code == 200
+    client.post("/api/sync/batch", json={"operations": [{"op": "delete", "id": note["id"]}]})
+    assert client.get(f"/share/{share_id}").status_code == 404
+
+    _, share_id = _shared_note(client)
+    assert client.get(f"/share/{share_id}").status_code == 200
+    client.delete("/api/reset")
+    assert client.get(f"/share/{share_id}").status_code == 404
+
+
+def test_restore_and_import_invalidate_share_page(client):
+    note, share_id = _shared_note(client, "original")
+    backup = client.get("/api/backup").json()
+    assert "original" in client.get(f"/share/{share_id}").text
+
+    # Same version and updated_at as the cached render, different content
+    backup["notes"][0]["content"] = "restored"
+    client.post("/api/restore", json=backup)
+    assert "restored" in client.get(f"/share/{share_id}").text
+
+    record = {"type": "note", **backup["notes"][0], "content": "imported"}
+    client.post("/api/import", content=json.dumps(record).encode())
+    assert "imported" in client.get(f"/share/{share_id}").text
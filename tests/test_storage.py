@@ -0,0 +1,102 @@
+import io
+
+import pytest
+
+from api import config, storage
+from api.storage.local import LocalStorage
+
+
+def test_local_backend_roundtrip(tmp_path):
+    backend = LocalStorage(str(tmp_path))
+    backend.put("uploads/u/a.png", io.BytesIO(b"0123456789"), "image/png")
+
+    assert backend.get("uploads/u/a.png") == b"0123456789"
+    assert b"".join(backend.stream("uploads/u/a.png", 2, 5)) == b"2345"
+    assert backend.public_url("uploads/u/a b.png") == "/files/uploads/u/a%20b.png"
+
+    backend.delete(["uploads/u/a.png", "uploads/u/missing.png"])
+    with pytest.raises(storage.StorageNotFound):
+        backend.get("uploads/u/a.png")
+
+
+def test_local_backend_stays_inside_root(tmp_path):
+    backend = LocalStorage(str(tmp_path / "root"))
+    with pytest.raises(storage.StorageNotFound):
+        backend.resolve("../outside.png")
+
+
+def test_incomplete_backend_cannot_be_instantiated():
+    class NoList(storage.StorageBackend):
+        def put(self, path, fileobj, content_type):
+            pass
+
+        def stream(self, path, start=0, end=None):
+            yield b""
+
+        def delete(self, paths):
+            pass
+
+        def public_url(self, path):
+            return path
+
+    with pytest.raises(TypeError, match="list"):
+        NoList()
+
+
+def test_backend_defaults_to_local_without_supabase(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "STORAGE_BACKEND", None)
+    monkeypatch.setattr(config, "SUPABASE_URL", None)
+    monkeypatch.setattr(config, "STORAGE_LOCAL_DIR", str(tmp_path))
+    assert isinstance(storage.create_backend(), LocalStorage)
+
+    with pytest.raises(storage.StorageError):
+        storage.create_backend("ftp")
+
+
+def test_uploaded_file_is_served_with_range_and_caching(client, local_storage):
+    data = bytes(range(256)) * 40
+    url = client.post("/api/upload", files={"file": ("pic.png", data, "image/png")}).json()["url"]
+    assert url.startswith("/files/uploads/test_user/")
+
+    res = client.get(url)
+    assert res.status_code == 200
+    assert res.content == data
+    assert res.headers["content-type"] == "image/png"
+    assert "immutable" in res.headers["cache-control"]
+    assert res.headers["accept-ranges"] == "bytes"
+
+    partial = client.get(url, headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert partial.content == data[100:200]
+
+    assert client.get(url, headers={"If-None-Match": res.headers["etag"]}).status_code == 304
+    assert client.get("/files/uploads/test_user/missing.png").status_code == 404
+
+
+def test_stored_files_never_render_as_active_content(client, local_storage):
+    # The client's filename and the bytes don't decide how the file is served
+    html = b"<script>alert(document.cookie)</script>"
+    body = client.post("/api/upload", files={"file": ("evil.html", html, "image/png")}).json()
+    assert body["path"].endswith(f"/{body['sha256']}.png")
+    res = client.get(body["url"])
+    assert res.headers["content-type"] == "image/png"
+    assert res.headers["x-content-type-options"] == "nosniff"
+    assert res.headers["content-security-policy"] == "sandbox"
+    assert "content-disposition" not in res.headers
+
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+    res = client.get(client.post("/api/upload", files={"file": ("a.svg", svg, "image/svg+xml")}).json()["url"])
+    assert res.headers["content-type"] == "image/svg+xml"
+    assert res.headers["content-disposition"] == "attachment"
+
+    odd = client.post("/api/upload", files={"file": ("x.html", b"<b>", "image/x-whatever")}).json()
+    assert odd["path"].endswith(".bin")
+    res = client.get(odd["url"])
+    assert res.headers["content-type"] == "application/octet-stream"
+    assert res.headers["content-disposition"] == "attachment"
+
+    # Objects without a blob row are opaque downloads too
+    local_storage.put("uploads/test_user/stray/page.html", io.BytesIO(html), "text/html")
+    res = client.get("/files/uploads/test_user/stray/page.html")
+    assert res.headers["content-type"] == "application/octet-stream"
+    assert res.headers["content-disposition"] == "attachment"
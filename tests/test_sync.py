@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from api import models, sync
+
+
+def test_changes_initial_pull_returns_everything(client):
+    client.post("/api/folders", json={"id": "f1", "name": "Folder 1"})
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1", "content": "A", "folder_id": "f1"})
+
+    res = client.get("/api/sync/changes")
+    assert res.status_code == 200
+    body = res.json()
+    assert [n["id"] for n in body["notes"]] == ["n1"]
+    assert [f["id"] for f in body["folders"]] == ["f1"]
+    assert body["deleted_note_ids"] == []
+    assert body["cursor"]
+
+
+def test_changes_since_cursor_reports_tombstones(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1"})
+    client.post("/api/notes", json={"id": "n2", "title": "Note 2"})
+    cursor = client.get("/api/sync/changes").json()["cursor"]
+
+    client.delete("/api/notes/n1")
+
+    body = client.get("/api/sync/changes", params={"since": cursor}).json()
+    assert "n1" in body["deleted_note_ids"]
+    assert "n1" not in [n["id"] for n in body["notes"]]
+
+
+def test_recreated_note_clears_tombstone(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1"})
+    cursor = client.get("/api/sync/changes").json()["cursor"]
+    client.delete("/api/notes/n1")
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1 again"})
+
+    body = client.get("/api/sync/changes", params={"since": cursor}).json()
+    assert body["deleted_note_ids"] == []
+    assert [n["title"] for n in body["notes"]] == ["Note 1 again"]
+
+
+def test_folder_delete_tombstones_cascaded_notes(client):
+    client.post("/api/folders", json={"id": "f1", "name": "Folder 1"})
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1", "folder_id": "f1"})
+    cursor = client.get("/api/sync/changes").json()["cursor"]
+
+    client.delete("/api/folders/f1")
+
+    body = client.get("/api/sync/changes", params={"since": cursor}).json()
+    assert body["deleted_folder_ids"] == ["f1"]
+    assert body["deleted_note_ids"] == ["n1"]
+
+
+def test_cursor_stays_behind_in_flight_writers(client, db_session, user):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1"})
+    cursor = client.get("/api/sync/changes").json()["cursor"]
+
+    # A transaction that started before the pull (so it stamped an earlier
+    # now()) and committed after it
+    late = datetime.utcnow() - timedelta(seconds=60)
+    db_session.add(models.Note(id="n2", title="Late", user_id=user.id, updated_at=late, changed_at=late))
+    db_session.commit()
+
+    body = client.get("/api/sync/changes", params={"since": cursor}).json()
+    assert "n2" in [n["id"] for n in body["notes"]]
+    assert sync.decode_cursor(body["cursor"]) <= datetime.utcnow() - timedelta(seconds=sync.SYNC_CURSOR_MARGIN_SECONDS - 5)
+
+
+def test_invalid_cursor_is_rejected(client):
+    res = client.get("/api/sync/changes", params={"since": "not-a-cursor!"})
+    assert res.status_code == 400
+
+
+
+def test_batch_applies_operations_in_order(client):
+    ops = [
+        {"op": "create", "entity": "folder", "id": "f1", "name": "Folder 1"},
+        {"op": "create", "id": "n1", "title": "Note 1", "content": "A"},
+        {"op": "update", "id": "n1", "content": "B", "version": 1},
+        {"op": "move", "id": "n1", "folder_id": "f1", "version": 2},
+    ]
+    res = client.post("/api/sync/batch", json={"operations": ops})
+    assert res.status_code == 200
+    results = res.json()["results"]
+    assert [r["status"] for r in results] == ["ok", "ok", "ok", "ok"]
+    assert results[-1]["version"] == 3
+
+    note = client.get("/api/notes/n1").json()
+    assert note["content"] == "B"
+    assert note["folder_id"] == "f1"
+    assert note["version"] == 3
+
+
+def test_batch_reports_conflict_and_not_found(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1"})
+    client.put("/api/notes/n1", json={"content": "server edit"})  # version -> 2
+
+    ops = [
+        {"op": "update", "id": "n1", "content": "stale", "version": 1},
+        {"op": "delete", "id": "missing"},
+        {"op": "update", "entity": "folder", "id": "missing", "name": "x"},
+    ]
+    results = client.post("/api/sync/batch", json={"operations": ops}).json()["results"]
+
+    assert results[0]["status"] == "conflict"
+    assert results[0]["status_code"] == 409
+    assert results[0]["version"] == 2
+    assert results[1]["status"] == "not_found"
+    assert results[2]["status"] == "not_found"
+    assert client.get("/api/notes/n1").json()["content"] == "server edit"
+
+
+def test_batch_delete_records_tombstone(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1"})
+    cursor = client.get("/api/sync/changes").json()["cursor"]
+
+    client.post("/api/sync/batch", json={"operations": [{"op": "delete", "id": "n1"}]})
+
+    body = client.get("/api/sync/changes", params={"since": cursor}).json()
+    assert body["deleted_note_ids"] == ["n1"]
+
+
+def test_batch_delete_then_create_leaves_no_tombstone(client):
+    client.post("/api/notes", json={"id": "n1", "title": "Note 1"})
+    cursor = client.get("/api/sync/changes").json()["cursor"]
+
+    ops = [
+        {"op": "delete", "id": "n1"},
+        {"op": "create", "id": "n1", "title": "Note 1 again"},
+    ]
+    results = client.post("/api/sync/batch", json={"operations": ops}).json()["results"]
+    assert [r["status"] for r in results] == ["ok", "ok"]
+
+    body = client.get("/api/sync/changes", params={"since": cursor}).json()
+    assert body["deleted_note_ids"] == []
+    assert [n["title"] for n in body["notes"]] == ["Note 1 again"]
+
+
+def test_change_filters_are_index_ranges(db_session, user):
+    since = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    queries = [
+        db_session.query(models.Note.id).filter(
+            models.Note.user_id == user.id, sync.at_or_after(db_session, models.Note.changed_at, since)
+        ),
+        db_session.query(models.Tombstone.id).filter(
+            models.Tombstone.user_id == user.id, sync.at_or_after(db_session, models.Tombstone.deleted_at, since)
+        ),
+    ]
+    plans = []
+    for query in queries:
+        compiled = query.statement.compile(db_session.get_bind(), compile_kwargs={"literal_binds": True})
+        plans.append(" ".join(row[-1] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))))
+
+    assert "ix_notes_user_changed_at (user_id=? AND changed_at>?)" in plans[0]
+    assert "ix_tombstones_user_deleted_at (user_id=? AND deleted_at>?)" in plans[1]
@@ -0,0 +1,64 @@
+import threading
+
+from api import models, uploads
+
+
+def _record_puts(monkeypatch, backend):
+    calls = []
+    original = backend.put
+
+    def put(path, fileobj, content_type):
+        calls.append({"path": path, "thread": threading.current_thread()})
+        return original(path, fileobj, content_type)
+
+    monkeypatch.setattr(backend, "put", put)
+    return calls
+
+
+def test_upload_streams_to_storage_off_the_event_loop(client, local_storage, monkeypatch):
+    calls = _record_puts(monkeypatch, local_storage)
+    data = b"\x89PNG" + b"x" * 5000
+
+    res = client.post("/api/upload", files={"file": ("shot.png", data, "image/png")})
+
+    assert res.status_code == 200
+    body = res.json()
+    assert body["url"].endswith(f"/{body['sha256']}/{body['sha256']}.png")
+    assert body["deduplicated"] is False
+    assert local_storage.get(calls[0]["path"]) == data
+    assert calls[0]["thread"] is not threading.main_thread()
+
+
+def test_upload_rejects_oversized_body(client, local_storage, monkeypatch):
+    calls = _record_puts(monkeypatch, local_storage)
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 1024)
+
+    res = client.post("/api/upload", files={"file": ("big.png", b"x" * (200 * 1024), "image/png")})
+
+    assert res.status_code == 413
+    assert calls == []
+
+
+def test_upload_rejects_non_images(client, local_storage, monkeypatch):
+    calls = _record_puts(monkeypatch, local_storage)
+
+    res = client.post("/api/upload", files={"file": ("a.txt", b"hello", "text/plain")})
+    assert res.status_code == 400
+    assert client.post("/api/upload", data={"other": "x"}).status_code == 400
+    assert calls == []
+
+
+def test_duplicate_upload_reuses_stored_blob(client, db_session, local_storage, monkeypatch):
+    calls = _record_puts(monkeypatch, local_storage)
+    data = b"\x89PNG" + b"same screenshot" * 100
+
+    first = client.post("/api/upload", files={"file": ("a.png", data, "image/png")}).json()
+    second = client.post("/api/upload", files={"file": ("b.png", data, "image/png")}).json()
+    other = client.post("/api/upload", files={"file": ("a.png", data + b"!", "image/png")}).json()
+
+    assert second["url"] == first["url"]
+    assert second["deduplicated"] is True
+    assert second["sha256"] == first["sha256"]
+    assert other["url"] != first["url"]
+    assert len(calls) == 2  # the duplicate never reached storage
+    assert db_session.query(models.Blob).count() == 2